@@ -2,7 +2,7 @@
 
 """
 Author: Lori Garzio on 2/19/2025
-Last modified: 8/19/2025
+Last modified: 10/17/2026
 Process final acoustics glider datasets to archive:
 AZFP to NCEI (https://www.ncei.noaa.gov/products/water-column-sonar-data)
 DMON to NCEI (https://www.ncei.noaa.gov/products/passive-acoustic-data)
@@ -19,6 +19,9 @@ import xarray as xr
 import datetime as dt
 import yaml
 import dataset_archiving.common as cf
+import dataset_archiving.export as ex
+import dataset_archiving.instrumentation as ins
+import dataset_archiving.qc_rules as qcr
 
 
 def delete_attrs(da):
@@ -29,76 +32,48 @@ def delete_attrs(da):
             continue
 
 
-def main(fname, acoustics, rfp):
+def main(fname, acoustics, rfp, chunks=None, encoding_profile=None):
     savedir = os.path.join(os.path.dirname(fname), f'ncei_{acoustics}')
     os.makedirs(savedir, exist_ok=True)
 
-    ds = xr.open_dataset(fname)
-    try:
-        deploy = ds.attrs['deployment']
-    except KeyError:
-        deploy = fname.split('/')[-1].split('-profile')[0]  # if no deployment in attrs, use the filename
+    # record the time and memory used by each processing stage
+    run = ins.RunReport('acoustics_glider_to_archive')
 
-    # grab profile_id encoding
-    pid_encoding = ds.profile_id.encoding
+    # optionally open the file lazily in chunks along the obs dimension (using dask) so large datasets are
+    # processed and written out chunk by chunk instead of being loaded into memory
+    with run.span('open'):
+        if chunks:
+            ds = xr.open_dataset(fname, chunks=dict(obs=chunks))
+        else:
+            ds = xr.open_dataset(fname)
+        try:
+            deploy = ds.attrs['deployment']
+        except KeyError:
+            deploy = fname.split('/')[-1].split('-profile')[0]  # if no deployment in attrs, use the filename
 
-    ds = ds.drop_vars(names=['profile_id', 'rowSize', 'trajectory', 'trajectoryIndex'])
-    ds = ds.swap_dims({'obs': 'time'})
-    ds = ds.sortby(ds.time)
+        # grab profile_id encoding
+        pid_encoding = ds.profile_id.encoding
 
-    comment = 'Data flagged by QC tests (suspect and fail) were removed.'
+        ds = ds.drop_vars(names=['profile_id', 'rowSize', 'trajectory', 'trajectoryIndex'])
+        ds = ds.swap_dims({'obs': 'time'})
 
-    # apply QARTOD QC to all variables except pressure
-    kwargs = dict()
-    kwargs['add_comment'] = comment
-    #kwargs['qc_variety'] = 'failed_only'  # suspect_failed (default) or failed_only
-    cf.apply_qartod_qc(ds, **kwargs)
+    with run.span('sort'):
+        ds = cf.sort_dataset(ds, 'time')  # only sorts if the data aren't already in time order
 
-    # apply CTD hysteresis test QC
-    cf.apply_ctd_hysteresis_qc(ds, **kwargs)
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir = os.path.dirname(root_dir)
+    configdir = os.path.join(parent_dir, 'configs')
 
-    # apply pH QC
-    try:
-        ds['pH'].attrs['comment'] = ' '.join((ds['pH'].comment, comment))
-        qcvars = [x for x in list(ds.data_vars) if 'pH_qartod_' in x]
-        for qv in qcvars:
-            qc_idx = np.where(np.logical_or(ds[qv].values == 3, ds[qv].values == 4))[0]
-            if len(qc_idx) > 0:
-                ds['pH'][qc_idx] = np.nan
-
-        # there's a lot of noise in pH at the surface, so set pH/TA/omega values to nan when depth_interpolated < 1 m
-        add_comment = 'Values at depths < 1m were removed due to noise typically observed at the surface'
-        oavars = ['pH', 'aragonite_saturation_state', 'total_alkalinity']
-        idx = np.where(ds.depth_interpolated < 1)[0]
-        for oav in oavars:
-            ds[oav].values[idx] = np.nan
-            ds[oav].attrs['comment'] = ' '.join((ds[oav].comment, add_comment))
-
-        # remove first n pH/TA/omega profiles (bad/suspect data when the sensor was equilibrating)
-        if np.logical_and(isinstance(rfp, int), rfp > 0):
-            add_comment = f'First {rfp} profiles removed due to bad/suspect data when the sensor was equilibrating.'
-            profiletimes = np.unique(ds.profile_time.values)
-            ptimes = profiletimes[0:rfp]
-            pidx = np.where(np.isin(ds.profile_time.values, ptimes))[0]
-            for oav in oavars:
-                ds[oav].values[pidx] = np.nan
-                ds[oav].attrs['comment'] = ' '.join((ds[oav].comment, add_comment))
-    except KeyError:
-        pass
-
-    # remove clearly bad data (usually from older datasets that don't have QC)
-    idx = np.where(ds.conductivity <= 0)[0]
-    ctdvars = ['conductivity', 'temperature', 'salinity', 'density']
-    for cv in ctdvars:
-        ds[cv].values[idx] = np.nan
-    
-    try:
-        idx = np.where(ds.oxygen_concentration <= 0)[0]
-        oxyvars = ['oxygen_concentration', 'oxygen_saturation']
-        for ov in oxyvars:
-            ds[ov].values[idx] = np.nan
-    except AttributeError:
-        pass
+    # apply QC using the acoustics glider rules in the qc_rules.yml config file:
+    # QARTOD QC to all variables except pressure, CTD hysteresis test QC, pH QC (if there is a pH sensor),
+    # remove pH/TA/omega when depth_interpolated < 1 m (there's a lot of noise in pH at the surface),
+    # optionally remove the first n pH/TA/omega profiles (bad/suspect data when the sensor was equilibrating),
+    # and remove clearly bad data (usually from older datasets that don't have QC)
+    # to only remove failed QC values, change qc_variety to failed_only in qc_rules.yml
+    with run.span('qc'):
+        params = dict(remove_first_profiles=rfp)
+        qc_report, qc_counts = qcr.apply_qc_rules(ds, configdir, acoustics, params=params)
+        print(qc_report.to_string(index=False))
     
     # fix pressure units
     if ds.pressure.units == 'bar':
@@ -112,7 +87,8 @@ def main(fname, acoustics, rfp):
         ds.depth_interpolated.attrs['units'] = 'm'
     except AttributeError:
         # interpolate depth
-        cf.interpolate_depth(ds)
+        with run.span('interpolate_depth'):
+            cf.interpolate_depth(ds)
         ds.depth_interpolated.attrs['standard_name'] = 'depth'
         ds.depth_interpolated.attrs['units'] = 'm'
 
@@ -124,7 +100,8 @@ def main(fname, acoustics, rfp):
         drop_vars.append(append_vars)
 
     drop_vars = [x for xs in drop_vars for x in xs]
-    ds = ds.drop_vars(drop_vars)
+    with run.span('drop_vars'):
+        ds = ds.drop_vars(drop_vars)
 
     # add profile_id
     attributes = dict(
@@ -135,10 +112,11 @@ def main(fname, acoustics, rfp):
         long_name='Profile ID'
     )
     name = 'profile_id'
-    pid = ds.profile_time.values.astype('datetime64[s]').astype('int')
-    da = xr.DataArray(pid, coords=ds.profile_time.coords, dims=ds.profile_time.dims, name=name, attrs=attributes)
-    ds[name] = da
-    ds[name].encoding = pid_encoding
+    with run.span('profile_id'):
+        pid = ds.profile_time.data.astype('datetime64[s]').astype('int')
+        da = xr.DataArray(pid, coords=ds.profile_time.coords, dims=ds.profile_time.dims, name=name, attrs=attributes)
+        ds[name] = da
+        ds[name].encoding = pid_encoding
 
     # make sure valid_min and valid_max are the same data type as the variables
     for v in ds.data_vars:
@@ -156,10 +134,6 @@ def main(fname, acoustics, rfp):
         delete_attrs(ds[v])
 
     # update global attrs using the sensor_glider_attrs.yml config file
-    root_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(root_dir)
-    configdir = os.path.join(parent_dir, 'configs')
-
     with open(os.path.join(configdir, f'{acoustics}_glider_attrs.yml')) as f:
         add_attrs = yaml.safe_load(f)
 
@@ -170,82 +144,50 @@ def main(fname, acoustics, rfp):
 
     ds.attrs['references'] = ', '.join((ds.attrs['references'], add_attrs['references']))
 
-    # save final .nc file
-    savefile = os.path.join(savedir, f'{deploy}-delayed.nc')
-    ds.to_netcdf(savefile, format="netCDF4", engine="netcdf4", unlimited_dims=["time"])
-
-    # file to test formatting in IOOS compliance checker https://compliance.ioos.us/index.html
-    sfile = os.path.join(savedir, f'{deploy}-delayed-test.nc')
-    newds = ds.isel(time=slice(0, 100))
-    newds.to_netcdf(sfile, format="netCDF4", engine="netcdf4", unlimited_dims=["time"])
+    # the sortedness marker is only used in processing, don't include it in the archived file
+    ds.attrs.pop(cf.SORTED_BY_ATTR, None)
+
+    # optional compression and chunking of the netCDF files, using the encoding_profiles.yml config file
+    # without a profile, the encoding from the original file is kept
+    if encoding_profile:
+        ex.apply_encoding_profile(ds, ex.load_encoding_profile(configdir, encoding_profile))
+
+    def sidecars(values):
+        # deployment information for NCEI metadata submission
+        rownames = ['start', 'end', 'program', 'project', 'sea_name', 'summary']
+        deploy_values = [pd.to_datetime(np.nanmin(ds.time.values)).strftime('%Y-%m-%d'),
+                         pd.to_datetime(np.nanmax(ds.time.values)).strftime('%Y-%m-%d'),
+                         ds.attrs['program'],
+                         ds.attrs['project'],
+                         ds.attrs['sea_name'],
+                         ds.attrs['summary']]
+        dfdeploy = pd.DataFrame(dict(name=rownames, value=deploy_values))
+
+        # variable names in the file to double check, and instrument metadata
+        tables = dict()
+        tables[os.path.join(savedir, f'variables-{deploy}.csv')] = (ex.variables_table(ds), dict())
+        tables[os.path.join(savedir, f'deployment_metadata-{deploy}.csv')] = (dfdeploy, dict(index=False))
+        tables[os.path.join(savedir, f'instrument_metadata-{deploy}.csv')] = (ex.instrument_table(ds), dict(index=False))
+        return tables
+
+    # save the final .nc file, a file with the first 100 data points to test formatting in the IOOS compliance
+    # checker (https://compliance.ioos.us/index.html) and the variable, deployment and instrument information
+    # for the NCEI metadata submission to csv, all from one pass through the data
+    with run.span('export'):
+        savefile = os.path.join(savedir, f'{deploy}-delayed.nc')
+        sfile = os.path.join(savedir, f'{deploy}-delayed-test.nc')
+        ex.write_archive(ds, savefile, sfile, sidecars=sidecars)
+
+    run.label = deploy
+    run.finish(os.path.join(os.path.dirname(fname), 'run_reports'))
+
+    return run
 
-    # print variable names in file to double check
-    vardict = dict()
-    for v in list(ds.coords):
-        try:
-            units = ds[v].units
-        except AttributeError:
-            units = ''
-        vardict[v] = dict(units=units,
-                          long_name=ds[v].long_name)
-    for v in list(ds.data_vars):
-        try:
-            units = ds[v].units
-        except AttributeError:
-            units = ''
-        vardict[v] = dict(units=units,
-                          long_name=ds[v].long_name)
-
-    dfmeta = pd.DataFrame(vardict)
-    dfmeta = dfmeta.transpose()
-    dfmeta.to_csv(os.path.join(savedir, f'variables-{deploy}.csv'))
-    
-    # print deployment information for NCEI metadata submission to csv
-    rownames = ['start', 'end', 'program', 'project', 'sea_name', 'summary']
-    
-    values = [pd.to_datetime(np.nanmin(ds.time.values)).strftime('%Y-%m-%d'),
-              pd.to_datetime(np.nanmax(ds.time.values)).strftime('%Y-%m-%d'),
-              ds.attrs['program'],
-              ds.attrs['project'],
-              ds.attrs['sea_name'],
-              ds.attrs['summary']]
-    
-    vardict = dict(name = rownames,
-                   value = values)
-    dfmeta = pd.DataFrame(vardict)
-    dfmeta.to_csv(os.path.join(savedir, f'deployment_metadata-{deploy}.csv'), index=False)
-
-    # print instrument metadata to csv
-    instrument_vars = [x for x in list(ds.data_vars) if 'instrument_' in x]
-
-    vardict = dict(name = instrument_vars,
-                   maker = [],
-                   model = [],
-                   sn = [],
-                   cal_date = [],
-                   calibration_coeffs = []
-                   )
-
-    for iv in instrument_vars:
-        try:
-            vardict['maker'].append(ds[iv].attrs["maker"])
-            vardict['model'].append(ds[iv].attrs["model"])
-        except KeyError:
-            vardict['maker'].append(ds[iv].attrs["make_model"])
-            vardict['model'].append(ds[iv].attrs["make_model"])
-        vardict['sn'].append(ds[iv].attrs["serial_number"])
-        vardict['cal_date'].append(ds[iv].attrs["calibration_date"])
-        try:
-            vardict['calibration_coeffs'].append(ds[iv].attrs["calibration_coefficients"])
-        except KeyError:
-            vardict['calibration_coeffs'].append('')    
-    
-    dfmeta = pd.DataFrame(vardict)
-    dfmeta.to_csv(os.path.join(savedir, f'instrument_metadata-{deploy}.csv'), index=False)
-    
 
 if __name__ == '__main__':
     ncfile = '/Users/garzio/Documents/gliderdata/ru40-20241021T1654/ru40-20241021T1654-profile-sci-delayed.nc'
     acoustics = 'dmon'  # 'azfp' or 'dmon'
     remove_first_profiles = False  # remove the first 10-12 pH profiles? # of profiles to remove or False
-    main(ncfile, acoustics, remove_first_profiles)
+    chunk_size = None  # number of data points per chunk to process large files lazily, or None to load the file
+    encoding = None  # netCDF compression/chunking profile, e.g. 'small-archive', or None for the default encoding
+    main(ncfile, acoustics, remove_first_profiles, chunk_size, encoding)
@@ -2,7 +2,7 @@
 
 """
 Author: Lori Garzio on 8/10/2021
-Last modified: 5/13/2025
+Last modified: 10/17/2026
 Quickly plot xsections of glider data variables that will be sent to an archive
 Also plot the first 30 pH profiles to make sure the bad data (when the sensor was equilibrating) are removed.
 """
@@ -13,18 +13,28 @@ import numpy as np
 import pandas as pd
 import yaml
 import cmocean as cmo
-import cool_maps.plot as cplt
 import cartopy.crs as ccrs
+import matplotlib
+matplotlib.use('Agg')  # no display needed, the figures are only saved to files
 import matplotlib.pyplot as plt
 import dataset_archiving.common as cf
+import dataset_archiving.export as ex
+import dataset_archiving.instrumentation as ins
 import dataset_archiving.plotting as pf
+import dataset_archiving.profiles as prof
 plt.rcParams.update({'font.size': 13})
 
 
-def main(fname):
+def main(fname, workers=1, mode='scatter', force=False):
     savedir = os.path.join(os.path.dirname(fname), 'plots')
     os.makedirs(savedir, exist_ok=True)
 
+    # only re-plot the figures whose data or plot options changed since the last run
+    manifest = pf.FigureManifest(savedir, force=force)
+
+    # record the time and memory used to make each plot
+    run = ins.RunReport('plot_acoustics_glider')
+
     ds = xr.open_dataset(fname)
     ds = ds.swap_dims({'time': 'profile_time'})  # for plotting pH profiles
     try:
@@ -36,29 +46,33 @@ def main(fname):
     t0str = pd.to_datetime(np.nanmin(ds.time)).strftime('%Y-%m-%dT%H:%M')
     t1str = pd.to_datetime(np.nanmax(ds.time)).strftime('%Y-%m-%dT%H:%M')
 
-    # make a map of the glider track
+    # make a map of the glider track, on a cached background map
     # define the map extent
-    df = pd.DataFrame({'lon': ds.profile_lon.values, 'lat': ds.profile_lat.values})
-    df = df.drop_duplicates()
-    extent = [np.nanmin(df.lon) - 1.5, np.nanmax(df.lon) + 1.5,
-              np.nanmin(df.lat) - 1, np.nanmax(df.lat) + 1]
+    lonlat, bounds = ex.unique_lonlat(ds.profile_lon.values, ds.profile_lat.values, decimals=None)
+    extent = [bounds['west'] - 1.5, bounds['east'] + 1.5,
+              bounds['south'] - 1, bounds['north'] + 1]
     
     kwargs = dict()
     kwargs['coast'] = 'high'
     kwargs['oceancolor'] = 'none'
     kwargs['decimal_degrees'] = True
     kwargs['bathymetry'] = True
+    # the map background is cached in ~/.cache/dataset_archiving/basemaps (see plotting.cached_basemap),
+    # use a local bathymetry file to build it without network access
     #kwargs['bathymetry_file'] = '/Users/garzio/Documents/rucool/bathymetry/GEBCO_2014_2D_-100.0_0.0_-10.0_50.0.nc'
     kwargs['bathymetry_method'] = 'topo_log'
-    fig, ax = cplt.create(extent, **kwargs)
-
-    ax.scatter(df.lon, df.lat, color='magenta', marker='.', s=20, transform=ccrs.PlateCarree(), zorder=10)
-    
-    plt.title(f'{deploy}')
     sfilename = f'{deploy}_glider_track.png'
     sfile = os.path.join(savedir, sfilename)
-    plt.savefig(sfile, dpi=200)
-    plt.close()
+    if manifest.changed(sfile, lonlat, extent=extent, title=deploy, dpi=200, **kwargs):
+        with run.span('glider_track'):
+            fig, ax = pf.cached_basemap(extent, **kwargs)
+
+            ax.scatter(lonlat[:, 0], lonlat[:, 1], color='magenta', marker='.', s=20, transform=ccrs.PlateCarree(), zorder=10)
+
+            plt.title(f'{deploy}')
+            plt.savefig(sfile, dpi=200)
+            plt.close()
+        manifest.done(sfile)
 
     root_dir = os.path.dirname(os.path.abspath(__file__))
     parent_dir = os.path.dirname(root_dir)
@@ -67,6 +81,8 @@ def main(fname):
     with open(os.path.join(configdir, 'plot_vars.yml')) as f:
         plt_vars = yaml.safe_load(f)
 
+    timedepth = pf.figure_hash(ds.time.values, ds.depth_interpolated.values)  # shared by all of the xsections
+    xplots = dict()
     for pv, info in plt_vars.items():
         try:
             variable = ds[pv]
@@ -75,8 +91,6 @@ def main(fname):
 
         # plot xsection
         if len(variable) > 1:
-            fig, ax = plt.subplots(figsize=(12, 6))
-            plt.subplots_adjust(left=0.1)
             figttl_xsection = f'{deploy} {variable.attrs['long_name']}\n{t0str} to {t1str}'
             clab = f'{variable.attrs['long_name']} ({variable.attrs['units']})'
             xargs = dict()
@@ -85,19 +99,25 @@ def main(fname):
             xargs['date_fmt'] = '%m-%d'
             xargs['grid'] = True
             xargs['cmap'] = info['cmap']
-            pf.xsection(fig, ax, ds.time.values, ds.depth_interpolated.values, variable.values, **xargs)
+            xargs['mode'] = mode
 
             sfilename = f'{deploy}_xsection_{pv}.png'
             sfile = os.path.join(savedir, sfilename)
-            plt.savefig(sfile, dpi=300)
-            plt.close()
+            if manifest.changed(sfile, variable.values, timedepth=timedepth, dpi=300, **xargs):
+                if workers > 1:
+                    xplots[f'xsection {pv}'] = (sfile, variable.values, xargs)  # plotted in parallel below
+                else:
+                    with run.span(f'xsection {pv}'):
+                        pf.save_xsection(sfile, ds.time.values, ds.depth_interpolated.values, variable.values,
+                                         **xargs)
+                    manifest.done(sfile)
 
             # plot first 30 pH profiles
             if pv == 'pH':  # pH pH_corrected
                 n = 30
-                profiletimes = np.unique(ds.profile_time.values)
-                ptimes = profiletimes[0:n]
-                colors = plt.cm.rainbow(np.linspace(0, 1, int(len(ptimes)/2)))
+                pidx = prof.load_profile_index(ds, source_file=fname)
+                ptimes = pidx.times[0:n]
+                colors = plt.cm.rainbow(np.linspace(0, 1, int(np.ceil(len(ptimes) / 2))))
                 colors = np.repeat(colors, 2, axis=0)  # repeat colors for each profile
                 labels = ['0-1', '2-3', '4-5', '6-7', '8-9',
                         '10-11', '12-13', '14-15', '16-17', '18-19',
@@ -106,29 +126,45 @@ def main(fname):
                 t0str = pd.to_datetime(np.nanmin(ptimes)).strftime('%Y-%m-%dT%H:%M')
                 t1str = pd.to_datetime(np.nanmax(ptimes)).strftime('%Y-%m-%dT%H:%M')
 
-                fig, ax = plt.subplots(figsize=(8, 10))
-                for i, pt in enumerate(ptimes):
-                    ds_sel = ds.sel(profile_time=pt)
-                    df = pd.DataFrame({'depth': ds_sel['depth_interpolated'].values,
-                                    'pv': ds_sel[pv].values})
-                    df = df.dropna()
-                    ax.plot(df['pv'], df['depth'], lw=.75, color=colors[i], label=labels[i])
-                    ax.scatter(df['pv'], df['depth'], color=colors[i], s=5, edgecolor='None')
-                ax.invert_yaxis()
-                ax.set_ylabel('depth_interpolated')
-                ax.set_xlabel(pv)
-                ax.set_title(f'{deploy} first {n} {pv} profiles\n{t0str} to {t1str}')
-
-                handles, labels = plt.gca().get_legend_handles_labels()  # only show one set of legend labels
-                by_label = dict(zip(labels, handles))
-                ax.legend(by_label.values(), by_label.keys(), framealpha=0.5, ncol=2, loc='best')
-
+                ds_first = ds.isel(profile_time=pidx.first(n))  # select the profiles once
+                bounds = pidx.offsets(0, n)
+                title = f'{deploy} first {n} {pv} profiles\n{t0str} to {t1str}'
                 sfilename = f'{deploy}_{pv}_first_{n}_profiles.png'
                 sfile = os.path.join(savedir, sfilename)
-                plt.savefig(sfile, dpi=300)
-                plt.close()
+                if manifest.changed(sfile, ds_first[pv].values, ds_first['depth_interpolated'].values, bounds,
+                                    title=title, dpi=300):
+                    with run.span(f'first_profiles {pv}'):
+                        fig, ax = plt.subplots(figsize=(8, 10))
+                        by_label = pf.profile_lines(ax, ds_first[pv].values, ds_first['depth_interpolated'].values,
+                                                    bounds, colors, labels)
+                        ax.invert_yaxis()
+                        ax.set_ylabel('depth_interpolated')
+                        ax.set_xlabel(pv)
+                        ax.set_title(title)
+
+                        ax.legend(by_label.values(), by_label.keys(), framealpha=0.5, ncol=2, loc='best')
+
+                        plt.savefig(sfile, dpi=300)
+                        plt.close()
+                    manifest.done(sfile)
+
+    # plot the xsections in parallel on a process pool
+    if len(xplots) > 0:
+        with run.span('xsections'):
+            records = pf.render_xsections(ds.time.values, ds.depth_interpolated.values, xplots, max_workers=workers)
+            for record in records:
+                run.add(record)
+        for sfile, z, xargs in xplots.values():
+            manifest.done(sfile)
+
+    manifest.save()
+    run.label = deploy
+    run.finish(savedir)
 
 
 if __name__ == '__main__':
     ncfile = '/Users/garzio/Documents/gliderdata/ru39-20240429T1522/ncei_azfp/ru39-20240429T1522-delayed.nc'
-    main(ncfile)
+    n_workers = 1  # number of processes to plot the xsections in parallel, e.g. os.cpu_count()
+    xsection_mode = 'scatter'  # 'scatter' plots every data point, 'binned' plots a time/depth grid (faster for large datasets)
+    force_plots = False  # re-plot all of the figures, even if they haven't changed since the last run
+    main(ncfile, n_workers, xsection_mode, force_plots)
@@ -3,35 +3,65 @@
 """
 Author: Lori Garzio on 2/26/2025
 Modified from code written by Jessica Leonard
-Last modified: 8/19/2025
+Last modified: 10/17/2026
 After using the d3read software to process raw DMON .dtg files to .wav files, this script
-1. renames the files to contain the deployment ID and moves those to a folder called "renamed"
-2. reads in the .xml metadata files to determine which .wav files contain deployment data
+1. renames the files to contain the deployment ID and moves those to a folder called "renamed" (files are
+   hardlinked/cloned where the filesystem allows, otherwise copied in parallel, files that were already staged on an
+   earlier run are skipped, see dataset_archiving.staging)
+2. reads in the .xml metadata files to determine which .wav files contain deployment data (the start/end times
+   from the .xml files are cached, so re-runs e.g. after fixing the deployment times only scan new files). The end
+   of each recording is the start time plus the exact duration from the .wav file header, or the max timestamp in
+   the .xml file if the header can't be read
 3. determines if the .wav files need to be split based on the timestamps in the .xml files (a files
-   needs to be split if it contains more than 6 hours of data outside of the deployment start/end times)
+   needs to be split if it contains more than 6 hours of data outside of the deployment start/end times,
+   see dataset_archiving.dmon.classify_recordings)
 4. spits out a summary .csv file
 5. if a file contains deployment data and doesn't need to be split, moves the files to directory "files_to_archive"
-
-If there are files that must be split, use Mark Baumgartner's reformat_dmon_wav_files.sav program.
+6. cuts the .wav files that need to be split at the deployment start/end and saves the part with deployment data to
+   "files_to_archive" as deployment_nnn_YYYYMMDDhhmmss_uuuuuu.wav (see dataset_archiving.wav.split_wav)
+7. writes a SHA-256 checksum manifest of the files in "files_to_archive" (computed while the files are staged, and
+   cached so re-runs don't read the files again)
+8. saves a report of the time and memory used by each stage to the "run_reports" directory
+
+To split the files with Mark Baumgartner's reformat_dmon_wav_files.sav program instead, set split=False and use
+sort_split_dmon_wav_files.py after the files are split.
 """
 
 import os
 import requests
 import datetime as dt
-import numpy as np
 import pandas as pd
-import shutil
-
-
-def main(filedirectory, deployment):
+import dataset_archiving.dmon as dmon
+import dataset_archiving.instrumentation as ins
+import dataset_archiving.staging as stg
+import dataset_archiving.wav as wav
+
+
+def main(filedirectory, deployment, staging='auto', workers=None, split_hours=6, wav_headers=True, split=True):
+    '''
+    filedirectory: directory containing the .wav files processed by d3read
+    deployment: glider deployment ID, e.g. ru40-20240429T1528
+    staging: how files are staged: 'auto' (clone or hardlink if the filesystem allows, otherwise copy), 'reflink',
+        'hardlink' or 'copy'
+    workers: optional number of threads to stage the files and processes to scan the .xml files
+    split_hours: split the files if they contain more than this many hours of data outside of the deployment
+    wav_headers: get the end of each recording from the duration in the .wav file header, if False use the max
+        timestamp in the .xml file
+    split: cut the .wav files that need to be split at the deployment start/end, if False the files are left to be
+        split with Mark's program
+    '''
     savedir = os.path.join(filedirectory, 'files_to_archive')
     savedir_rename = os.path.join(filedirectory, 'renamed')
     os.makedirs(savedir, exist_ok=True)
     os.makedirs(savedir_rename, exist_ok=True)
 
+    # record the time and memory used by each stage
+    run = ins.RunReport('sort_dmon_wav_files', label=deployment)
+
     # preemptively add a split_files directory for the reformat_dmon_wav_files.sav to save files
     # this will be empty until the files are split using Mark's program
-    os.makedirs(os.path.join(filedirectory, 'split_files'), exist_ok=True)
+    if not split:
+        os.makedirs(os.path.join(filedirectory, 'split_files'), exist_ok=True)
 
     # grab the deployment start and end times from the API
     glider_api = 'https://marine.rutgers.edu/cool/data/gliders/api/'
@@ -40,90 +70,144 @@ def main(filedirectory, deployment):
     deployment_end = dt.datetime.fromtimestamp(deployment_api['end_date_epoch'], dt.timezone.utc)
     print(f'Deployment start: {deployment_start}, end: {deployment_end}')
 
-    # rename the files to include the deployment ID
-    extensions = ['.wav', '.xml', '.dtg', '.log', '.err']
-    files = sorted([x for x in os.listdir(filedirectory) if os.path.isfile(os.path.join(filedirectory, x)) and os.path.splitext(x)[-1] in extensions])
-    for f in files:
-        #orig_file_suffix = os.path.splitext(f)[0].split('_')[-1]
-        orig_file_suffix = os.path.splitext(f)[0][-3:]
-        file_ext = os.path.splitext(f)[-1]
-        f_newname = f'{deployment}_{orig_file_suffix}{file_ext}'
-        shutil.copy(os.path.join(filedirectory, f), os.path.join(savedir_rename, f_newname))
-        print(f'Renamed {f} to {f_newname}')
-
-    # list .xml metadata files and find the minimum and maximum timestamps
-    # make a dataframe and figure out which files contain deployment data
-    cols = ['filename', 'start_time', 'end_time', 'split_file', 'deploy_start', 'deploy_end', 'diff_hours']
-    rows = []
-    xml_timefmt = '%Y,%m,%d,%H,%M,%S'
-    xmlfiles = sorted([x for x in os.listdir(savedir_rename) if x.endswith('.xml')])
-    for i, f in enumerate(xmlfiles):
-        xml_path = os.path.join(savedir_rename, f)
-        xml_data = pd.read_xml(xml_path, parser='etree')
-        xml_data['TS'] = pd.to_datetime(xml_data['TIME'], format=xml_timefmt)
-        xml_times = pd.to_datetime(xml_data['TIME'], format=xml_timefmt).dropna()
-
-        # CUE TIME is the start time of the recording
-        start = xml_data['TS'][np.logical_and(xml_data['SUFFIX']=='wav',~np.isnan(xml_data['CUE']))].item()
-        xml_start = pd.to_datetime(start).tz_localize('UTC').round('s')
-
-        # assume the end time of the recording is the max timestamp in the .xml file
-        xml_end = pd.to_datetime(np.nanmax(xml_times)).tz_localize('UTC').round('s')
-        print(f'file: {f}, start time: {xml_start}, end time: {xml_end}')
-
+    with run.span('stage'):
+        # rename the files to include the deployment ID
+        extensions = ['.wav', '.xml', '.dtg', '.log', '.err']
+        files = sorted([x for x in os.listdir(filedirectory) if os.path.isfile(os.path.join(filedirectory, x)) and os.path.splitext(x)[-1] in extensions])
+        plan = []
+        for f in files:
+            #orig_file_suffix = os.path.splitext(f)[0].split('_')[-1]
+            orig_file_suffix = os.path.splitext(f)[0][-3:]
+            file_ext = os.path.splitext(f)[-1]
+            f_newname = f'{deployment}_{orig_file_suffix}{file_ext}'
+            plan.append((os.path.join(filedirectory, f), os.path.join(savedir_rename, f_newname)))
+        # the checksums are only computed for the files that are archived (below)
+        renamed = stg.stage_files(plan, method=staging, max_workers=workers, checksum=False)
+        for row in renamed.itertuples():
+            print(f'Renamed {os.path.basename(row.source)} to {os.path.basename(row.destination)} ({row.method})')
+
+    with run.span('xml_scan'):
+        # list .xml metadata files and find the minimum and maximum timestamps
+        # make a dataframe and figure out which files contain deployment data
+        xmlfiles = sorted([x for x in os.listdir(savedir_rename) if x.endswith('.xml')])
+
+        # CUE TIME is the start time of the recording, and assume the end time of the recording is the max
+        # timestamp in the .xml file
+        df = dmon.scan_xml_files([os.path.join(savedir_rename, x) for x in xmlfiles], max_workers=workers)
+
+    with run.span('wav_headers'):
+        # the exact end of the recording is the start time plus the duration of the .wav file (only the header is read)
+        # fall back to the .xml end time if the .wav header can't be read
+        if wav_headers:
+            headers = wav.scan_wav_headers([os.path.join(savedir_rename, f'{x.split(".")[0]}.wav') for x in xmlfiles],
+                                           max_workers=workers)
+            valid = headers.duration_s.notna().values
+            wav_end = (df.cue_time + pd.to_timedelta(headers.duration_s.fillna(0), unit='s')).dt.round('s')
+            df['end_time'] = wav_end.where(valid, df.end_time)
+            for f in df.filename[~valid]:
+                print(f'Could not read the .wav header for {f}, using the end time from the .xml file')
+        for row in df.itertuples():
+            print(f'file: {row.filename}, start time: {row.start_time}, end time: {row.end_time}')
+
+    with run.span('classify'):
         # if the time range in the xml file overlaps with the deployment time range, figure out if the file needs
         # to be split and add to summary df
         # split the files if they contain more than 6 hours of data outside of the deployment start/end times
-        if (xml_start <= deployment_end) and (xml_end >= deployment_start):
-            split = ''
-            dstart = ''
-            dend = ''
-            tdiff_hours = 0
-            if xml_start < deployment_start:
-                tdiff_hours = (deployment_start - xml_start).total_seconds() / 60 / 60
-                if tdiff_hours > 6:
-                    split = 'split_start'
-                    dstart = deployment_start
-            if xml_end > deployment_end:
-                tdiff_hours = (xml_end - deployment_end).total_seconds() / 60 / 60
-                if tdiff_hours > 6:
-                    split = 'split_end'
-                    dend = deployment_end
-            rows.append([f, xml_start, xml_end, split, dstart, dend, str(np.round(tdiff_hours, 2))])
-        else:
-            rows.append([f, xml_start, xml_end, 'dont include', '', '', 0])
-
-    df = pd.DataFrame(rows, columns=cols)
-    dfsavefile = os.path.join(filedirectory, f'{deployment}_dmon_wav_files_summary.csv')
-    df.to_csv(dfsavefile, index=False)
-    print(f'Saved summary file to {dfsavefile}')
-
-    # check the timestamps in the .xml files to determine if the .wav files need to be split
-    for i, row in df.iterrows():
-        # for files that need to be split, don't put them in the files_to_archive directory
-        # those will be added later using sort_split_dmon_wav_files.py
-        if row['split_file'] in ['split_start', 'split_end', 'dont include']:
-            continue
-        else:
-            # find all of the files associated with the current .xml file, rename them, and save them to a new directory
-            startstr = row['start_time'].strftime('%Y%m%d%H%M%S')
-            associated_files = [x for x in os.listdir(savedir_rename) if row['filename'].split('.')[0] in x]
-            for af in associated_files:
-                file_str = af.split('.')[0]
-                file_ext = os.path.splitext(af)[-1]
-                savefile = f'{file_str}_LF_{startstr}{file_ext}'
+        classified = dmon.classify_recordings(df.start_time, df.end_time,
+                                              {deployment: (deployment_start, deployment_end)},
+                                              split_hours=split_hours)
+        df = pd.concat([df, classified.drop(columns='deployment')], axis=1)
+        dfsavefile = os.path.join(filedirectory, f'{deployment}_dmon_wav_files_summary.csv')
+        df.drop(columns='cue_time').to_csv(dfsavefile, index=False)
+        print(f'Saved summary file to {dfsavefile}')
+
+    with run.span('archive'):
+        # check the timestamps in the .xml files to determine if the .wav files need to be split
+        renamed_files = dict()  # renamed files grouped by the name without the extension
+        for x in os.listdir(savedir_rename):
+            renamed_files.setdefault(x.split('.')[0], []).append(x)
+        plan = []
+        to_split = []
+        for i, row in df.iterrows():
+            # for files that need to be split, don't put them in the files_to_archive directory
+            # those are cut below, or added later using sort_split_dmon_wav_files.py
+            if row['split_file'] in ['split_start', 'split_end']:
+                to_split.append(row)
+                continue
+            elif row['split_file'] == 'dont include':
+                continue
+            else:
+                # find all of the files associated with the current .xml file, rename them, and save them to a new
+                # directory
+                startstr = row['start_time'].strftime('%Y%m%d%H%M%S')
+                associated_files = renamed_files.get(row['filename'].split('.')[0], [])
+                for af in associated_files:
+                    file_str = af.split('.')[0]
+                    file_ext = os.path.splitext(af)[-1]
+                    savefile = f'{file_str}_LF_{startstr}{file_ext}'
                 
-                if file_ext == '.dtg':  # don't archive .dtg files
+                    if file_ext == '.dtg':  # don't archive .dtg files
+                        continue
+                    else:
+                        plan.append((os.path.join(savedir_rename, af), os.path.join(savedir, savefile)))
+
+        archived = stg.stage_files(plan, method=staging, max_workers=workers)
+        for row in archived.itertuples():
+            print(f'Copied {os.path.basename(row.source)} to "files_to_archive" ({row.method})')
+
+    with run.span('split'):
+        # cut the files that need to be split at the deployment start/end, only the part of the recording with
+        # deployment data is read and written, and pieces that were already cut on an earlier run are re-used
+        if split:
+            pieces = []
+            cachefile = stg.checksum_cache_file(savedir)
+            checksums = stg.load_checksums(cachefile)
+            not_split = []
+            for row in to_split:
+                # cut at the exact CUE time, start_time is rounded to the nearest second
+                stem = row['filename'].split('.')[0]
+                try:
+                    piece = wav.split_wav(os.path.join(savedir_rename, f'{stem}.wav'), row['cue_time'],
+                                          deployment_start, deployment_end, savedir, prefix=stem, checksums=checksums)
+                except (OSError, ValueError) as err:
+                    # e.g. a recording that isn't PCM, leave it to be split with Mark's program
+                    print(f'Could not split {stem}.wav: {err}')
+                    not_split.append(row)
                     continue
-                else:
-                    shutil.copy(os.path.join(savedir_rename, af), os.path.join(savedir, savefile))
-                    print(f'Copied {af} to "files_to_archive"')
+                if piece:
+                    pieces.append(piece)
+                    print(f'Split {stem}.wav to {os.path.basename(piece["destination"])} ({piece["start_time"]} to '
+                          f'{piece["end_time"]}, {piece["method"]})')
+            if any(piece['method'] == 'split' for piece in pieces):
+                stg.save_checksums(checksums, cachefile)
+            if len(pieces) > 0:
+                archived = pd.concat([archived, pd.DataFrame(pieces)[archived.columns]], ignore_index=True)
+            if len(not_split) > 0:
+                os.makedirs(os.path.join(filedirectory, 'split_files'), exist_ok=True)
+                print(f'{len(not_split)} files could not be split and need to be split with Mark\'s program, then '
+                      f'run sort_split_dmon_wav_files.py')
+        elif len(to_split) > 0:
+            print(f'{len(to_split)} files need to be split with Mark\'s program, then run sort_split_dmon_wav_files.py')
+
+    with run.span('manifest'):
+        # checksums of the files to archive, in the sha256sum format
+        shafile = os.path.join(filedirectory, f'{deployment}_files_to_archive_sha256.txt')
+        stg.write_sha256_manifest(archived, shafile, root=savedir)
+        print(f'Saved checksum manifest to {shafile}')
 
     print('Finished sorting files')
-    
+    run.finish(os.path.join(filedirectory, 'run_reports'))
+
+    return run
+
 
 if __name__ == '__main__':
     filedir = '/Users/garzio/Documents/gliderdata/ru40-20240429T1528/from-dmon'
     # filedir = 'C:/Users/rucool/Documents/DMON/2024/ru40-20240429T1528/from-dmon'  # PC directory
     deployment = 'ru40-20240429T1528'
-    main(filedir, deployment)
+    staging_method = 'auto'  # 'auto', 'reflink', 'hardlink' or 'copy'
+    n_workers = None  # number of threads/processes to stage the files and scan the .xml files, None uses the default
+    split_threshold = 6  # split files that contain more than this many hours of data outside of the deployment
+    use_wav_headers = True  # recording end times from the .wav file headers (False uses the .xml files)
+    split_files = True  # cut the files at the deployment start/end (False to split them with Mark's program)
+    main(filedir, deployment, staging_method, n_workers, split_threshold, use_wav_headers, split_files)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""
+Last modified: 10/17/2026
+Process a batch of glider deployments for archiving, listed in a manifest .yml file (see configs/batch_manifest.yml).
+Deployments are processed in parallel on a process pool. For each deployment:
+1. Download the glider dataset (download_glider_dataset.py) if the file isn't already available
+2. QC and export the archive files (pH_glider/phglider_to_ncei.py or acoustics_glider/acoustics_glider_to_archive.py)
+3. Plot the archived dataset (pH_glider/plot_phglider_ncei.py or acoustics_glider/plot_acoustics_glider.py)
+4. pH gliders: compare glider data to discrete water samples (pH_glider/compare_phglider_discrete.py)
+The output from each deployment is written to a log file, a failure in one deployment doesn't stop the others,
+and a summary table is printed and saved at the end.
+"""
+
+import os
+import contextlib
+import datetime as dt
+import importlib.util
+import time
+import traceback
+import pandas as pd
+import yaml
+import dataset_archiving.catalog as cat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+root_dir = os.path.dirname(os.path.abspath(__file__))
+ru_server = 'https://slocum-data.marine.rutgers.edu/erddap'
+
+# scripts run for each sensor type. add_engineering_vars: download the engineering variables
+sensor_steps = dict(
+    pH=dict(add_engineering_vars=False,
+            archive='pH_glider/phglider_to_ncei.py',
+            archive_dir='ncei_pH',
+            plot='pH_glider/plot_phglider_ncei.py',
+            compare='pH_glider/compare_phglider_discrete.py'),
+    azfp=dict(add_engineering_vars=True,
+              archive='acoustics_glider/acoustics_glider_to_archive.py',
+              archive_dir='ncei_azfp',
+              plot='acoustics_glider/plot_acoustics_glider.py'),
+    dmon=dict(add_engineering_vars=False,
+              archive='acoustics_glider/acoustics_glider_to_archive.py',
+              archive_dir='ncei_dmon',
+              plot='acoustics_glider/plot_acoustics_glider.py')
+)
+
+
+def load_script(relpath):
+    '''
+    Import one of the processing scripts from the repository as a module
+    '''
+    fpath = os.path.join(root_dir, relpath)
+    name = os.path.splitext(os.path.basename(fpath))[0]
+    spec = importlib.util.spec_from_file_location(name, fpath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def process_deployment(info, savedir, logdir):
+    '''
+    Run all of the processing steps for one deployment, writing the output to a log file
+    info: dictionary of deployment information from the manifest
+    savedir: directory where the glider datasets are saved
+    logdir: directory for the log files
+    Returns a dictionary summarizing the run
+    '''
+    os.environ['MPLBACKEND'] = 'Agg'  # no interactive plots in the worker processes
+
+    deploy = info['deployment']
+    sensor = info['sensor']
+    version = info.get('version', 'profile-sci-delayed')
+    rfp = info.get('remove_first_profiles', False)
+    chunks = info.get('chunks')
+    encoding_profile = info.get('encoding_profile')
+    steps = sensor_steps[sensor]
+    fname = info.get('file', os.path.join(savedir, deploy, f'{deploy}-{version}.nc'))
+
+    summary = dict(deployment=deploy, sensor=sensor, status='success', failed_step='', minutes=0.0,
+                   log=os.path.join(logdir, f'{deploy}.log'))
+    step = ''
+    start_time = time.time()
+    with open(summary['log'], 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            step = 'download'
+            if info.get('download', False) or not os.path.isfile(fname):
+                print(f'Downloading {deploy}-{version}')
+                load_script('download_glider_dataset.py').main(deploy, version, steps['add_engineering_vars'],
+                                                               savedir)
+
+            step = 'archive'
+            print(f'Processing {fname}')
+            if sensor == 'pH':
+                load_script(steps['archive']).main(fname, rfp, chunks, encoding_profile)
+            else:
+                load_script(steps['archive']).main(fname, sensor, rfp, chunks, encoding_profile)
+            archive_file = os.path.join(os.path.dirname(fname), steps['archive_dir'], f'{deploy}-delayed.nc')
+
+            step = 'plot'
+            print(f'Plotting {archive_file}')
+            load_script(steps['plot']).main(archive_file)
+
+            if 'compare' in steps and info.get('project'):
+                step = 'compare'
+                print(f'Comparing {archive_file} to discrete water samples')
+                load_script(steps['compare']).main(archive_file, info['project'])
+        except Exception:
+            traceback.print_exc()
+            summary['status'] = 'failed'
+            summary['failed_step'] = step
+
+    summary['minutes'] = round((time.time() - start_time) / 60, 2)
+
+    return summary
+
+
+def main(manifest, max_workers=None):
+    start_time = time.time()
+    with open(manifest) as f:
+        batch = yaml.safe_load(f)
+
+    savedir = batch['savedir']
+    deployments = batch['deployments']
+    logdir = os.path.join(savedir, 'batch_logs')
+    os.makedirs(logdir, exist_ok=True)
+
+    for info in deployments:
+        if info['sensor'] not in sensor_steps:
+            raise(ValueError(f'Invalid sensor for {info["deployment"]}: {info["sensor"]}. '
+                             f'Valid options are {list(sensor_steps.keys())}'))
+
+    # refresh the dataset catalog for all of the deployments at once so the downloads don't each
+    # have to request the dataset variables from ERDDAP
+    try:
+        dsids = [f'{x["deployment"]}-{x.get("version", "profile-sci-delayed")}' for x in deployments]
+        cat.refresh_catalog(ru_server, dataset_ids=dsids)
+    except Exception as err:
+        print(f'Unable to refresh the dataset catalog: {err}')
+
+    summary_rows = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_deployment, info, savedir, logdir) for info in deployments]
+        for future in as_completed(futures):
+            summary = future.result()
+            print(f'{summary["deployment"]}: {summary["status"]} ({summary["minutes"]} minutes)')
+            summary_rows.append(summary)
+
+    summary_df = pd.DataFrame(summary_rows)
+    summary_df.sort_values(by='deployment', inplace=True)
+    print(summary_df.to_string(index=False))
+
+    tnow = dt.datetime.now(dt.UTC).strftime('%Y%m%dT%H%M')
+    summary_df.to_csv(os.path.join(logdir, f'batch_summary_{tnow}.csv'), index=False)
+
+    elapsed_time = (time.time() - start_time) / 60  # Calculate the elapsed time in minutes
+    print(f"Time elapsed: {elapsed_time:.2f} minutes")
+
+    return summary_df
+
+
+if __name__ == '__main__':
+    manifest_file = os.path.join(root_dir, 'configs', 'batch_manifest.yml')
+    workers = None  # number of processes, None uses the number of CPUs
+    main(manifest_file, workers)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+Last modified: 10/17/2026
+Compare the netCDF encoding profiles in configs/encoding_profiles.yml on synthetic glider datasets of increasing
+size (see synthetic_glider.py). For each dataset size and encoding profile, report the file size, the time to
+write the file, the time to read the full file and the time to read 10 profiles from the middle of the file.
+Results are appended to a json file along with the git commit.
+"""
+
+import os
+import datetime as dt
+import json
+import platform
+import time
+import numpy as np
+import pandas as pd
+import xarray as xr
+import yaml
+import dataset_archiving.export as ex
+import dataset_archiving.profiles as prof
+import run_benchmarks as rb
+import synthetic_glider as sg
+
+configdir = os.path.join(rb.root_dir, 'configs')
+
+
+def read_profiles(fname, n=10):
+    '''
+    Read n profiles from the middle of a file
+    '''
+    with xr.open_dataset(fname) as ds:
+        pidx = prof.ProfileIndex(ds.profile_time.values)
+        k0 = max(len(pidx) // 2 - n // 2, 0)
+        ds.isel(time=pidx.profiles(k0, k0 + n)).load()
+
+
+def read_file(fname):
+    with xr.open_dataset(fname) as ds:
+        ds.load()
+
+
+def main(sizes, workdir, results_file, profiles=None):
+    '''
+    sizes: list of dataset sizes (number of data points) to benchmark, e.g. [10000, 1000000, 50000000]
+    workdir: directory for the synthetic datasets and outputs (synthetic datasets are re-used if they exist)
+    results_file: json file the results are appended to
+    profiles: optional list of encoding profiles to compare, default is all of the profiles in the config file
+    '''
+    with open(os.path.join(configdir, 'encoding_profiles.yml')) as f:
+        profiles = profiles or list(yaml.safe_load(f).keys())
+
+    results = []
+    for n_obs in sizes:
+        sdir = os.path.join(workdir, f'n{n_obs}')
+        fname = os.path.join(sdir, 'ru99-20240429T1522-profile-sci-delayed.nc')
+        if not os.path.isfile(fname):
+            print(f'Generating synthetic dataset with {n_obs} data points')
+            sg.main(fname, n_obs)
+
+        ds = xr.open_dataset(fname)
+        ds = ds.drop_vars(names=['profile_id', 'rowSize', 'trajectory', 'trajectoryIndex'])
+        ds = ds.swap_dims({'obs': 'time'})
+        ds.load()
+
+        for name in profiles:
+            ds_enc = ds.copy()
+            ex.apply_encoding_profile(ds_enc, ex.load_encoding_profile(configdir, name))
+            savefile = os.path.join(sdir, f'encoding-{name}.nc')
+
+            t0 = time.perf_counter()
+            ds_enc.to_netcdf(savefile, format='NETCDF4', engine='netcdf4', unlimited_dims=['time'])
+            write_s = time.perf_counter() - t0
+
+            results.append(dict(n_obs=n_obs,
+                                profile=name,
+                                size_mb=round(os.path.getsize(savefile) / 1e6, 3),
+                                write_s=round(write_s, 4),
+                                read_s=round(rb.time_call(read_file, savefile)[0], 4),
+                                read_profiles_s=round(rb.time_call(read_profiles, savefile)[0], 4)))
+        ds.close()
+
+    print(pd.DataFrame(results).to_string(index=False))
+
+    run = dict(commit=rb.git_commit(),
+               date=dt.datetime.now(dt.UTC).strftime('%Y-%m-%dT%H:%M:%SZ'),
+               machine=platform.node(),
+               python=platform.python_version(),
+               numpy=np.__version__,
+               xarray=xr.__version__,
+               benchmark='encoding_profiles',
+               results=results)
+
+    try:
+        with open(results_file) as f:
+            runs = json.load(f)
+    except (OSError, ValueError):
+        runs = []
+    runs.append(run)
+    with open(results_file, 'w') as f:
+        json.dump(runs, f, indent=2)
+
+    return run
+
+
+if __name__ == '__main__':
+    dataset_sizes = [10000, 100000, 1000000]  # number of data points, up to 50000000
+    working_dir = '/Users/garzio/Documents/gliderdata/benchmarks'
+    savefile = os.path.join(rb.root_dir, 'benchmarks', 'encoding_results.json')
+    main(dataset_sizes, working_dir, savefile)
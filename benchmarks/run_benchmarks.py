@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""
+Last modified: 10/17/2026
+Benchmark the archiving scripts on synthetic glider datasets of increasing size (see synthetic_glider.py).
+For each dataset size:
+1. Time pH_glider/phglider_to_ncei.py and acoustics_glider/acoustics_glider_to_archive.py end to end
+2. Time each stage of both scripts, from the run reports the scripts record (see dataset_archiving.instrumentation)
+3. Time the cross section plots of the pH glider output (see plot_xsections)
+4. Time common.interpolate_depth
+Results are appended to a json file along with the git commit, so performance can be compared between commits
+(see load_results). The benchmarked stage names are fixed in STAGES, and stages that were renamed or merged are
+listed in STAGE_ALIASES so results from older commits can still be compared.
+"""
+
+import os
+import datetime as dt
+import importlib.util
+import json
+import platform
+import subprocess
+import time
+import numpy as np
+import pandas as pd
+import xarray as xr
+import yaml
+import dataset_archiving.common as cf
+import dataset_archiving.instrumentation as ins
+import dataset_archiving.plotting as pf
+import synthetic_glider as sg
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# stages of each script that are benchmarked (run report span names)
+STAGES = dict(phglider_to_ncei=['open', 'sort', 'qc', 'drop_vars', 'profile_id', 'export'],
+              acoustics_glider_to_archive=['open', 'sort', 'qc', 'drop_vars', 'profile_id', 'export'],
+              plot_xsections=['xsection pH', 'xsection pH binned', 'xsections'])
+
+# benchmark names from older commits: current name. The netCDF and lonlat.csv exports were merged into one
+# pass (export), so their times are summed to compare with the export stage
+STAGE_ALIASES = {'phglider_to_ncei.to_netcdf': 'phglider_to_ncei.export',
+                 'phglider_to_ncei.lonlat': 'phglider_to_ncei.export'}
+
+
+def load_script(relpath):
+    fpath = os.path.join(root_dir, relpath)
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(fpath))[0], fpath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def load_results(results_file):
+    '''
+    Load the benchmark results from all of the runs in a results file, to compare performance between commits.
+    Stages that were renamed or merged are mapped to their current names (see STAGE_ALIASES), and the times of
+    stages that were merged are summed
+    results_file: json file the results were appended to
+    Returns a DataFrame with the commit, date, chunks, n_obs, benchmark and seconds of each result
+    '''
+    with open(results_file) as f:
+        runs = json.load(f)
+
+    rows = []
+    for run in runs:
+        for result in run['results']:
+            rows.append(dict(commit=run['commit'], date=run['date'], chunks=run.get('chunks'), n_obs=result['n_obs'],
+                             benchmark=STAGE_ALIASES.get(result['benchmark'], result['benchmark']),
+                             seconds=result['seconds']))
+    df = pd.DataFrame(rows, columns=['commit', 'date', 'chunks', 'n_obs', 'benchmark', 'seconds'])
+
+    return df.groupby(['commit', 'date', 'chunks', 'n_obs', 'benchmark'], dropna=False, sort=False,
+                      as_index=False)['seconds'].sum()
+
+
+def plot_xsections(fname, workers=None):
+    '''
+    Plot the cross sections of a pH glider output file the same way plot_phglider_ncei.py does: the pH cross
+    section on its own in the scatter and binned modes ('xsection pH' and 'xsection pH binned'), then all of the
+    variables in plot_vars.yml in parallel ('xsections', see plotting.render_xsections)
+    fname: pH glider output file (from phglider_to_ncei.py)
+    workers: optional number of processes to plot the cross sections in parallel
+    Returns the run report
+    '''
+    savedir = os.path.join(os.path.dirname(fname), 'plots')
+    os.makedirs(savedir, exist_ok=True)
+    with open(os.path.join(root_dir, 'configs', 'plot_vars.yml')) as f:
+        plt_vars = yaml.safe_load(f)
+
+    run = ins.RunReport('plot_xsections')
+    with xr.open_dataset(fname) as ds:
+        x = ds.time.values
+        y = ds.depth_interpolated.values
+        xplots = dict()
+        for pv, info in plt_vars.items():
+            if pv not in ds or len(ds[pv]) < 2:
+                continue
+            xargs = dict(clabel=f'{ds[pv].attrs.get("long_name", pv)} ({ds[pv].attrs.get("units", "")})',
+                         title=pv, date_fmt='%m-%d', grid=True, cmap=info['cmap'])
+            xplots[f'xsection {pv}'] = (os.path.join(savedir, f'xsection_{pv}.png'), ds[pv].values, xargs)
+
+        sfile, z, xargs = xplots['xsection pH']
+        with run.span('xsection pH'):
+            pf.save_xsection(sfile, x, y, z, mode='scatter', **xargs)
+        with run.span('xsection pH binned'):
+            pf.save_xsection(sfile, x, y, z, mode='binned', **xargs)
+        with run.span('xsections'):
+            for record in pf.render_xsections(x, y, xplots, max_workers=workers):
+                run.add(record)
+
+    return run
+
+
+def stage_timings(run, stages):
+    '''
+    Wall time of each stage of a script from its run report (see dataset_archiving.instrumentation.RunReport), so
+    the stages are timed with the script itself instead of a copy of it
+    run: run report returned by the script's main function
+    stages: list of the stage names that are benchmarked. A ValueError is raised if the script doesn't record one
+    of them, so a renamed stage doesn't silently break the comparison between commits
+    Returns a dictionary of benchmark name (script.stage): seconds
+    '''
+    spans = {x['stage']: x['wall_s'] for x in run.spans}
+    missing = [x for x in stages if x not in spans]
+    if len(missing) > 0:
+        raise(ValueError(f'{run.name} run report is missing the benchmarked stages: {missing}. Update '
+                         f'STAGES (and STAGE_ALIASES if a stage was renamed)'))
+
+    return {f'{run.name}.{x}': spans[x] for x in stages}
+
+
+def time_call(func, *args, **kwargs):
+    '''
+    Returns the wall time (seconds) of a function call, and the value it returned
+    '''
+    t0 = time.perf_counter()
+    value = func(*args, **kwargs)
+
+    return time.perf_counter() - t0, value
+
+
+def main(sizes, workdir, results_file, chunks=None):
+    '''
+    sizes: list of dataset sizes (number of data points) to benchmark, e.g. [10000, 1000000, 50000000]
+    workdir: directory for the synthetic datasets and outputs (synthetic datasets are re-used if they exist)
+    results_file: json file the results are appended to
+    chunks: optional number of data points per chunk to run the archiving scripts lazily with dask
+    '''
+    phglider = load_script('pH_glider/phglider_to_ncei.py')
+    acoustics = load_script('acoustics_glider/acoustics_glider_to_archive.py')
+
+    results = []
+    for n_obs in sizes:
+        sdir = os.path.join(workdir, f'n{n_obs}')
+        fname = os.path.join(sdir, 'ru99-20240429T1522-profile-sci-delayed.nc')
+        if not os.path.isfile(fname):
+            print(f'Generating synthetic dataset with {n_obs} data points')
+            sg.main(fname, n_obs)
+
+        timings = dict()
+        seconds, run = time_call(phglider.main, fname, 10, chunks)
+        timings.update(stage_timings(run, STAGES['phglider_to_ncei']))
+        timings['phglider_to_ncei.main'] = seconds
+
+        seconds, run = time_call(acoustics.main, fname, 'azfp', 10, chunks)
+        timings.update(stage_timings(run, STAGES['acoustics_glider_to_archive']))
+        timings['acoustics_glider_to_archive.main'] = seconds
+
+        phfile = os.path.join(sdir, 'ncei_pH', 'ru99-20240429T1522-delayed.nc')
+        seconds, run = time_call(plot_xsections, phfile)
+        timings.update(stage_timings(run, STAGES['plot_xsections']))
+        timings['plot_xsections.main'] = seconds
+
+        ds = xr.open_dataset(fname).drop_vars('depth_interpolated')
+        timings['common.interpolate_depth'] = time_call(cf.interpolate_depth, ds)[0]
+        ds.close()
+
+        for benchmark, seconds in timings.items():
+            print(f'{n_obs:>10} {benchmark:<40} {seconds:8.3f} s')
+            results.append(dict(n_obs=n_obs, benchmark=benchmark, seconds=round(seconds, 4)))
+
+    run = dict(commit=git_commit(),
+               date=dt.datetime.now(dt.UTC).strftime('%Y-%m-%dT%H:%M:%SZ'),
+               machine=platform.node(),
+               python=platform.python_version(),
+               numpy=np.__version__,
+               xarray=xr.__version__,
+               chunks=chunks,
+               results=results)
+
+    try:
+        with open(results_file) as f:
+            runs = json.load(f)
+    except (OSError, ValueError):
+        runs = []
+    runs.append(run)
+    with open(results_file, 'w') as f:
+        json.dump(runs, f, indent=2)
+
+    return run
+
+
+if __name__ == '__main__':
+    dataset_sizes = [10000, 100000, 1000000]  # number of data points, up to 50000000
+    working_dir = '/Users/garzio/Documents/gliderdata/benchmarks'
+    savefile = os.path.join(root_dir, 'benchmarks', 'results.json')
+    chunk_size = None  # number of data points per chunk to run the scripts lazily, or None to load the files
+    main(dataset_sizes, working_dir, savefile, chunk_size)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+Last modified: 10/17/2026
+Generate a synthetic glider profile-sci-delayed netCDF file with the same layout as the datasets downloaded from
+RUCOOL's glider ERDDAP server (contiguous ragged array with obs, profile and trajectory dimensions), for
+benchmarking the archiving scripts. The file is written in chunks so large files (e.g. 50 million data points)
+can be generated without loading the full dataset into memory.
+"""
+
+import os
+import numpy as np
+from netCDF4 import Dataset, default_fillvals
+
+T0 = np.datetime64('2024-04-29T15:22:00', 's')
+SAMPLE_INTERVAL = 2  # seconds between data points
+TIME_UNITS = 'seconds since 1970-01-01T00:00:00Z'
+
+# science variables: long_name, units, mean, standard deviation
+SCI_VARS = dict(
+    conductivity=('Conductivity', 'S m-1', 4, 0.3),
+    temperature=('Temperature', 'degrees_Celsius', 15, 3),
+    salinity=('Salinity', '1', 32, 0.5),
+    density=('Density', 'kg m-3', 1024, 1),
+    chlorophyll_a=('Chlorophyll', 'ug L-1', 1, 0.5),
+    oxygen_concentration_shifted=('Oxygen Concentration Shifted', 'umol L-1', 250, 20),
+    oxygen_saturation_shifted=('Oxygen Saturation Shifted', 'percent', 95, 5),
+    pH=('pH', '1', 8, 0.05),
+    total_alkalinity=('Total Alkalinity', 'umol kg-1', 2200, 30),
+    aragonite_saturation_state=('Aragonite Saturation State', '1', 2, 0.3),
+    sbe41n_ph_ref_voltage=('pH Reference Voltage', 'volts', -1, 0.01)
+)
+QARTOD_VARS = ['conductivity', 'temperature', 'salinity', 'density', 'pressure', 'chlorophyll_a',
+               'oxygen_concentration_shifted']
+HYSTERESIS_VARS = ['conductivity', 'temperature']
+PH_QARTOD_VARS = ['pH_qartod_gross_range_test', 'pH_qartod_spike_test']
+INSTRUMENT_VARS = dict(instrument_ctd=('Sea-Bird', 'GPCTD'),
+                       instrument_ph=('Sea-Bird', 'Deep SeapHOx V2'),
+                       instrument_oxygen=('Aanderaa', 'Optode 4831'))
+
+
+def add_var(nc, name, dtype, dim, attrs):
+    var = nc.createVariable(name, dtype, (dim,), fill_value=default_fillvals[dtype])
+    var.setncatts(attrs)
+
+    return var
+
+
+def profile_times(starts, stops):
+    '''
+    Profile time (mean time of the data points in the profile, rounded to the second) for profiles with
+    observation offsets starts/stops
+    '''
+    mean_idx = (starts + stops - 1) / 2
+
+    return np.round(mean_idx * SAMPLE_INTERVAL).astype('int64') + T0.astype('int64')
+
+
+def main(fname, n_obs, obs_per_profile=250, chunk_size=1000000, seed=0):
+    '''
+    fname: file to write
+    n_obs: number of data points (length of the obs dimension)
+    obs_per_profile: number of data points per profile
+    chunk_size: number of data points written at a time
+    seed: random seed
+    '''
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    deploy = 'ru99-20240429T1522'
+    n_profiles = int(np.ceil(n_obs / obs_per_profile))
+
+    with Dataset(fname, 'w', format='NETCDF4') as nc:
+        nc.createDimension('trajectory', 1)
+        nc.createDimension('profile', n_profiles)
+        nc.createDimension('obs', n_obs)
+        nc.setncatts(dict(deployment=deploy,
+                          featureType='trajectoryProfile',
+                          Conventions='CF-1.6, ACDD-1.3, IOOS-1.2',
+                          program='Synthetic benchmark program',
+                          project='Synthetic benchmark project',
+                          references='Synthetic glider dataset',
+                          sea_name='Mid-Atlantic Bight',
+                          summary='Synthetic glider dataset for benchmarking the archiving scripts'))
+
+        traj = nc.createVariable('trajectory', str, ('trajectory',))
+        traj.setncatts(dict(cf_role='trajectory_id', long_name='Trajectory Name'))
+        traj[0] = deploy
+
+        # profile variables
+        starts = np.arange(n_profiles) * obs_per_profile
+        stops = np.minimum(starts + obs_per_profile, n_obs)
+        pid = add_var(nc, 'profile_id', 'i4', 'profile', dict(cf_role='profile_id', long_name='Profile ID'))
+        ptimes = profile_times(starts, stops)
+        pid[:] = ptimes.astype('int32')
+        rowsize = add_var(nc, 'rowSize', 'i4', 'profile', dict(long_name='Number of Observations for this Profile',
+                                                                 sample_dimension='obs'))
+        rowsize[:] = (stops - starts).astype('int32')
+        tindex = add_var(nc, 'trajectoryIndex', 'i4', 'profile', dict(instance_dimension='trajectory',
+                                                                        long_name='The trajectory to which this profile is associated.'))
+        tindex[:] = 0
+
+        # observation variables
+        obs_vars = dict()
+        obs_vars['time'] = add_var(nc, 'time', 'f8', 'obs', dict(long_name='Time', standard_name='time',
+                                                                 units=TIME_UNITS, calendar='gregorian'))
+        obs_vars['profile_time'] = add_var(nc, 'profile_time', 'f8', 'obs', dict(long_name='Profile Time',
+                                                                                 units=TIME_UNITS,
+                                                                                 calendar='gregorian'))
+        for name, units in [('latitude', 'degrees_north'), ('longitude', 'degrees_east'),
+                            ('profile_lat', 'degrees_north'), ('profile_lon', 'degrees_east')]:
+            obs_vars[name] = add_var(nc, name, 'f8', 'obs', dict(long_name=name.replace('_', ' ').title(),
+                                                                 units=units, actual_range=[-90., 90.]))
+        for name in ['depth', 'depth_interpolated', 'pressure']:
+            attrs = dict(long_name=name.replace('_', ' ').title(), units='m', valid_min=0., valid_max=2000.,
+                         actual_range=[0., 1000.], ancillary_variables=f'{name}_qartod_summary_flag',
+                         comment='synthetic')
+            if name == 'pressure':
+                attrs.update(units='bar', comment='Pressure multiplied by 10 to convert from bar to dbar')
+            obs_vars[name] = add_var(nc, name, 'f4', 'obs', attrs)
+        for name, (long_name, units, mean, std) in SCI_VARS.items():
+            obs_vars[name] = add_var(nc, name, 'f4', 'obs', dict(long_name=long_name, units=units,
+                                                                 valid_min=np.float32(mean - 10 * std),
+                                                                 valid_max=np.float32(mean + 10 * std),
+                                                                 actual_range=[mean - std, mean + std],
+                                                                 ancillary_variables=f'{name}_qartod_summary_flag'))
+        obs_vars['m_pitch'] = add_var(nc, 'm_pitch', 'f4', 'obs', dict(long_name='Pitch', units='rad'))
+        obs_vars['water_depth'] = add_var(nc, 'water_depth', 'f4', 'obs', dict(long_name='Water Depth', units='m'))
+        flag_vars = [f'{x}_qartod_summary_flag' for x in QARTOD_VARS] + \
+                    [f'{x}_hysteresis_test' for x in HYSTERESIS_VARS] + PH_QARTOD_VARS
+        for name in flag_vars:
+            obs_vars[name] = add_var(nc, name, 'i1', 'obs', dict(long_name=name.replace('_', ' ').title(),
+                                                                 flag_values=np.array([1, 2, 3, 4, 9], dtype='int8'),
+                                                                 flag_meanings='PASS NOT_EVALUATED SUSPECT FAIL MISSING'))
+        for name, (maker, model) in INSTRUMENT_VARS.items():
+            obs_vars[name] = add_var(nc, name, 'i1', 'obs', dict(long_name=name, maker=maker, model=model,
+                                                                 serial_number='0001', calibration_date='2024-01-01'))
+
+        # write the observations in chunks
+        lon0, lat0 = -74.0, 39.5
+        for c0 in range(0, n_obs, chunk_size):
+            c1 = min(c0 + chunk_size, n_obs)
+            n = c1 - c0
+            rng = np.random.default_rng([seed, c0])
+            idx = np.arange(c0, c1)
+            profile = idx // obs_per_profile
+            phase = (idx % obs_per_profile) / obs_per_profile
+
+            obs_vars['time'][c0:c1] = T0.astype('int64') + idx * SAMPLE_INTERVAL
+            obs_vars['profile_time'][c0:c1] = ptimes[profile]
+
+            lon = lon0 + np.cumsum(rng.normal(0, 1e-5, n))
+            lat = lat0 + np.cumsum(rng.normal(0, 1e-5, n))
+            lon0, lat0 = lon[-1], lat[-1]
+            obs_vars['longitude'][c0:c1] = lon
+            obs_vars['latitude'][c0:c1] = lat
+            obs_vars['profile_lon'][c0:c1] = np.round(lon - (idx % obs_per_profile) * 1e-6, 4)
+            obs_vars['profile_lat'][c0:c1] = np.round(lat - (idx % obs_per_profile) * 1e-6, 4)
+
+            # glider yo: dive to 40 m and climb back to the surface in each profile
+            depth = np.where(phase < 0.5, phase * 2, 2 - phase * 2) * 40 + 0.2 + rng.normal(0, 0.05, n)
+            obs_vars['depth_interpolated'][c0:c1] = depth
+            obs_vars['pressure'][c0:c1] = depth / 10
+            depth[rng.random(n) < 0.1] = np.nan
+            obs_vars['depth'][c0:c1] = depth
+
+            for name, (long_name, units, mean, std) in SCI_VARS.items():
+                obs_vars[name][c0:c1] = rng.normal(mean, std, n)
+            obs_vars['m_pitch'][c0:c1] = rng.normal(0.4, 0.1, n)
+            obs_vars['water_depth'][c0:c1] = rng.normal(50, 1, n)
+            for name in flag_vars:
+                obs_vars[name][c0:c1] = rng.choice(np.array([1, 1, 1, 1, 1, 1, 2, 3, 4, 9], dtype='int8'), n)
+            for name in INSTRUMENT_VARS:
+                obs_vars[name][c0:c1] = np.zeros(n, dtype='int8')
+
+    return fname
+
+
+if __name__ == '__main__':
+    savefile = '/Users/garzio/Documents/gliderdata/benchmarks/ru99-20240429T1522-profile-sci-delayed.nc'
+    num_obs = 1000000  # number of data points, e.g. 10000 to 50000000
+    main(savefile, num_obs)
@@ -0,0 +1,229 @@
+#! /usr/bin/env python
+
+"""
+Local catalog of ERDDAP dataset metadata (variables and attributes). The catalog is saved to disk with a
+time-to-live, and can be refreshed in bulk for all datasets on a server so that variable selection for a batch
+of downloads doesn't need any network requests.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from erddapy import ERDDAP
+
+DEFAULT_CATALOG_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dataset_archiving', 'catalog')
+
+
+class VariableIndex:
+    '''
+    Set and prefix/suffix indexes over a list of dataset variable names, so variable lookups don't
+    require scanning the full list of variables
+    names: list of variable names
+    '''
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        self._set = set(self.names)
+        self._reversed = sorted(x[::-1] for x in self.names)
+
+    def __contains__(self, name):
+        return name in self._set
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def containing(self, substring):
+        '''
+        Variable names that contain substring anywhere in the name
+        '''
+        return [x for x in self.names if substring in x]
+
+    def with_prefix(self, prefix):
+        '''
+        Variable names that start with prefix
+        '''
+        return _prefix_matches(self.names, prefix)
+
+    def with_suffix(self, suffix):
+        '''
+        Variable names that end with suffix
+        '''
+        return sorted(x[::-1] for x in _prefix_matches(self._reversed, suffix[::-1]))
+
+
+def _prefix_matches(sorted_names, prefix):
+    matches = []
+    i = bisect_left(sorted_names, prefix)
+    while i < len(sorted_names) and sorted_names[i].startswith(prefix):
+        matches.append(sorted_names[i])
+        i += 1
+
+    return matches
+
+
+def catalog_file(server, catalog_dir=None):
+    '''
+    Catalog file for an ERDDAP server
+    '''
+    catalog_dir = catalog_dir or DEFAULT_CATALOG_DIR
+    serverhash = hashlib.sha1(server.rstrip('/').encode()).hexdigest()[:12]
+
+    return os.path.join(catalog_dir, f'catalog-{serverhash}.json')
+
+
+def fetch_dataset_metadata(server, ds_id):
+    '''
+    Download the variables and attributes for a dataset from the ERDDAP info page
+    server: ERDDAP server url
+    ds_id: dataset ID
+    Returns a dictionary with the global attributes, and the variables and their attributes
+    '''
+    e = ERDDAP(server=server,
+               protocol='tabledap',
+               response='nc')
+    info = pd.read_csv(e.get_info_url(dataset_id=ds_id, response='csv'))
+
+    metadata = dict(fetched=dt.datetime.now(dt.UTC).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    global_attributes=dict(),
+                    variables=dict())
+    for row in info.itertuples(index=False):
+        row_type, var_name, attr_name, data_type, value = row[0:5]
+        if row_type == 'variable':
+            metadata['variables'][var_name] = dict()
+        elif row_type == 'attribute':
+            value = None if pd.isna(value) else str(value)
+            if var_name == 'NC_GLOBAL':
+                metadata['global_attributes'][attr_name] = value
+            else:
+                metadata['variables'].setdefault(var_name, dict())[attr_name] = value
+
+    return metadata
+
+
+def get_dataset_metadata(server, ds_id, ttl_hours=24, catalog_dir=None):
+    '''
+    Get the metadata for a dataset from the local catalog, refreshing it from ERDDAP if it's missing or older
+    than ttl_hours
+    server: ERDDAP server url
+    ds_id: dataset ID
+    ttl_hours: number of hours before the catalog entry is refreshed
+    catalog_dir: optional catalog directory, default is ~/.cache/dataset_archiving/catalog
+    '''
+    catalog, errors = refresh_catalog(server, dataset_ids=[ds_id], ttl_hours=ttl_hours, catalog_dir=catalog_dir)
+    if ds_id not in catalog:
+        raise(ValueError(f'Unable to get the metadata for {ds_id} from {server}: {errors.get(ds_id)}'))
+
+    return catalog[ds_id]
+
+
+def get_dataset_variables(server, ds_id, ttl_hours=24, catalog_dir=None):
+    '''
+    Get a VariableIndex of the variables in a dataset from the local catalog, refreshing it from ERDDAP
+    if it's missing or older than ttl_hours
+    server: ERDDAP server url
+    ds_id: dataset ID
+    ttl_hours: number of hours before the catalog entry is refreshed
+    catalog_dir: optional catalog directory, default is ~/.cache/dataset_archiving/catalog
+    '''
+    metadata = get_dataset_metadata(server, ds_id, ttl_hours=ttl_hours, catalog_dir=catalog_dir)
+
+    return VariableIndex(metadata['variables'].keys())
+
+
+def is_stale(metadata, ttl_hours):
+    '''
+    Check if a catalog entry was downloaded more than ttl_hours ago
+    '''
+    fetched = dt.datetime.strptime(metadata['fetched'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=dt.UTC)
+
+    return dt.datetime.now(dt.UTC) - fetched > dt.timedelta(hours=ttl_hours)
+
+
+def list_server_datasets(server):
+    '''
+    List all of the tabledap dataset IDs on an ERDDAP server (griddap-only datasets are left out)
+    '''
+    df = pd.read_csv(f'{server.rstrip("/")}/tabledap/allDatasets.csv?datasetID,tabledap', skiprows=[1])
+    df = df[df['tabledap'].notna() & (df['tabledap'].astype(str).str.strip() != '')]
+
+    return [x for x in df['datasetID'].tolist() if x != 'allDatasets']
+
+
+def load_catalog(server, catalog_dir=None):
+    '''
+    Load the local catalog for an ERDDAP server
+    Returns a dictionary of dataset ID: metadata
+    '''
+    try:
+        with open(catalog_file(server, catalog_dir)) as f:
+            return json.load(f)['datasets']
+    except (OSError, ValueError, KeyError):
+        return dict()
+
+
+def refresh_catalog(server, dataset_ids=None, ttl_hours=24, force=False, max_workers=8, catalog_dir=None):
+    '''
+    Refresh the local catalog for an ERDDAP server. Only datasets that are missing from the catalog or older
+    than ttl_hours are downloaded (unless force=True), and the downloads are run concurrently. Datasets that
+    fail to download don't stop the refresh: the error for each one is returned, and the previous catalog entry
+    (if any) is kept
+    server: ERDDAP server url
+    dataset_ids: optional list of dataset IDs to refresh, default is all datasets on the server
+    ttl_hours: number of hours before a catalog entry is refreshed
+    force: refresh all of the datasets regardless of when they were last downloaded
+    max_workers: maximum number of concurrent requests
+    catalog_dir: optional catalog directory, default is ~/.cache/dataset_archiving/catalog
+    Returns the catalog dictionary of dataset ID: metadata, and a dictionary of dataset ID: error message for
+    the datasets that failed to download
+    '''
+    catalog = load_catalog(server, catalog_dir)
+    if dataset_ids is None:
+        dataset_ids = list_server_datasets(server)
+
+    refresh_ids = [x for x in dataset_ids if force or x not in catalog or is_stale(catalog[x], ttl_hours)]
+    if len(refresh_ids) == 0:
+        return catalog, dict()
+
+    def fetch(ds_id):
+        try:
+            return fetch_dataset_metadata(server, ds_id), None
+        except Exception as err:
+            return None, repr(err)
+
+    refreshed = dict()
+    errors = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for ds_id, (metadata, err) in zip(refresh_ids, executor.map(fetch, refresh_ids)):
+            if err is None:
+                refreshed[ds_id] = metadata
+            else:
+                errors[ds_id] = err
+    print(f'Refreshed catalog metadata for {len(refreshed)} datasets from {server}')
+    for ds_id, err in errors.items():
+        print(f'Unable to refresh the catalog metadata for {ds_id}: {err}')
+
+    # reload the catalog before saving in case another process updated it
+    saved = load_catalog(server, catalog_dir)
+    saved.update(refreshed)
+    if len(refreshed) > 0:
+        save_catalog(server, saved, catalog_dir)
+
+    return saved, errors
+
+
+def save_catalog(server, catalog, catalog_dir=None):
+    '''
+    Save the local catalog for an ERDDAP server
+    '''
+    sfile = catalog_file(server, catalog_dir)
+    os.makedirs(os.path.dirname(sfile), exist_ok=True)
+    tmpfile = f'{sfile}.{os.getpid()}.tmp'
+    with open(tmpfile, 'w') as f:
+        json.dump(dict(server=server, datasets=catalog), f)
+    os.replace(tmpfile, sfile)
@@ -4,10 +4,44 @@
 Common functions
 """
 
+import time
 import numpy as np
+import pandas as pd
+import requests
 import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
 from erddapy import ERDDAP
 from netCDF4 import default_fillvals
+from dataset_archiving import catalog
+
+try:
+    import httpx  # used by erddapy < 2.3, newer versions use requests
+except ImportError:
+    httpx = None
+
+
+QC_FLAG_VALUES = dict(suspect_failed=(3, 4),
+                      failed_only=(4,))
+
+# global attribute recording the variable a dataset is sorted by (written when the dataset is downloaded)
+SORTED_BY_ATTR = 'sorted_by'
+
+# errors from a failed download that are worth retrying (connection errors, timeouts, HTTP errors and truncated
+# responses that can't be opened)
+DOWNLOAD_ERRORS = (requests.RequestException, OSError, TimeoutError) + ((httpx.HTTPError,) if httpx else ())
+
+
+def add_comment_attr(data_array, comment):
+    '''
+    Append a comment to the comment attribute of a data array, if it's not already there
+    data_array: xarray data array
+    comment: comment to add
+    '''
+    if not hasattr(data_array, 'comment'):
+        data_array.attrs['comment'] = comment
+    else:
+        if comment not in data_array.attrs['comment']:
+            data_array.attrs['comment'] = ' '.join((data_array.comment, comment))
 
 
 def apply_ctd_hysteresis_qc(dataset, qc_variety='suspect_failed', add_comment=False):
@@ -18,32 +52,10 @@ def apply_ctd_hysteresis_qc(dataset, qc_variety='suspect_failed', add_comment=Fa
     dataset: xarray dataset
     qc_variety: specify if suspect (3) and/or failed (4) QC variables are applied
     options are 'suspect_failed' (default) or 'failed_only'
-    add_comment: optional user comment to add to the data array 
-    '''
-    qcvars = [x for x in list(dataset.data_vars) if '_hysteresis_test' in x]
-    for qv in qcvars:
-        target_var = list([qv.split('_hysteresis_test')[0]])
-        target_var.append('salinity')
-        target_var.append('density')
-
-        if qc_variety == 'suspect_failed':
-            qc_idx = np.where(np.logical_or(dataset[qv].values == 3, dataset[qv].values == 4))[0]
-        elif qc_variety == 'failed_only':
-            qc_idx = np.where(dataset[qv].values == 4)[0]
-        else:
-            raise(ValueError(f'Invalid qc_variety provided: {qc_variety}. Valid options are "suspect_failed" or "failed_only"'))
-
-        for tv in target_var:
-            # update comment to indicate that QC was applied
-            if add_comment:
-                if not hasattr(dataset[tv], 'comment'):
-                    dataset[tv].attrs['comment'] = add_comment
-                else:
-                    if add_comment not in dataset[tv].attrs['comment']:
-                        dataset[tv].attrs['comment'] = ' '.join((dataset[tv].comment, add_comment))
-            # remove flagged values
-            if len(qc_idx) > 0:
-                dataset[tv][qc_idx] = np.nan
+    add_comment: optional user comment to add to the data array
+    Returns a dictionary of the number of data points removed from each variable
+    '''
+    return apply_qc(dataset, qc_tests=['hysteresis'], qc_variety=qc_variety, add_comment=add_comment)
 
 
 def apply_qartod_qc(dataset, qc_variety='suspect_failed', add_comment=False):
@@ -55,71 +67,215 @@ def apply_qartod_qc(dataset, qc_variety='suspect_failed', add_comment=False):
     dataset: xarray dataset
     qc_variety: specify if suspect (3) and/or failed (4) QC variables are applied
     options are 'suspect_failed' (default) or 'failed_only'
-    add_comment: optional user comment to add to the data array 
+    add_comment: optional user comment to add to the data array
+    Returns a dictionary of the number of data points removed from each variable
     '''
-    qcvars = [x for x in list(dataset.data_vars) if '_qartod_summary_flag' in x]
-    for qv in qcvars:
-        if 'pressure' in qv:
-            continue
-        target_var = list([qv.split('_qartod_summary_flag')[0]])
-        if target_var[0] in ['conductivity', 'temperature']:
-            target_var.append('salinity')
-            target_var.append('density')
-        
-        if qc_variety == 'suspect_failed':
-            qc_idx = np.where(np.logical_or(dataset[qv].values == 3, dataset[qv].values == 4))[0]
-        elif qc_variety == 'failed_only':
-            qc_idx = np.where(dataset[qv].values == 4)[0]
+    return apply_qc(dataset, qc_tests=['qartod'], qc_variety=qc_variety, add_comment=add_comment)
+
+
+def apply_qc(dataset, qc_tests=('qartod', 'hysteresis'), qc_variety='suspect_failed', add_comment=False):
+    '''
+    Apply QARTOD summary QC and/or CTD hysteresis QC in a single pass.
+    One combined mask is built for each target variable from all of the relevant QC flag variables,
+    and each mask is applied once (e.g. salinity and density are only masked once, not once per flag variable)
+    dataset: xarray dataset
+    qc_tests: QC tests to apply, 'qartod' and/or 'hysteresis' (default is both)
+    qc_variety: specify if suspect (3) and/or failed (4) QC variables are applied
+    options are 'suspect_failed' (default) or 'failed_only'
+    add_comment: optional user comment to add to the data array
+    Returns a dictionary of the number of data points removed from each variable
+    '''
+    masks = build_qc_masks(dataset, qc_tests=qc_tests, qc_variety=qc_variety)
+    return apply_qc_masks(dataset, masks, add_comment=add_comment)
+
+
+def apply_qc_masks(dataset, masks, add_comment=False):
+    '''
+    Set values to nan where the boolean masks are True, and optionally add a comment to each variable
+    dataset: xarray dataset
+    masks: dictionary of target variable name: boolean numpy or dask array along the variable's dimension
+    add_comment: optional user comment to add to the data array
+    Returns a dictionary of the number of data points removed from each variable
+    '''
+    counts = dict()
+    for tv, mask in masks.items():
+        # update comment to indicate that QC was applied
+        if add_comment:
+            add_comment_attr(dataset[tv], add_comment)
+
+        # remove flagged values
+        if dataset[tv].chunks is None:
+            counts[tv] = int(np.count_nonzero(mask))
+            if counts[tv] > 0:
+                dataset[tv][mask] = np.nan
         else:
-            raise(ValueError(f'Invalid qc_variety provided: {qc_variety}. Valid options are "suspect_failed" or "failed_only"'))
+            # lazy (dask) dataset: mask without loading the data
+            counts[tv] = np.count_nonzero(mask)
+            encoding = dataset[tv].encoding
+            dataset[tv] = dataset[tv].where(~xr.DataArray(mask, dims=dataset[tv].dims))
+            dataset[tv].encoding = encoding
 
-        for tv in target_var:
-            try:
-                dataset[tv]
-            except KeyError:
+    return compute_counts(counts)
+
+
+def build_qc_masks(dataset, qc_tests=('qartod', 'hysteresis'), qc_variety='suspect_failed'):
+    '''
+    Build one combined boolean mask per target variable from all of the relevant QC flag variables
+    QARTOD summary flags are applied to all variables except pressure, and conductivity and temperature
+    QARTOD flags are also applied to salinity and density. CTD hysteresis flags are applied to the
+    tested variable, salinity and density
+    dataset: xarray dataset
+    qc_tests: QC tests to include, 'qartod' and/or 'hysteresis' (default is both)
+    qc_variety: specify if suspect (3) and/or failed (4) QC variables are applied
+    options are 'suspect_failed' (default) or 'failed_only'
+    Returns a dictionary of target variable name: boolean numpy array (dask array if the dataset is lazy)
+    '''
+    try:
+        flag_values = QC_FLAG_VALUES[qc_variety]
+    except KeyError:
+        raise(ValueError(f'Invalid qc_variety provided: {qc_variety}. Valid options are "suspect_failed" or "failed_only"'))
+
+    # map each QC flag variable to the variables it's applied to
+    qc_targets = dict()
+    for qv in list(dataset.data_vars):
+        if 'qartod' in qc_tests and '_qartod_summary_flag' in qv:
+            if 'pressure' in qv:
                 continue
-            # update comment to indicate that QC was applied
-            if add_comment:
-                if not hasattr(dataset[tv], 'comment'):
-                    dataset[tv].attrs['comment'] = add_comment
-                else:
-                    if add_comment not in dataset[tv].attrs['comment']:
-                        dataset[tv].attrs['comment'] = ' '.join((dataset[tv].comment, add_comment))
-            # remove flagged values
-            if len(qc_idx) > 0:
-                dataset[tv][qc_idx] = np.nan
-
-
-def get_dataset_variables(server, dataset_id):
-    e = ERDDAP(server=server,
-               protocol='tabledap',
-               response='nc')
-    var_dict = e._get_variables(dataset_id=dataset_id)
+            target_var = [qv.split('_qartod_summary_flag')[0]]
+            if target_var[0] in ['conductivity', 'temperature']:
+                target_var.extend(['salinity', 'density'])
+        elif 'hysteresis' in qc_tests and '_hysteresis_test' in qv:
+            target_var = [qv.split('_hysteresis_test')[0], 'salinity', 'density']
+        else:
+            continue
+        qc_targets[qv] = [tv for tv in target_var if tv in dataset.variables]
+
+    # evaluate each flag variable once and combine the results for each target variable
+    masks = dict()
+    for qv, target_var in qc_targets.items():
+        if len(target_var) == 0:
+            continue
+        qc_mask = np.isin(dataset[qv].data, flag_values)
+        for tv in target_var:
+            if tv in masks:
+                masks[tv] |= qc_mask
+            else:
+                masks[tv] = qc_mask.copy()
+
+    return masks
+
+
+def compute_counts(counts):
+    '''
+    Convert a dictionary of counts to integers. Lazy (dask) counts are computed together so the data
+    are only read once
+    counts: dictionary of name: count (integer or dask array)
+    '''
+    lazy = [k for k, v in counts.items() if hasattr(v, 'dask')]
+    if len(lazy) > 0:
+        import dask
+        computed = dask.compute(*[counts[k] for k in lazy])
+        counts = dict(counts)
+        counts.update(zip(lazy, computed))
 
-    return list(var_dict.keys())
+    return {k: int(v) for k, v in counts.items()}
 
 
-def interpolate_depth(dataset):
+def concat_erddap_nc(datasets, obs_dim='obs'):
+    '''
+    Concatenate contiguous ragged array (ncCF) datasets downloaded from ERDDAP in separate time windows.
+    Observation variables are concatenated along the obs dimension and profile/trajectory variables along
+    their own dimensions. Profiles/trajectories that were split across time windows are merged back
+    together (the sample counts e.g. rowSize are summed)
+    datasets: list of xarray datasets, in time order
+    obs_dim: name of the observation dimension
+    '''
+    datasets = [x for x in datasets if x is not None]
+    if len(datasets) == 0:
+        raise(ValueError('No data returned for any of the time windows'))
+    if len(datasets) == 1:
+        return datasets[0]
+
+    parts = []
+    for dim in datasets[0].dims:
+        names = [v for v in datasets[0].variables if datasets[0][v].dims[:1] == (dim,)]
+        if len(names) == 0:
+            continue
+        parts.append(xr.concat([x[names] for x in datasets], dim=dim, data_vars='all', coords='minimal',
+                               compat='override', join='outer', combine_attrs='override'))
+    ds = xr.merge(parts, compat='override', join='outer', combine_attrs='override')
+    ds.attrs = datasets[0].attrs
+
+    # merge profiles/trajectories that were split between consecutive time windows
+    for dim in ds.dims:
+        if dim == obs_dim:
+            continue
+        id_vars = [v for v in ds.variables if ds[v].dims == (dim,) and 'cf_role' in ds[v].attrs]
+        if len(id_vars) == 0:
+            continue
+        ids = ds[id_vars[0]].values
+        keep = np.concatenate(([True], ids[1:] != ids[:-1]))
+        if np.all(keep):
+            continue
+        starts = np.flatnonzero(keep)
+        count_vars = [v for v in ds.variables if ds[v].dims == (dim,) and 'sample_dimension' in ds[v].attrs]
+        counts = {v: np.add.reduceat(ds[v].values, starts) for v in count_vars}
+        ds = ds.isel({dim: starts})
+        for v, c in counts.items():
+            ds[v].values = c.astype(ds[v].dtype)
+
+    for v in ds.variables:
+        ds[v].encoding = datasets[0][v].encoding
+
+    return ds
+
+
+def get_dataset_time_range(server, ds_id, ttl_hours=24):
+    '''
+    Get the time range of an ERDDAP dataset from the actual_range attribute of the time variable in the local
+    dataset catalog (see catalog.py)
+    server: ERDDAP server url
+    ds_id: dataset ID
+    ttl_hours: number of hours before the catalog entry is refreshed
+    Returns start and end times as pandas Timestamps (UTC)
+    '''
+    metadata = catalog.get_dataset_metadata(server, ds_id, ttl_hours=ttl_hours)
+    t0, t1 = [float(x) for x in metadata['variables']['time']['actual_range'].split(',')]
+
+    return pd.to_datetime(t0, unit='s', utc=True), pd.to_datetime(t1, unit='s', utc=True)
+
+
+def get_dataset_variables(server, dataset_id, ttl_hours=24):
+    '''
+    Get the list of variables in an ERDDAP dataset from the local dataset catalog (see catalog.py).
+    The catalog entry is refreshed from ERDDAP if it's missing or older than ttl_hours
+    server: ERDDAP server url
+    dataset_id: dataset ID
+    ttl_hours: number of hours before the catalog entry is refreshed
+    '''
+    return list(catalog.get_dataset_variables(server, dataset_id, ttl_hours=ttl_hours))
+
+
+def interpolate_depth(dataset, profile_var=None):
     '''
     Interpolate depth variable in an xarray dataset.
     This function applies QARTOD QC to the depth variable, converts any failed (4) QC flags to NaN,
-    and then performs linear interpolation on the depth values using pandas.DataFrame.interpolate.
+    and then performs linear interpolation on the depth values (gaps of up to 2 data points are filled from
+    each side, the same as pandas.DataFrame.interpolate with limit=2 and limit_direction='both').
     The interpolated depth is added to the dataset as a new DataArray named 'depth_interpolated'.
     dataset: xarray dataset containing a 'depth' variable
+    profile_var: optional profile variable (e.g. 'profile_time'). If provided, gaps aren't interpolated across
+    profile boundaries
     '''
     
     # apply pressure QARTOD QC to depth. convert fail (4) QC flags to nan
-    depthcopy = dataset.depth.copy()
+    depth_interp = dataset.depth.values.copy()
     for qv in [x for x in dataset.data_vars if 'pressure_qartod' in x]:
-        qv_vals = dataset[qv].values
-        qv_idx = np.where(qv_vals == 4)[0]
-        depthcopy[qv_idx] = np.nan
+        depth_interp[dataset[qv].values == 4] = np.nan
     
     # interpolate depth
-    df = depthcopy.to_dataframe()
-    # Drop the duplicate 'depth' column if it exists
-    df = df.loc[:, ~df.columns.duplicated()]
-    depth_interp = df['depth'].interpolate(method='linear', limit_direction='both', limit=2).values
+    segments = dataset[profile_var].values if profile_var else None
+    interpolate_gaps(depth_interp, limit=2, limit_direction='both', segments=segments)
 
     attrs = dataset.depth.attrs.copy()
     attrs['ancillary_variables'] = f'{attrs["ancillary_variables"]} depth'
@@ -137,7 +293,122 @@ def interpolate_depth(dataset):
     dataset['depth_interpolated'] = da
 
 
-def return_erddap_nc(server, ds_id, variables=None, constraints=None):
+def interpolate_gaps(values, limit=None, limit_direction='forward', segments=None):
+    '''
+    Linear interpolation of NaN gaps in a 1D array, in place. Matches pandas.Series.interpolate(method='linear')
+    with the limit and limit_direction options: a NaN is filled if it's within limit data points after the
+    previous valid value (forward) and/or before the next valid value (backward), and NaNs at the beginning or
+    end of the array (or segment) are filled with the nearest valid value
+    values: 1D numpy float array, modified in place
+    limit: maximum number of consecutive NaNs to fill from each direction, None to fill all NaNs
+    limit_direction: 'forward', 'backward' or 'both'
+    segments: optional array of labels (e.g. profile_time) the same length as values. Gaps aren't
+    interpolated across changes in the label
+    Returns the interpolated array
+    '''
+    if limit_direction not in ['forward', 'backward', 'both']:
+        raise(ValueError(f'Invalid limit_direction: {limit_direction}. Valid options are "forward", "backward" or "both"'))
+
+    invalid = np.isnan(values)
+    if not np.any(invalid):
+        return values
+
+    n = len(values)
+    idx = np.arange(n)
+    if segments is None:
+        seg_start = np.zeros(n, dtype=int)
+        seg_stop = np.full(n, n)
+    else:
+        segments = np.asarray(segments)
+        change = np.r_[True, segments[1:] != segments[:-1]]
+        starts = np.flatnonzero(change)
+        stops = np.r_[starts[1:], n]
+        seg_id = np.cumsum(change) - 1
+        seg_start = starts[seg_id]
+        seg_stop = stops[seg_id]
+
+    # previous and next valid data point for each position (within the same segment)
+    prev_valid = np.maximum.accumulate(np.where(invalid, -1, idx))
+    next_valid = np.minimum.accumulate(np.where(invalid, n, idx)[::-1])[::-1]
+    has_prev = prev_valid >= seg_start
+    has_next = next_valid < seg_stop
+
+    limit = n if limit is None else limit
+    fill_fw = has_prev & (idx - prev_valid <= limit)
+    fill_bw = has_next & (next_valid - idx <= limit)
+    if limit_direction == 'forward':
+        fill = invalid & fill_fw
+    elif limit_direction == 'backward':
+        fill = invalid & fill_bw
+    else:
+        fill = invalid & (fill_fw | fill_bw)
+
+    # interpolate between the previous and next valid values (same formula as numpy.interp), or use the
+    # nearest valid value at the beginning/end of the array (or segment)
+    i = idx[fill]
+    i0 = prev_valid[fill]
+    i1 = next_valid[fill]
+    both = has_prev[fill] & has_next[fill]
+    y = values.astype(np.float64)
+    filled = np.where(has_prev[fill], y[np.maximum(i0, 0)], y[np.minimum(i1, n - 1)])
+    x0, x1 = i0[both], i1[both]
+    slope = (y[x1] - y[x0]) / (x1 - x0)
+    filled[both] = slope * (i[both] - x0) + y[x0]
+    values[fill] = filled
+
+    return values
+
+
+def pop_window_bounds(constraints):
+    '''
+    Take the time range to split into time windows out of a dictionary of ERDDAP constraints. Only inclusive
+    bounds (time>= and time<=) are supported, since each window sets its own time constraints
+    constraints: dictionary of ERDDAP constraints, modified in place
+    Returns the start and end times (None if not constrained). Raises a ValueError if the constraints have a
+    time> or time< bound
+    '''
+    strict = [k for k in ('time>', 'time<') if k in constraints]
+    if len(strict) > 0:
+        raise(ValueError(f'Time constraints {strict} are not supported when downloading in time windows, '
+                         f'use time>= and time<='))
+
+    return constraints.pop('time>=', None), constraints.pop('time<=', None)
+
+
+def return_erddap_nc(server, ds_id, variables=None, constraints=None, window=None, max_workers=4, retries=3):
+    '''
+    Download a tabledap dataset from ERDDAP as an xarray dataset sorted by time. The sortedness marker attribute
+    is added to the dataset so the sort can be skipped when the file is loaded again (see sort_dataset)
+    server: ERDDAP server url
+    ds_id: dataset ID
+    variables: optional list of variables to download
+    constraints: optional dictionary of ERDDAP constraints, e.g. {'time>=': '2024-04-29T00:00:00Z'}
+    window: optional time window length (pandas frequency string, e.g. '7D'). If provided, the request is split
+    into time windows that are downloaded concurrently and concatenated in time order. The time range is taken
+    from the time>= and time<= constraints (a ValueError is raised for time> or time<)
+    max_workers: maximum number of concurrent requests when downloading in time windows
+    retries: number of times to retry a time window that fails to download
+    '''
+    if window:
+        constraints = dict(constraints or {})
+        t0, t1 = pop_window_bounds(constraints)
+        if t0 is None or t1 is None:
+            ds_t0, ds_t1 = get_dataset_time_range(server, ds_id)
+            t0 = t0 or ds_t0
+            t1 = t1 or ds_t1
+        windows = time_windows(t0, t1, window)
+
+        kwargs = dict(variables=variables, constraints=constraints, retries=retries)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(return_erddap_window, server, ds_id, w0, w1, last=(i == len(windows) - 1),
+                                       **kwargs) for i, (w0, w1) in enumerate(windows)]
+            pieces = [f.result() for f in futures]
+
+        # each piece is sorted by time and the windows are in time order, so the full dataset doesn't need to be sorted
+        ds = concat_erddap_nc(pieces)
+        ds.attrs[SORTED_BY_ATTR] = 'time'
+        return ds
+
     e = ERDDAP(server=server,
                protocol='tabledap',
                response='nc')
@@ -150,6 +421,46 @@ def return_erddap_nc(server, ds_id, variables=None, constraints=None):
     
     ds = e.to_xarray(requests_kwargs={"timeout": 600})  # increase timeout to 10 minutes
     ds = ds.sortby(ds.time)
+    ds.attrs[SORTED_BY_ATTR] = 'time'
+    return ds
+
+
+def return_erddap_window(server, ds_id, t0, t1, variables=None, constraints=None, last=False, retries=3):
+    '''
+    Download one time window (t0 <= time < t1) of a tabledap dataset from ERDDAP, sorted by time.
+    Failed requests (see DOWNLOAD_ERRORS) are retried with an increasing wait time between attempts, other errors
+    are raised right away
+    server: ERDDAP server url
+    ds_id: dataset ID
+    t0: start of the time window
+    t1: end of the time window
+    variables: optional list of variables to download
+    constraints: optional dictionary of additional ERDDAP constraints
+    last: if True, the end of the time window is included (time <= t1)
+    retries: number of times to retry the request if it fails
+    Returns None if there are no data in the time window
+    '''
+    window_constraints = dict(constraints or {})
+    window_constraints['time>='] = t0
+    if last:
+        window_constraints['time<='] = t1
+    else:
+        window_constraints['time<'] = t1
+
+    for attempt in range(retries + 1):
+        try:
+            ds = return_erddap_nc(server, ds_id, variables=variables, constraints=window_constraints)
+            break
+        except DOWNLOAD_ERRORS as err:
+            # ERDDAP returns a 404 error if there are no data in the time window
+            response = getattr(err, 'response', None)
+            if getattr(response, 'status_code', None) == 404 or 'no matching results' in str(err):
+                return None
+            if attempt == retries:
+                raise
+            print(f'Download failed for {ds_id} {t0} to {t1}: {err!r}. Retrying')
+            time.sleep(2 ** attempt)
+
     return ds
 
 
@@ -173,4 +484,46 @@ def set_encoding(data_array, original_encoding=None):
     except KeyError:
         # set the fill value using netCDF4.default_fillvals
         data_type = f'{data_array.dtype.kind}{data_array.dtype.itemsize}'
-        data_array.encoding['_FillValue'] = default_fillvals[data_type]
\ No newline at end of file
+        data_array.encoding['_FillValue'] = default_fillvals[data_type]
+
+
+def sort_dataset(dataset, var='time'):
+    '''
+    Sort a dataset by a variable, only if it isn't already sorted. The sortedness marker attribute written when
+    the dataset was downloaded is trusted, otherwise the variable is checked in O(n), so the O(n log n) sort and
+    full copy of the dataset are skipped when the data are already in order
+    dataset: xarray dataset
+    var: variable to sort by, e.g. 'time' or 'profile_time'
+    Returns the sorted dataset, with the sortedness marker attribute set
+    '''
+    if dataset.attrs.get(SORTED_BY_ATTR) != var:
+        try:
+            index = dataset.indexes[var]
+        except KeyError:
+            index = pd.Index(dataset[var].values)
+        if not index.is_monotonic_increasing:
+            dataset = dataset.sortby(dataset[var])
+        # set the marker on a shallow copy so the caller's dataset attributes aren't modified
+        dataset = dataset.assign_attrs({SORTED_BY_ATTR: var})
+
+    return dataset
+
+
+def time_windows(t0, t1, window):
+    '''
+    Split a time range into consecutive time windows
+    t0: start time
+    t1: end time
+    window: time window length (pandas frequency string, e.g. '7D')
+    Returns a list of (start, end) time strings formatted for ERDDAP constraints
+    '''
+    t0 = pd.to_datetime(t0, utc=True).floor('s')
+    t1 = pd.to_datetime(t1, utc=True).ceil('s')
+    edges = pd.date_range(t0, t1, freq=window).tolist()
+    if len(edges) == 0 or edges[-1] < t1:
+        edges.append(t1)
+    if len(edges) == 1:
+        edges.append(t1)
+
+    fmt = '%Y-%m-%dT%H:%M:%SZ'
+    return [(edges[i].strftime(fmt), edges[i + 1].strftime(fmt)) for i in range(len(edges) - 1)]
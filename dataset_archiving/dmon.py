@@ -0,0 +1,248 @@
+#! /usr/bin/env python
+
+"""
+Tools to sort DMON (WHOI Digital Acoustic Monitoring Instrument) recordings for archiving. The .xml metadata files
+written by d3read are scanned with a streaming parser that only keeps the fields needed to get the start and end
+time of each recording, and the results are cached by file modification time and size so re-runs don't parse the
+files again. Recordings are classified against the deployment windows (include, split or don't include) with
+interval arrays instead of row by row.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ET
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+DEFAULT_SCAN_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dataset_archiving', 'dmon')
+XML_FIELDS = ['TIME', 'SUFFIX', 'CUE']
+XML_SCAN_VERSION = 2  # increment when scan_xml changes, so cached results from older versions aren't used
+
+
+def _scan_entry(fname):
+    start, end = scan_xml(fname)
+    return start.isoformat(), end.isoformat()
+
+
+def classify_recordings(start, end, deployments, split_hours=6):
+    '''
+    Classify recordings against one or more deployment windows (e.g. multiple deployments recorded on one DMON
+    card) in one pass. Each recording is assigned to the deployment it overlaps the most. A recording that overlaps
+    a deployment needs to be split if it has more than split_hours of data before the deployment start
+    ('split_start') or after the deployment end ('split_end', which takes precedence if both). Recordings that
+    don't overlap any deployment are labeled 'dont include'
+    start: array of recording start times (UTC)
+    end: array of recording end times (UTC)
+    deployments: dictionary of deployment ID: (start time, end time)
+    split_hours: maximum hours of non-deployment data in a recording before it needs to be split
+    Returns a DataFrame with the deployment, split_file, deploy_start, deploy_end (the deployment start/end for
+    files that need to be split at the start/end, otherwise '') and diff_hours (hours outside of the deployment,
+    as a string) for each recording
+    '''
+    if len(deployments) == 0:
+        raise(ValueError('No deployment windows to classify the recordings'))
+
+    # times in nanoseconds, so the interval bounds can be compared as integers
+    recordings = pd.IntervalIndex.from_arrays(pd.DatetimeIndex(pd.to_datetime(start, utc=True)).as_unit('ns'),
+                                              pd.DatetimeIndex(pd.to_datetime(end, utc=True)).as_unit('ns'),
+                                              closed='both')
+    windows = pd.IntervalIndex.from_arrays(pd.DatetimeIndex([t[0] for t in deployments.values()]).as_unit('ns'),
+                                           pd.DatetimeIndex([t[1] for t in deployments.values()]).as_unit('ns'),
+                                           closed='both')
+    rec_left = recordings.left.asi8
+    rec_right = recordings.right.asi8
+
+    # overlap (ns) of each recording with each deployment window, -1 if they don't overlap
+    overlap = np.full((len(recordings), len(windows)), -1, dtype='int64')
+    for j, window in enumerate(windows):
+        overlaps = recordings.overlaps(window)
+        overlap[overlaps, j] = (np.minimum(rec_right, window.right.value) -
+                                np.maximum(rec_left, window.left.value))[overlaps]
+    included = (overlap >= 0).any(axis=1)
+    idx = overlap.argmax(axis=1)  # deployment with the most overlap
+
+    hours_before = (windows.left.asi8[idx] - rec_left) / 1e9 / 60 / 60
+    hours_after = (rec_right - windows.right.asi8[idx]) / 1e9 / 60 / 60
+    before = included & (hours_before > 0)
+    after = included & (hours_after > 0)
+    split_start = before & (hours_before > split_hours)
+    split_end = after & (hours_after > split_hours)
+
+    split_file = np.where(split_end, 'split_end', np.where(split_start, 'split_start', ''))
+    diff_hours = np.where(after, hours_after, np.where(before, hours_before, 0))
+    deploy_start = np.full(len(recordings), '', dtype=object)
+    deploy_start[split_start] = list(windows.left[idx[split_start]])
+    deploy_end = np.full(len(recordings), '', dtype=object)
+    deploy_end[split_end] = list(windows.right[idx[split_end]])
+
+    df = pd.DataFrame(dict(deployment=np.where(included, np.array(list(deployments.keys()), dtype=object)[idx], ''),
+                           split_file=np.where(included, split_file, 'dont include'),
+                           deploy_start=pd.Series(deploy_start, dtype=object),
+                           deploy_end=pd.Series(deploy_end, dtype=object),
+                           diff_hours=[str(np.round(x, 2)) if x else '0' for x in diff_hours]))
+
+    return df
+
+
+def match_prefixes(files, prefixes):
+    '''
+    Files whose names start with any of the prefixes, found with a sorted index of the file names instead of
+    scanning all of the files for each prefix
+    files: list of file names
+    prefixes: list of prefixes, e.g. the names of the original files (without the extension) that were split
+    Returns a sorted list of the matching files
+    '''
+    sorted_files = sorted(files)
+    matches = set()
+    for prefix in prefixes:
+        i = bisect_left(sorted_files, prefix)
+        while i < len(sorted_files) and sorted_files[i].startswith(prefix):
+            matches.add(sorted_files[i])
+            i += 1
+
+    return sorted(matches)
+
+
+def parse_split_times(files):
+    '''
+    Timestamps (to the second) of split DMON files, from the file names in the format *_YYYYMMDDhhmmss_uuuuuu.wav
+    where uuuuuu is microseconds
+    files: list of file names
+    Returns a pandas DatetimeIndex (UTC)
+    '''
+    stamps = [f.split('_')[-2] for f in files]
+
+    return pd.DatetimeIndex(pd.to_datetime(stamps, format='%Y%m%d%H%M%S', utc=True))
+
+
+def parse_xml_time(timestr):
+    '''
+    Parse a timestamp from a DMON .xml file, in the format YYYY,MM,DD,hh,mm,ss (seconds can have decimals)
+    Returns a pandas Timestamp (UTC)
+    '''
+    parts = timestr.split(',')
+    if len(parts) != 6:
+        raise(ValueError(f'Invalid DMON xml time: {timestr}'))
+    seconds = float(parts[5])
+    t = dt.datetime(*[int(x) for x in parts[0:5]]) + dt.timedelta(seconds=seconds)
+
+    return pd.Timestamp(t, tz='UTC')
+
+
+def scan_xml(fname):
+    '''
+    Get the start and end time of a DMON recording from its .xml metadata file, without loading the whole file.
+    Each element directly under the root is a record, and only the TIME, SUFFIX and CUE fields (attributes or
+    child elements) of the records are kept. The start time is the TIME of the wav record with a CUE, and the end
+    time is assumed to be the maximum TIME in the file
+    fname: .xml file
+    Returns the start and end times as pandas Timestamps (UTC), not rounded
+    '''
+    start = []
+    end = None
+    depth = 0
+    record = dict()
+    for event, elem in ET.iterparse(fname, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                record = {k: v for k, v in elem.attrib.items() if k in XML_FIELDS}
+            continue
+
+        if depth == 3 and elem.tag in XML_FIELDS and elem.text and elem.text.strip():
+            record[elem.tag] = elem.text.strip()
+        elif depth == 2:
+            if record.get('TIME'):
+                ts = parse_xml_time(record['TIME'])
+                end = ts if end is None else max(end, ts)
+                if record.get('SUFFIX') == 'wav' and record.get('CUE') and not pd.isna(float(record['CUE'])):
+                    start.append(ts)
+            elem.clear()
+        depth -= 1
+
+    if len(start) != 1:
+        raise(ValueError(f'Expected one wav CUE record in {fname}, found {len(start)}'))
+
+    return start[0], end
+
+
+def scan_xml_files(files, cachedir=None, max_workers=None, processes=True):
+    '''
+    Get the start and end time of DMON recordings from their .xml metadata files (see scan_xml). The files are
+    scanned in parallel, and the results are cached by the file modification time and size so only new or
+    changed files are scanned on re-runs (the cache is versioned with XML_SCAN_VERSION)
+    files: list of .xml files
+    cachedir: optional cache directory, default is ~/.cache/dataset_archiving/dmon
+    max_workers: optional number of processes (or threads)
+    processes: scan the files on a process pool, or a thread pool if False
+    Returns a DataFrame with the filename, start_time and end_time (rounded to the nearest second) and the exact
+    CUE time (cue_time, the start of the recording to cut it at given times) of each file (in the same order as
+    files)
+    '''
+    cachedir = cachedir or DEFAULT_SCAN_DIR
+    files = [os.path.abspath(f) for f in files]
+    dirhash = hashlib.sha1('|'.join(sorted(set(os.path.dirname(f) for f in files))).encode()).hexdigest()[:12]
+    cachefile = os.path.join(cachedir, f'xml_scan-v{XML_SCAN_VERSION}-{dirhash}.json')
+    try:
+        with open(cachefile) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = dict()
+    if cache.get('version') != XML_SCAN_VERSION:
+        cache = dict(version=XML_SCAN_VERSION, files=dict())
+
+    keys = dict()
+    for f in files:
+        st = os.stat(f)
+        keys[f] = [st.st_mtime_ns, st.st_size]
+    scanned = cache['files']
+    to_scan = [f for f in files if f not in scanned or scanned[f]['key'] != keys[f]]
+
+    if len(to_scan) > 0:
+        pool = ProcessPoolExecutor if processes and len(to_scan) > 1 else ThreadPoolExecutor
+        with pool(max_workers=max_workers) as executor:
+            chunksize = max(1, len(to_scan) // (4 * (max_workers or os.cpu_count() or 1)))
+            kwargs = dict(chunksize=chunksize) if pool is ProcessPoolExecutor else dict()
+            for f, (start, end) in zip(to_scan, executor.map(_scan_entry, to_scan, **kwargs)):
+                scanned[f] = dict(key=keys[f], start_time=start, end_time=end)
+
+        os.makedirs(cachedir, exist_ok=True)
+        tmpfile = f'{cachefile}.{os.getpid()}.tmp'
+        with open(tmpfile, 'w') as fp:
+            json.dump(cache, fp)
+        os.replace(tmpfile, cachefile)
+
+    cue_time = pd.to_datetime([scanned[f]['start_time'] for f in files], utc=True)
+    df = pd.DataFrame(dict(filename=[os.path.basename(f) for f in files],
+                           start_time=cue_time.round('s'),
+                           end_time=pd.to_datetime([scanned[f]['end_time'] for f in files], utc=True).round('s'),
+                           cue_time=cue_time))
+
+    return df
+
+
+def select_split_files(files, deployment_start, deployment_end, split_start=False):
+    '''
+    Select the split DMON files (e.g. from Mark Baumgartner's reformat_dmon_wav_files.sav program) to archive: the
+    files whose timestamps (see parse_split_times) are within the deployment. If the recording at the beginning of
+    the deployment was split, the file before the first file within the deployment is also selected (it starts
+    before the deployment start, so it presumably contains deployment data)
+    files: list of split file names, sorted in chronological order
+    deployment_start: deployment start time (UTC)
+    deployment_end: deployment end time (UTC)
+    split_start: True if the recording at the beginning of the deployment was split
+    Returns a boolean array, True for the files to archive
+    '''
+    ts = parse_split_times(files)
+    in_deployment = np.asarray((ts <= deployment_end) & (ts >= deployment_start))
+
+    if split_start and np.any(in_deployment):
+        first = np.argmax(in_deployment)
+        if first > 0:
+            in_deployment[first - 1] = True
+
+    return in_deployment
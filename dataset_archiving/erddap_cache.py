@@ -0,0 +1,249 @@
+#! /usr/bin/env python
+
+"""
+On-disk cache for ERDDAP tabledap downloads. Datasets are downloaded in time windows and each window is saved
+to the cache directory, with a manifest of the completed time windows and the variables they contain. Re-runs
+only download the time windows or variables that are missing from the cache. Time windows that overlap the most
+recent days of the dataset (which can still be added to or reprocessed) and time windows that had no data are
+downloaded again once they're older than a time-to-live. The cache directory is kept under a maximum size by
+evicting the least recently used datasets.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+import dataset_archiving.common as cf
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dataset_archiving', 'erddap')
+
+
+def cache_entry_dir(cachedir, server, ds_id, constraints=None):
+    '''
+    Cache directory for a dataset request, keyed by the ERDDAP server, dataset ID and constraints
+    (the variables are tracked per time window in the manifest)
+    '''
+    key = json.dumps(dict(server=server.rstrip('/'), dataset_id=ds_id, constraints=constraints or {}),
+                     sort_keys=True, default=str)
+    keyhash = hashlib.sha1(key.encode()).hexdigest()[:12]
+
+    return os.path.join(cachedir, f'{ds_id}-{keyhash}')
+
+
+def cache_size(cachedir):
+    '''
+    Total size of the files in a directory (bytes)
+    '''
+    size = 0
+    for root, dirs, files in os.walk(cachedir):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                continue
+
+    return size
+
+
+def clear_erddapy_cache():
+    '''
+    Clear the in-memory cache of ERDDAP responses kept by erddapy (if the installed version has one)
+    '''
+    try:
+        from erddapy.core.url import _urlopen
+        _urlopen.cache_clear()
+    except (ImportError, AttributeError):
+        pass
+
+
+def evict_cache(cachedir, max_bytes, keep=None):
+    '''
+    Delete the least recently used cached datasets until the cache directory is smaller than max_bytes
+    cachedir: cache directory
+    max_bytes: maximum size of the cache directory (bytes)
+    keep: optional cache entry directory that shouldn't be deleted (e.g. the dataset currently being processed)
+    Returns a list of the deleted cache entry directories
+    '''
+    entries = []
+    for d in os.listdir(cachedir):
+        entry = os.path.join(cachedir, d)
+        if not os.path.isdir(entry):
+            continue
+        manifest = load_manifest(entry)
+        entries.append([manifest.get('last_access', ''), entry, cache_size(entry)])
+
+    total = sum([x[2] for x in entries])
+    deleted = []
+    for last_access, entry, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep and os.path.abspath(entry) == os.path.abspath(keep):
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        deleted.append(entry)
+        print(f'Evicted {entry} from the cache')
+
+    return deleted
+
+
+def load_manifest(entry):
+    '''
+    Load the manifest of completed time windows for a cache entry
+    '''
+    try:
+        with open(os.path.join(entry, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict(windows=dict())
+
+
+def save_manifest(entry, manifest):
+    '''
+    Save the manifest for a cache entry (written to a temporary file first so an interrupted run
+    doesn't leave a corrupt manifest)
+    '''
+    manifest['last_access'] = dt.datetime.now(dt.UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+    tmpfile = os.path.join(entry, 'manifest.json.tmp')
+    with open(tmpfile, 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(tmpfile, os.path.join(entry, 'manifest.json'))
+
+
+def return_cached_erddap_nc(server, ds_id, variables, constraints=None, window='7D', cachedir=None,
+                            max_cache_gb=20, max_workers=4, retries=3, ttl_hours=24, recent_days=30, refresh=False):
+    '''
+    Download a tabledap dataset from ERDDAP in time windows using an on-disk cache. Time windows that are
+    already in the cache aren't downloaded again, and if variables were added to the request only those
+    variables are downloaded and merged into the cached time windows. Cached time windows that overlap the last
+    recent_days days or had no data expire after ttl_hours (see window_expired)
+    server: ERDDAP server url
+    ds_id: dataset ID
+    variables: list of variables to download
+    constraints: optional dictionary of ERDDAP constraints, e.g. {'time>=': '2024-04-29T00:00:00Z'}
+    window: time window length (pandas frequency string, e.g. '7D')
+    cachedir: cache directory, default is ~/.cache/dataset_archiving/erddap
+    max_cache_gb: maximum size of the cache directory (GB), least recently used datasets are evicted
+    max_workers: maximum number of concurrent requests
+    retries: number of times to retry a time window that fails to download
+    ttl_hours: number of hours before a recent or empty cached time window is downloaded again
+    recent_days: time windows that end within this many days of the current time are recent
+    refresh: if True, download all of the time windows again (and refresh the dataset time range)
+    Returns an xarray dataset sorted by time
+    '''
+    cachedir = cachedir or DEFAULT_CACHE_DIR
+    constraints = dict(constraints or {})
+    entry = cache_entry_dir(cachedir, server, ds_id, constraints)
+    os.makedirs(entry, exist_ok=True)
+
+    # erddapy also keeps recent responses in memory, which would return the same data for expired or refreshed
+    # time windows that are requested again in the same session
+    clear_erddapy_cache()
+
+    manifest = load_manifest(entry)
+    manifest.update(server=server, dataset_id=ds_id, constraints=dict(constraints))
+    lock = threading.Lock()
+
+    t0, t1 = cf.pop_window_bounds(constraints)
+    if t0 is None or t1 is None:
+        ds_t0, ds_t1 = cf.get_dataset_time_range(server, ds_id, ttl_hours=0 if refresh else ttl_hours)
+        t0 = t0 or ds_t0
+        t1 = t1 or ds_t1
+    windows = cf.time_windows(t0, t1, window)
+
+    def fetch_window(i, w0, w1):
+        key = f'{w0}_{w1}'
+        record = manifest['windows'].get(key)
+        kwargs = dict(constraints=constraints, last=(i == len(windows) - 1), retries=retries)
+        if record and (refresh or window_expired(record, w1, ttl_hours=ttl_hours, recent_days=recent_days)):
+            record = None
+        if record and record['empty']:
+            return None
+
+        if record:
+            cached_vars = set(record['variables'])
+            missing_vars = [x for x in variables if x not in cached_vars]
+            filename = os.path.join(entry, record['file'])
+            if len(missing_vars) == 0 and os.path.isfile(filename):
+                return filename
+
+            if os.path.isfile(filename):
+                # only download the missing variables and merge them into the cached time window
+                new = cf.return_erddap_window(server, ds_id, w0, w1, variables=['time'] + missing_vars, **kwargs)
+                cached = xr.load_dataset(filename)
+                if new is not None and np.array_equal(cached.time.values, new.time.values):
+                    new_vars = [x for x in new.data_vars if x not in cached.variables]
+                    ds = cached.merge(new[new_vars], compat='override')
+                    print(f'Added {len(new_vars)} variables to cached time window {w0} to {w1}')
+                    return save_window(key, ds, sorted(cached_vars.union(missing_vars)), record.get('downloaded'))
+
+        # download the full time window
+        ds = cf.return_erddap_window(server, ds_id, w0, w1, variables=variables, **kwargs)
+        print(f'Downloaded time window {w0} to {w1}')
+        return save_window(key, ds, variables)
+
+    def save_window(key, ds, window_vars, downloaded=None):
+        # downloaded is the time the data in the window were downloaded, kept when variables are added
+        downloaded = downloaded or dt.datetime.now(dt.UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+        record = dict(file=f'window_{key.replace(":", "")}.nc', variables=list(window_vars), empty=ds is None,
+                      downloaded=downloaded)
+        if ds is not None:
+            tmpfile = os.path.join(entry, f'{record["file"]}.tmp')
+            ds.to_netcdf(tmpfile)
+            os.replace(tmpfile, os.path.join(entry, record['file']))
+        with lock:
+            manifest['windows'][key] = record
+            save_manifest(entry, manifest)
+
+        return None if ds is None else os.path.join(entry, record['file'])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fetch_window, i, w0, w1) for i, (w0, w1) in enumerate(windows)]
+        files = [f.result() for f in futures]
+
+    # only return the requested variables (and the variables that describe the ragged array structure)
+    pieces = []
+    for f in files:
+        if f is None:
+            continue
+        ds = xr.load_dataset(f)
+        drop_vars = [x for x in ds.data_vars if 'obs' in ds[x].dims and x not in variables]
+        pieces.append(ds.drop_vars(drop_vars))
+
+    save_manifest(entry, manifest)
+    evict_cache(cachedir, max_cache_gb * 1e9, keep=entry)
+
+    # the cached time windows are each sorted by time and are in time order
+    ds = cf.concat_erddap_nc(pieces)
+    ds.attrs[cf.SORTED_BY_ATTR] = 'time'
+
+    return ds
+
+
+def window_expired(record, w1, ttl_hours=24, recent_days=30, now=None):
+    '''
+    Check if a cached time window needs to be downloaded again. Windows that had no data, or that end within
+    recent_days of the current time (data can still be added to or reprocessed on the server), expire once they
+    were downloaded more than ttl_hours ago. Older windows with data don't expire. Windows cached without a
+    download time are treated as expired if they're recent or empty
+    record: time window record from the cache manifest
+    w1: end of the time window
+    ttl_hours: number of hours before a recent or empty time window expires
+    recent_days: time windows that end within this many days of the current time are recent
+    now: optional current time (UTC), default is the current time
+    '''
+    now = pd.to_datetime(now or dt.datetime.now(dt.UTC), utc=True)
+    if not record['empty'] and pd.to_datetime(w1, utc=True) < now - pd.Timedelta(days=recent_days):
+        return False
+
+    downloaded = record.get('downloaded')
+    if downloaded is None:
+        return True
+
+    return now - pd.to_datetime(downloaded, utc=True) > pd.Timedelta(hours=ttl_hours)
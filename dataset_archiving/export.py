@@ -0,0 +1,251 @@
+#! /usr/bin/env python
+
+"""
+Export the final archive files for a dataset: the full netCDF file, a small sample netCDF file for the IOOS
+compliance checker and the csv files for the archive submission, written from one materialized pass of the
+dataset. The compression and chunking of the netCDF files are set by the named encoding profiles in
+configs/encoding_profiles.yml.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import yaml
+import dataset_archiving.profiles as prof
+
+
+def apply_encoding_profile(dataset, profile, dim='time', profile_var='profile_time'):
+    '''
+    Update the encoding of each variable in a dataset with the compression and chunking from an encoding profile.
+    The rest of the encoding (e.g. dtype, _FillValue, units) is kept
+    dataset: xarray dataset
+    profile: encoding profile (dictionary) from load_encoding_profile
+    dim: record dimension the chunks are defined along
+    profile_var: profile time variable, used for chunks aligned to the profiles
+    '''
+    for v, encoding in profile_encoding(dataset, profile, dim, profile_var).items():
+        dataset[v].encoding.pop('contiguous', None)
+        dataset[v].encoding.update(encoding)
+
+
+def instrument_table(dataset):
+    '''
+    Table of the instrument metadata (maker, model, serial number, calibration date and coefficients) from the
+    instrument_ variables in a dataset
+    dataset: xarray dataset
+    '''
+    instrument_vars = [x for x in list(dataset.data_vars) if 'instrument_' in x]
+
+    vardict = dict(name=instrument_vars,
+                   maker=[],
+                   model=[],
+                   sn=[],
+                   cal_date=[],
+                   calibration_coeffs=[]
+                   )
+
+    for iv in instrument_vars:
+        try:
+            vardict['maker'].append(dataset[iv].attrs['maker'])
+            vardict['model'].append(dataset[iv].attrs['model'])
+        except KeyError:
+            vardict['maker'].append(dataset[iv].attrs['make_model'])
+            vardict['model'].append(dataset[iv].attrs['make_model'])
+        vardict['sn'].append(dataset[iv].attrs['serial_number'])
+        vardict['cal_date'].append(dataset[iv].attrs['calibration_date'])
+        try:
+            vardict['calibration_coeffs'].append(dataset[iv].attrs['calibration_coefficients'])
+        except KeyError:
+            vardict['calibration_coeffs'].append('')
+
+    return pd.DataFrame(vardict)
+
+
+def load_encoding_profile(configdir, name):
+    '''
+    Load a named encoding profile from the encoding_profiles.yml config file
+    configdir: directory containing encoding_profiles.yml
+    name: encoding profile, e.g. 'fast-write', 'small-archive', 'read-optimized'
+    '''
+    with open(os.path.join(configdir, 'encoding_profiles.yml')) as f:
+        profiles = yaml.safe_load(f)
+
+    try:
+        return profiles[name]
+    except KeyError:
+        raise(ValueError(f'Invalid encoding profile: {name}. Options are {list(profiles.keys())}'))
+
+
+def merge_profile_encoding(encoding, profile_encoding):
+    '''
+    Merge the compression and chunking encoding from an encoding profile (see profile_encoding) into an explicit
+    encoding dictionary for to_netcdf. Explicit per-variable settings take precedence over the profile, and
+    variables that are explicitly uncompressed (zlib=False) don't get the profile's compression settings
+    encoding: dictionary of variable: encoding
+    profile_encoding: dictionary of variable: encoding from profile_encoding
+    Returns the merged dictionary of variable: encoding
+    '''
+    merged = dict(encoding)
+    for k, enc in profile_encoding.items():
+        explicit = encoding.get(k, dict())
+        if explicit.get('zlib') is False:
+            enc = {x: v for x, v in enc.items() if x not in ['complevel', 'shuffle']}
+        merged[k] = {**enc, **explicit}
+
+    return merged
+
+
+def profile_chunks(dataset, profile, dim='time', profile_var='profile_time'):
+    '''
+    Chunk size along the record dimension for an encoding profile
+    dataset: xarray dataset
+    profile: encoding profile (dictionary) from load_encoding_profile
+    dim: record dimension
+    profile_var: profile time variable, used for chunks aligned to the profiles
+    '''
+    size = dataset.sizes[dim]
+    chunks = profile.get('chunks')
+    if chunks == 'profile':
+        if profile_var in dataset and dataset[profile_var].dims == (dim,):
+            pidx = prof.ProfileIndex(dataset[profile_var].values)
+            if len(pidx) > 0:
+                chunks = int(np.median(pidx.stops - pidx.starts)) * profile.get('profiles_per_chunk', 1)
+            else:
+                chunks = size
+        else:
+            chunks = size  # no profiles, write the variables as one chunk
+
+    return max(min(int(chunks), size), 1)
+
+
+def profile_encoding(dataset, profile, dim='time', profile_var='profile_time'):
+    '''
+    Compression and chunking encoding for each numeric variable in a dataset from an encoding profile, which can
+    be merged with the rest of the encoding that's passed to to_netcdf
+    dataset: xarray dataset
+    profile: encoding profile (dictionary) from load_encoding_profile
+    dim: record dimension the chunks are defined along
+    profile_var: profile time variable, used for chunks aligned to the profiles
+    Returns a dictionary of variable: encoding
+    '''
+    chunks = profile_chunks(dataset, profile, dim, profile_var) if profile.get('chunks') else None
+
+    encoding = dict()
+    for v in dataset.variables:
+        da = dataset[v]
+        if da.ndim == 0 or da.dtype.kind not in 'biufM':
+            continue
+        encoding[v] = dict(zlib=profile.get('zlib', False),
+                           complevel=profile.get('complevel', 4) if profile.get('zlib', False) else 0,
+                           shuffle=profile.get('shuffle', False))
+        if chunks:
+            encoding[v]['chunksizes'] = tuple(chunks if d == dim else max(dataset.sizes[d], 1) for d in da.dims)
+
+    return encoding
+
+
+def unique_lonlat(lon, lat, decimals=4):
+    '''
+    Unique longitude/latitude pairs (in the order they first appear) and the bounding box, without building a
+    DataFrame. Coordinates are rounded and packed into one integer per pair so the duplicates are found with a
+    single np.unique. Missing coordinates are treated as equal to each other, the same as drop_duplicates
+    lon: array of longitudes
+    lat: array of latitudes
+    decimals: number of decimal places to round to, or None to not round the coordinates
+    Returns an array of unique [lon, lat] pairs and a dictionary with the north, south, west and east extents
+    '''
+    lonlat = np.column_stack((np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)))
+    if decimals is not None:
+        lonlat = np.round(lonlat, decimals)
+    lonlat += 0.0  # -0.0 to 0.0
+
+    keys = None
+    if decimals is not None and decimals <= 6:
+        scale = 10 ** decimals
+        valid = ~np.isnan(lonlat)
+        ints = np.where(valid, np.round(lonlat * scale), 0).astype('int64')
+        if np.all(np.abs(ints[:, 0]) <= 360 * scale) and np.all(np.abs(ints[:, 1]) <= 90 * scale):
+            # shift to non-negative integers, with one more value for missing coordinates
+            nlon = 2 * 360 * scale + 2
+            ints = np.where(valid, ints + [360 * scale, 90 * scale], [nlon - 1, 2 * 90 * scale + 1])
+            keys = ints[:, 1] * nlon + ints[:, 0]
+    if keys is None:
+        # compare the bytes of each pair
+        keys = np.ascontiguousarray(lonlat).view(np.dtype((np.void, lonlat.dtype.itemsize * 2))).ravel()
+
+    _, first = np.unique(keys, return_index=True)
+    lonlat = lonlat[np.sort(first)]
+
+    bounds = dict(north=np.nan, south=np.nan, west=np.nan, east=np.nan)
+    if np.any(~np.isnan(lonlat[:, 1])):
+        bounds.update(north=np.nanmax(lonlat[:, 1]), south=np.nanmin(lonlat[:, 1]))
+    if np.any(~np.isnan(lonlat[:, 0])):
+        bounds.update(west=np.nanmin(lonlat[:, 0]), east=np.nanmax(lonlat[:, 0]))
+
+    return lonlat, bounds
+
+
+def variables_table(dataset):
+    '''
+    Table of the units and long_name of each coordinate and data variable in a dataset
+    dataset: xarray dataset
+    '''
+    vardict = dict()
+    for v in list(dataset.coords) + list(dataset.data_vars):
+        try:
+            units = dataset[v].units
+        except AttributeError:
+            units = ''
+        vardict[v] = dict(units=units,
+                          long_name=dataset[v].long_name)
+
+    return pd.DataFrame(vardict).transpose()
+
+
+def write_archive(dataset, savefile, testfile=None, n_test=100, dim='time', values=None, sidecars=None,
+                  max_workers=None):
+    '''
+    Write the final archive netCDF file, an optional sample file with the first n_test data points (to test
+    formatting in the IOOS compliance checker https://compliance.ioos.us/index.html) and the sidecar csv files.
+    The files are written concurrently on a thread pool, except the netCDF files are written one after the other
+    on one thread (the netCDF/HDF5 library isn't thread-safe). If the dataset is lazy (dask), both netCDF files
+    and the values needed for the csv files are computed together in one pass, so the data are only read and
+    QC'd once
+    dataset: xarray dataset
+    savefile: final netCDF file
+    testfile: optional sample netCDF file
+    n_test: number of data points in the sample file
+    dim: dimension the sample is taken from, written as an unlimited dimension
+    values: optional list of variables whose values are needed to build the csv files, e.g. longitude/latitude
+    sidecars: optional function that builds the csv files. It's called with a dictionary of variable: numpy
+        array for the variables in values, and returns a dictionary of csv file: (DataFrame, to_csv kwargs)
+    max_workers: optional number of threads
+    Returns a list of the files written
+    '''
+    values = values or []
+    nc_kwargs = dict(format='NETCDF4', engine='netcdf4', unlimited_dims=[dim])
+    ncfiles = [(savefile, dataset)]
+    if testfile:
+        ncfiles.append((testfile, dataset.isel({dim: slice(0, n_test)})))
+
+    if any(dataset[v].chunks is not None for v in dataset.variables):
+        import dask
+        writes = [ds.to_netcdf(f, compute=False, **nc_kwargs) for f, ds in ncfiles]
+        computed = dask.compute(*writes, *[dataset[v].data for v in values])
+        tables = sidecars(dict(zip(values, computed[len(writes):]))) if sidecars else dict()
+        ncfiles = []
+    else:
+        tables = sidecars({v: dataset[v].values for v in values}) if sidecars else dict()
+
+    def write_ncfiles():
+        for f, ds in ncfiles:
+            ds.to_netcdf(f, **nc_kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(write_ncfiles)]
+        futures += [executor.submit(df.to_csv, f, **kwargs) for f, (df, kwargs) in tables.items()]
+        for future in futures:
+            future.result()
+
+    return [savefile] + ([testfile] if testfile else []) + list(tables.keys())
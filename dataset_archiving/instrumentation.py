@@ -0,0 +1,225 @@
+#! /usr/bin/env python
+
+"""
+Lightweight stage-level instrumentation for the processing scripts. Each stage of a script is wrapped in a span
+that records the wall time, CPU time, peak memory and bytes read/written, and the spans are summarized in a
+per-run report that is printed and saved as json. The peak memory is measured per span: on Linux the peak RSS of
+the process is reset at the start of each span (through /proc/self/clear_refs), otherwise the peak of the memory
+allocations traced by tracemalloc is used if tracemalloc is running (e.g. python -X tracemalloc). The peak RSS
+over the lifetime of the process is reported separately for the whole run.
+"""
+
+import datetime as dt
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+MEMORY_LABELS = {'rss': 'peak RSS during the stage',
+                 'tracemalloc': 'peak memory traced by tracemalloc during the stage',
+                 None: 'not available (not Linux and tracemalloc is not running)'}
+
+
+def io_counters():
+    '''
+    Bytes read and written by this process so far (Linux only, from /proc/self/io). Returns (None, None) if
+    the counters aren't available
+    '''
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def lifetime_peak_rss_mb():
+    '''
+    Peak resident set size (memory) of this process over its lifetime so far in MB (it can't be reset, so it
+    isn't the peak of a single stage). Returns None if it isn't available
+    '''
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss / 1e6  # bytes on macOS
+    return maxrss / 1e3  # kilobytes on Linux
+
+
+def memory_method():
+    '''
+    Method used to measure the peak memory of each span in this process: 'rss' if the peak RSS can be reset
+    (Linux), 'tracemalloc' if tracemalloc is tracing memory allocations, or None if the peak memory of a span can't
+    be measured
+    '''
+    if reset_peak_rss():
+        return 'rss'
+    if tracemalloc.is_tracing():
+        return 'tracemalloc'
+    return None
+
+
+def peak_rss_mb():
+    '''
+    Peak resident set size (memory) of this process in MB since it was last reset (see reset_peak_rss), from VmHWM
+    in /proc/self/status (Linux only). Returns None if it isn't available
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1e3  # kB
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def reset_peak_rss():
+    '''
+    Reset the peak resident set size of this process to the current resident set size, by writing 5 to
+    /proc/self/clear_refs (Linux 4.0 or later)
+    Returns True if the peak was reset
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return peak_rss_mb() is not None
+
+
+class RunReport:
+    '''
+    Collect stage-level timing and memory information for one run of a script
+    name: name of the script, e.g. 'phglider_to_ncei'
+    label: optional label for the run, e.g. the deployment
+    '''
+    def __init__(self, name, label=None):
+        self.name = name
+        self.label = label
+        self.started = dt.datetime.now(dt.UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+        self.spans = []
+        self.memory_method = memory_method()
+        self._stack = []
+        self._open = []  # records of the open spans, to carry the peak memory of nested spans to their parents
+        self._t0 = time.perf_counter()
+
+    def _peak_mb(self):
+        if self.memory_method == 'rss':
+            return peak_rss_mb()
+        if self.memory_method == 'tracemalloc':
+            return tracemalloc.get_traced_memory()[1] / 1e6
+        return None
+
+    def _reset_peak(self):
+        if self.memory_method == 'rss':
+            reset_peak_rss()
+        elif self.memory_method == 'tracemalloc':
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def span(self, stage):
+        '''
+        Record the wall time, CPU time, peak memory and bytes read/written for a stage. Spans can be nested, and
+        nested stages are recorded as 'parent/stage'. The peak memory (peak_mb) is the peak during the span only
+        (see memory_method), the peak of a nested span is included in the peak of its parents
+        '''
+        self._stack.append(stage)
+        record = dict(stage='/'.join(self._stack))
+
+        # the peak memory is reset at the start of each span, so fold the peak so far into the open parent spans
+        if self.memory_method is not None:
+            peak = self._peak_mb()
+            for parent in self._open:
+                parent['peak_mb'] = max(parent['peak_mb'], peak)
+            self._reset_peak()
+        record['peak_mb'] = self._peak_mb()
+        self._open.append(record)
+
+        read0, write0 = io_counters()
+        cpu0 = time.process_time()
+        wall0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            read1, write1 = io_counters()
+            record['wall_s'] = round(time.perf_counter() - wall0, 4)
+            record['cpu_s'] = round(time.process_time() - cpu0, 4)
+            self._open.pop()
+            if record['peak_mb'] is not None:
+                record['peak_mb'] = max(record['peak_mb'], self._peak_mb())
+                for parent in self._open:
+                    parent['peak_mb'] = max(parent['peak_mb'], record['peak_mb'])
+                record['peak_mb'] = round(record['peak_mb'], 1)
+            record['read_mb'] = None if read0 is None else round((read1 - read0) / 1e6, 3)
+            record['written_mb'] = None if write0 is None else round((write1 - write0) / 1e6, 3)
+            self.spans.append(record)
+            self._stack.pop()
+
+    def add(self, record):
+        '''
+        Add a span that was recorded somewhere else, e.g. in a worker process. It's nested under the current span
+        '''
+        record = dict(record)
+        record['stage'] = '/'.join(self._stack + [record['stage']])
+        self.spans.append(record)
+
+    def timed(self, stage=None):
+        '''
+        Decorator version of span, the stage name defaults to the function name
+        '''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.spans, columns=['stage', 'wall_s', 'cpu_s', 'peak_mb', 'read_mb', 'written_mb'])
+
+    def to_dict(self):
+        return dict(name=self.name,
+                    label=self.label,
+                    started=self.started,
+                    total_s=round(time.perf_counter() - self._t0, 4),
+                    memory_method=self.memory_method,
+                    lifetime_peak_rss_mb=lifetime_peak_rss_mb(),
+                    spans=self.spans)
+
+    def print(self):
+        print(f'{self.name} {self.label or ""} run report')
+        print(self.to_dataframe().to_string(index=False))
+        print(f'peak_mb per stage: {MEMORY_LABELS[self.memory_method]}. '
+              f'Lifetime peak RSS of the process: {lifetime_peak_rss_mb()} MB')
+
+    def finish(self, savedir):
+        '''
+        Print the report and save it to a json file in savedir
+        '''
+        self.print()
+        return self.save(savedir)
+
+    def save(self, savedir):
+        '''
+        Save the report to a json file in savedir
+        Returns the file name
+        '''
+        os.makedirs(savedir, exist_ok=True)
+        label = f'-{self.label}' if self.label else ''
+        tstr = self.started.replace('-', '').replace(':', '')
+        sfile = os.path.join(savedir, f'run_report-{self.name}{label}-{tstr}.json')
+        with open(sfile, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+        return sfile
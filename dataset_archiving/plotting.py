@@ -2,18 +2,399 @@
 
 """
 Author: Lori Garzio on 2/14/2025
-Last modified: 2/14/2025
+Last modified: 10/17/2026
 """
 
+import hashlib
+import importlib.metadata
+import json
+import os
+import pickle
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import numpy as np
+import cmocean  # registers the cmo. colormaps used in plot_vars.yml (needed in the worker processes)
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+import dataset_archiving.instrumentation as ins
 plt.rcParams.update({'font.size': 12})
 
+# views of the shared memory arrays in a worker process, set by _attach_shared
+_shared_arrays = dict()
+
+REDUCERS = ['mean', 'median', 'last']
+DEFAULT_BASEMAP_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dataset_archiving', 'basemaps')
+FIGURE_MANIFEST = 'figure_manifest.json'
+
+
+class FigureManifest:
+    '''
+    Manifest of the content hash of the inputs (data, plot options, dpi) to each figure saved in a directory, so
+    figures whose inputs haven't changed since they were last saved can be skipped. Use changed() to check a
+    figure before plotting it, done() after it's saved, and save() to write the manifest
+    savedir: directory the figures are saved to (the manifest is saved as figure_manifest.json)
+    force: re-plot all of the figures
+    '''
+    def __init__(self, savedir, force=False):
+        self.file = os.path.join(savedir, FIGURE_MANIFEST)
+        self.force = force
+        self.skipped = 0
+        self._pending = dict()
+        try:
+            with open(self.file) as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            self.hashes = dict()
+
+    def changed(self, sfile, *arrays, **options):
+        '''
+        Check if a figure needs to be plotted: the file doesn't exist, the inputs have changed or force is True
+        sfile: figure file
+        arrays: data arrays plotted in the figure
+        options: everything else that changes the figure, e.g. title, cmap, dpi
+        '''
+        key = figure_hash(*arrays, **options)
+        name = os.path.basename(sfile)
+        if not self.force and self.hashes.get(name) == key and os.path.isfile(sfile):
+            self.skipped += 1
+            return False
+        self._pending[name] = key
+        return True
+
+    def done(self, sfile):
+        '''
+        Record the hash for a figure that was saved
+        '''
+        name = os.path.basename(sfile)
+        self.hashes[name] = self._pending.pop(name)
+
+    def save(self):
+        '''
+        Save the manifest, with the hashes of the figures saved so far
+        '''
+        if self.skipped > 0:
+            print(f'Skipped {self.skipped} figures that haven\'t changed since the last run (use force to re-plot)')
+        os.makedirs(os.path.dirname(self.file), exist_ok=True)
+        tmpfile = f'{self.file}.{os.getpid()}.tmp'
+        with open(tmpfile, 'w') as f:
+            json.dump(self.hashes, f, indent=2, sort_keys=True)
+        os.replace(tmpfile, self.file)
+
+
+def _attach_shared(specs, rc):
+    '''
+    Worker process initializer: switch to the non-interactive Agg backend, copy the plot settings from the parent
+    process and attach to the shared memory arrays
+    '''
+    matplotlib.use('Agg')
+    plt.rcParams.update(rc)
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared_arrays[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _save_xsection_shared(name, sfile, zname, kwargs):
+    '''
+    Worker process task: plot a cross section from the shared memory arrays and save it to a file
+    Returns the timing and memory record for the plot
+    '''
+    report = ins.RunReport(name)
+    with report.span(name):
+        save_xsection(sfile, _shared_arrays['x'][1], _shared_arrays['y'][1], _shared_arrays[zname][1], **kwargs)
+
+    return report.spans[0]
+
+
+def bin_xsection(x, y, z, bins=(1000, 100), reducer='mean', cache_file=None):
+    '''
+    Bin cross section data into a 2D grid of x (e.g. time) and y (e.g. depth) bins. Each grid cell is the mean,
+    median or last (in the order of the data) z value of the data points in the cell, or NaN if there are none
+    x: x values
+    y: y values
+    z: data values
+    bins: number of (x, y) bins
+    reducer: 'mean', 'median' or 'last'
+    cache_file: optional .npz file to save the grid to, and re-use it if the data, bins and reducer are the same
+    (e.g. to re-style a plot without binning the data again)
+    Returns the x bin edges, y bin edges and a 2D array of the binned values with shape (y bins, x bins)
+    '''
+    if reducer not in REDUCERS:
+        raise(ValueError(f'Invalid reducer: {reducer}. Options are {REDUCERS}'))
+    x, y, z = np.asarray(x), np.asarray(y), np.asarray(z)
+    nx, ny = bins
+
+    if cache_file:
+        sha = hashlib.sha1()
+        for arr in (x, y, z):
+            sha.update(np.ascontiguousarray(arr).view('uint8'))
+        key = f'{sha.hexdigest()}-{nx}-{ny}-{reducer}'
+        try:
+            with np.load(cache_file, allow_pickle=False) as cached:
+                if str(cached['key']) == key:
+                    return cached['xedges'], cached['yedges'], cached['values']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    # bin on numbers (e.g. datetime64 in ns), and convert the x bin edges back at the end
+    xnum = x.astype('int64') if x.dtype.kind == 'M' else x.astype(float)
+    valid = ~np.isnan(y.astype(float)) & ~np.isnan(z.astype(float))
+    if x.dtype.kind == 'M':
+        valid &= ~np.isnat(x)
+    else:
+        valid &= ~np.isnan(xnum)
+    xnum, yv, zv = xnum[valid], y[valid].astype(float), z[valid].astype(float)
+
+    if len(zv) == 0:
+        xedges = np.linspace(0, 1, nx + 1)
+        yedges = np.linspace(0, 1, ny + 1)
+        values = np.full((ny, nx), np.nan)
+    else:
+        x0, x1 = xnum.min(), xnum.max()
+        y0, y1 = yv.min(), yv.max()
+        xedges = np.linspace(x0, x1 if x1 > x0 else x0 + 1, nx + 1)
+        yedges = np.linspace(y0, y1 if y1 > y0 else y0 + 1, ny + 1)
+        ix = np.clip(((xnum - x0) / (xedges[-1] - x0) * nx).astype('int64'), 0, nx - 1)
+        iy = np.clip(((yv - y0) / (yedges[-1] - y0) * ny).astype('int64'), 0, ny - 1)
+        cell = iy * nx + ix
+
+        values = np.full(nx * ny, np.nan)
+        if reducer == 'mean':
+            counts = np.bincount(cell, minlength=nx * ny)
+            sums = np.bincount(cell, weights=zv, minlength=nx * ny)
+            filled = counts > 0
+            values[filled] = sums[filled] / counts[filled]
+        elif reducer == 'last':
+            cells, last = np.unique(cell[::-1], return_index=True)
+            values[cells] = zv[len(zv) - 1 - last]
+        else:
+            order = np.lexsort((zv, cell))
+            cells, starts, counts = np.unique(cell[order], return_index=True, return_counts=True)
+            zsorted = zv[order]
+            values[cells] = (zsorted[starts + (counts - 1) // 2] + zsorted[starts + counts // 2]) / 2
+        values = values.reshape(ny, nx)
+
+        if x.dtype.kind == 'M':
+            xedges = np.round(xedges).astype('int64').astype(x.dtype)
+
+    if cache_file:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        tmpfile = f'{os.path.splitext(cache_file)[0]}.{os.getpid()}.tmp.npz'
+        np.savez(tmpfile, key=key, xedges=xedges, yedges=yedges, values=values)
+        os.replace(tmpfile, cache_file)
+
+    return xedges, yedges, values
+
+
+def cached_basemap(extent, dpi=200, snap=0.5, cachedir=None, **kwargs):
+    '''
+    Map (see cool_maps.plot.create) with the background (coastlines, land, bathymetry, ticks) drawn from a cache of
+    pre-rendered images, so the coastline and bathymetry layers are only built once for similar map extents. The
+    extent is snapped outward to a grid, and the cached images are keyed by the snapped extent, dpi and map options
+    (e.g. coastline resolution, bathymetry method and bathymetry file) and the cartopy and cool_maps versions, and
+    an entry that can't be loaded is rebuilt. Once an image is cached the map doesn't need network access
+    extent: map extent [lon0, lon1, lat0, lat1]
+    dpi: resolution of the background image, should match the dpi the figure is saved with
+    snap: grid size in degrees the extent is snapped to
+    cachedir: optional cache directory, default is ~/.cache/dataset_archiving/basemaps
+    kwargs: keyword arguments for cool_maps.plot.create
+    Returns the figure and a transparent map axis on top of the background for plotting data
+    '''
+    cachedir = cachedir or DEFAULT_BASEMAP_DIR
+    extent = [np.floor(extent[0] / snap) * snap, np.ceil(extent[1] / snap) * snap,
+              np.floor(extent[2] / snap) * snap, np.ceil(extent[3] / snap) * snap]
+    key = dict(extent=[round(float(x), 6) for x in extent], dpi=dpi, kwargs=kwargs)
+    if kwargs.get('bathymetry_file'):
+        stat = os.stat(kwargs['bathymetry_file'])
+        key['bathymetry_file'] = [stat.st_size, stat.st_mtime_ns]
+    # the map projection is pickled with the cached image, so it's only re-used with the same versions
+    key['versions'] = {pkg: package_version(pkg) for pkg in ['cartopy', 'cool_maps']}
+    keyhash = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    imgfile = os.path.join(cachedir, f'{keyhash}.png')
+    metafile = os.path.join(cachedir, f'{keyhash}.pkl')
+
+    meta = None
+    if os.path.isfile(imgfile) and os.path.isfile(metafile):
+        try:
+            with open(metafile, 'rb') as f:
+                meta = pickle.load(f)
+        except (pickle.UnpicklingError, AttributeError, EOFError, ImportError, TypeError, ValueError) as err:
+            print(f'Rebuilding the cached basemap {keyhash}, the cached map can\'t be loaded: {err}')
+
+    if meta is None:
+        import cool_maps.plot as cplt
+        os.makedirs(cachedir, exist_ok=True)
+        fig, ax = cplt.create(extent, **kwargs)
+        fig.canvas.draw()  # so the axis position is final
+        meta = dict(figsize=tuple(fig.get_size_inches()), position=ax.get_position().bounds,
+                    xlim=ax.get_xlim(), ylim=ax.get_ylim(), projection=ax.projection)
+        tmpfile = f'{imgfile[:-4]}.{os.getpid()}.tmp.png'
+        fig.savefig(tmpfile, dpi=dpi)
+        plt.close(fig)
+        with open(f'{metafile}.{os.getpid()}.tmp', 'wb') as f:
+            pickle.dump(meta, f)
+        os.replace(tmpfile, imgfile)
+        os.replace(f'{metafile}.{os.getpid()}.tmp', metafile)
+
+    fig = plt.figure(figsize=meta['figsize'])
+    background = fig.add_axes([0, 0, 1, 1])
+    background.imshow(plt.imread(imgfile), aspect='auto', interpolation='none')
+    background.set_axis_off()
+
+    ax = fig.add_axes(meta['position'], projection=meta['projection'])
+    ax.set_xlim(meta['xlim'])
+    ax.set_ylim(meta['ylim'])
+    ax.set_axis_off()
+    ax.patch.set_alpha(0)
+
+    return fig, ax
+
+
+def figure_hash(*arrays, **options):
+    '''
+    Content hash of the inputs to a figure
+    arrays: data arrays plotted in the figure
+    options: everything else that changes the figure, e.g. title, cmap, dpi
+    '''
+    sha = hashlib.sha1()
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        sha.update(f'{arr.dtype.str}{arr.shape}'.encode())
+        if arr.dtype.kind == 'O':
+            sha.update(json.dumps(arr.tolist(), default=str).encode())
+        else:
+            sha.update(arr.view('uint8'))
+    sha.update(json.dumps(options, sort_keys=True, default=str).encode())
+
+    return sha.hexdigest()
+
+
+def package_version(name):
+    '''
+    Installed version of a package, or None if it isn't installed
+    name: package name, e.g. 'cartopy'
+    '''
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def profile_lines(ax, x, y, bounds, colors, labels=None, lw=.75, s=5):
+    '''
+    Plot profiles as lines with points, using one LineCollection and one scatter for all of the profiles instead
+    of two artists per profile. Data points where x or y are NaN are left out
+    ax: axis
+    x: data values for all of the profiles
+    y: depth values for all of the profiles
+    bounds: (start, stop) offsets of each profile in x and y
+    colors: color of each profile
+    labels: optional legend label of each profile
+    lw: line width
+    s: marker size
+    Returns a dictionary of legend label: handle (one handle per label). Raises a ValueError if there are fewer
+    colors or labels than profiles
+    '''
+    if len(colors) < len(bounds):
+        raise(ValueError(f'{len(colors)} colors for {len(bounds)} profiles, provide a color for each profile'))
+    if labels is not None and len(labels) < len(bounds):
+        raise(ValueError(f'{len(labels)} labels for {len(bounds)} profiles, provide a label for each profile'))
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    lines = []
+    point_idx = []
+    point_colors = []
+    for (i0, i1), color in zip(bounds, colors):
+        keep = i0 + np.flatnonzero(~np.isnan(x[i0:i1]) & ~np.isnan(y[i0:i1]))
+        lines.append(np.column_stack((x[keep], y[keep])))
+        point_idx.append(keep)
+        point_colors.append(np.repeat([color], len(keep), axis=0))
+
+    if len(lines) > 0:
+        point_idx = np.concatenate(point_idx)
+        ax.scatter(x[point_idx], y[point_idx], c=np.concatenate(point_colors), s=s, edgecolor='None')
+        ax.add_collection(LineCollection(lines, colors=list(colors[0:len(lines)]), linewidths=lw, zorder=2))
+        ax.autoscale_view()
+
+    handles = dict()
+    if labels is not None:
+        for label, color in zip(labels[0:len(bounds)], colors):
+            handles[label] = Line2D([], [], lw=lw, color=color)
+
+    return handles
+
+
+def render_xsections(x, y, plots, max_workers=None):
+    '''
+    Plot cross sections in parallel on a process pool using the non-interactive Agg backend. The x and y arrays
+    and the data for each plot are copied to shared memory once, and each worker process gets views of the shared
+    arrays so the data aren't pickled for each plot
+    x: x values shared by all of the plots (e.g. time)
+    y: y values shared by all of the plots (e.g. depth)
+    plots: dictionary of name: (file, z values, dictionary of keyword arguments for save_xsection)
+    max_workers: optional number of processes, default is the number of CPUs
+    Returns a list of the timing and memory records for each plot (see instrumentation.RunReport)
+    '''
+    arrays = dict(x=np.asarray(x), y=np.asarray(y))
+    for i, (name, (sfile, z, kwargs)) in enumerate(plots.items()):
+        arrays[f'z{i}'] = np.asarray(z)
+
+    shms = []
+    try:
+        specs = dict()
+        for name, arr in arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            shms.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            specs[name] = (shm.name, arr.shape, arr.dtype)
+
+        rc = {'font.size': plt.rcParams['font.size']}
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_shared, initargs=(specs, rc)) as executor:
+            futures = [executor.submit(_save_xsection_shared, name, sfile, f'z{i}', kwargs)
+                       for i, (name, (sfile, z, kwargs)) in enumerate(plots.items())]
+            records = [future.result() for future in futures]
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    return records
+
+
+def save_xsection(sfile, x, y, z, figsize=(12, 6), left=0.1, dpi=300, **kwargs):
+    '''
+    Plot a cross section (see xsection) and save it to a file
+    sfile: file to save
+    figsize: figure size
+    left: left side of the subplots
+    dpi: resolution of the saved figure
+    kwargs: keyword arguments for xsection
+    '''
+    fig, ax = plt.subplots(figsize=figsize)
+    plt.subplots_adjust(left=left)
+    xsection(fig, ax, x, y, z, **kwargs)
+    plt.savefig(sfile, dpi=dpi)
+    plt.close()
+
 
 def xsection(fig, ax, x, y, z, xlabel='Time', ylabel='Depth (m)', clabel=None, cmap='jet', title=None, date_fmt=None,
-             grid=None, extend='both'):
-    xc = ax.scatter(x, y, c=z, cmap=cmap, s=10, edgecolor='None')
+             grid=None, extend='both', mode='scatter', bins=(1000, 100), reducer='mean', cache_file=None):
+    '''
+    Plot a cross section of data values z by x (e.g. time) and y (e.g. depth)
+    mode: 'scatter' to plot every data point, or 'binned' to bin the data into a grid of x and y bins
+    (see bin_xsection) and plot the grid with pcolormesh. The binned plot takes about the same time to draw
+    no matter how many data points there are
+    bins, reducer, cache_file: options for the binned mode, see bin_xsection
+    '''
+    if mode == 'binned':
+        xedges, yedges, values = bin_xsection(x, y, z, bins, reducer, cache_file)
+        xc = ax.pcolormesh(xedges, yedges, np.ma.masked_invalid(values), cmap=cmap, shading='flat')
+    elif mode == 'scatter':
+        xc = ax.scatter(x, y, c=z, cmap=cmap, s=10, edgecolor='None')
+    else:
+        raise(ValueError(f'Invalid xsection mode: {mode}. Options are scatter, binned'))
 
     ax.invert_yaxis()
     ax.set_ylabel(ylabel)
@@ -0,0 +1,164 @@
+#! /usr/bin/env python
+
+"""
+Per-profile index for glider datasets. The start/stop offsets of each profile along the observation dimension
+are computed once from profile_time, so selecting a profile, the first/last n profiles or the profiles in a time
+window is a slice instead of a full scan of the dataset. Indexes can be cached to disk for a source file.
+"""
+
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dataset_archiving', 'profiles')
+
+
+class ProfileIndex:
+    '''
+    Start/stop offsets of each profile along the observation dimension. If the observations aren't in
+    profile_time order, the offsets are into the sorted order and the selections are index arrays instead
+    of slices (either can be passed to isel). Observations without a profile_time are left out of the index
+    profile_time: array of profile times along the observation dimension
+    '''
+    def __init__(self, profile_time=None):
+        if profile_time is None:
+            return  # empty index, filled in by load_profile_index
+        profile_time = np.asarray(profile_time)
+        self.size = len(profile_time)
+        self.order = None
+        if not pd.Index(profile_time).is_monotonic_increasing:
+            self.order = np.argsort(profile_time, kind='stable')  # NaT is sorted to the end
+            profile_time = profile_time[self.order]
+
+        profile_time = profile_time[0:np.count_nonzero(~pd.isna(profile_time))]
+        if len(profile_time) > 0:
+            self.starts = np.flatnonzero(np.r_[True, profile_time[1:] != profile_time[:-1]])
+        else:
+            self.starts = np.array([], dtype=int)
+        self.stops = np.r_[self.starts[1:], len(profile_time)].astype(int)
+        self.times = profile_time[self.starts]
+
+    def __getitem__(self, k):
+        '''
+        Observations for profile k
+        '''
+        if k < 0:
+            k += len(self)
+        if k < 0 or k >= len(self):
+            raise(IndexError(f'Profile {k} out of range for {len(self)} profiles'))
+
+        return self.profiles(k, k + 1)
+
+    def __len__(self):
+        return len(self.times)
+
+    def between(self, t0, t1):
+        '''
+        Observations for the profiles with t0 <= profile_time <= t1. Profile times are UTC: time zone-aware
+        bounds are converted to UTC, and naive bounds are assumed to be UTC
+        '''
+        # pd.to_datetime with utc=True converts aware times to UTC (and localizes naive times to UTC)
+        k0 = np.searchsorted(self.times, np.datetime64(pd.to_datetime(t0, utc=True).tz_localize(None)), side='left')
+        k1 = np.searchsorted(self.times, np.datetime64(pd.to_datetime(t1, utc=True).tz_localize(None)), side='right')
+
+        return self.profiles(k0, k1)
+
+    def first(self, n):
+        '''
+        Observations for the first n profiles
+        '''
+        return self.profiles(0, n)
+
+    def last(self, n):
+        '''
+        Observations for the last n profiles
+        '''
+        return self.profiles(max(len(self) - n, 0), len(self))
+
+    def mask(self, indexer):
+        '''
+        Boolean mask along the observation dimension for a selection from this index
+        '''
+        mask = np.zeros(self.size, dtype=bool)
+        mask[indexer] = True
+
+        return mask
+
+    def offsets(self, k0, k1):
+        '''
+        Start/stop offsets of each of profiles k0 to k1 within the observations selected by profiles(k0, k1),
+        e.g. to plot the profiles from one selection
+        '''
+        rng = range(len(self))[k0:k1]
+        if len(rng) == 0:
+            return []
+        i0 = self.starts[rng.start]
+
+        return [(int(self.starts[k] - i0), int(self.stops[k] - i0)) for k in rng]
+
+    def profiles(self, k0, k1):
+        '''
+        Observations for profiles k0 to k1 (not including k1), with the same behavior as list slicing
+        (e.g. negative numbers count from the last profile)
+        '''
+        rng = range(len(self))[k0:k1]
+        if len(rng) == 0:
+            i0 = i1 = 0
+        else:
+            i0 = self.starts[rng.start]
+            i1 = self.stops[rng[-1]]
+
+        if self.order is None:
+            return slice(int(i0), int(i1))
+        return self.order[i0:i1]
+
+
+def index_file(source_file, index_dir=None):
+    '''
+    Cache file for the profile index of a source file
+    '''
+    index_dir = index_dir or DEFAULT_INDEX_DIR
+    filehash = hashlib.sha1(os.path.abspath(source_file).encode()).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(source_file))[0]
+
+    return os.path.join(index_dir, f'{name}-{filehash}.npz')
+
+
+def load_profile_index(dataset, var='profile_time', source_file=None, index_dir=None):
+    '''
+    Get the profile index for a dataset. If the source file is provided, the index is cached to disk and
+    re-used until the source file changes (the dataset must be in the same order as the file)
+    dataset: xarray dataset
+    var: profile time variable
+    source_file: optional file the dataset was opened from
+    index_dir: optional cache directory, default is ~/.cache/dataset_archiving/profiles
+    '''
+    if source_file is None:
+        return ProfileIndex(dataset[var].values)
+
+    stat = os.stat(source_file)
+    key = np.array([stat.st_size, stat.st_mtime_ns, dataset[var].size])
+    sfile = index_file(source_file, index_dir)
+    try:
+        with np.load(sfile, allow_pickle=False) as cached:
+            if str(cached['var']) == var and np.array_equal(cached['key'], key):
+                pidx = ProfileIndex()
+                pidx.size = int(key[2])
+                pidx.order = cached['order'] if cached['reordered'] else None
+                pidx.starts = cached['starts']
+                pidx.stops = cached['stops']
+                pidx.times = cached['times']
+                return pidx
+    except (OSError, ValueError, KeyError):
+        pass
+
+    pidx = ProfileIndex(dataset[var].values)
+    os.makedirs(os.path.dirname(sfile), exist_ok=True)
+    tmpfile = f'{sfile[:-4]}.{os.getpid()}.tmp.npz'
+    order = pidx.order if pidx.order is not None else np.array([], dtype=int)
+    np.savez(tmpfile, var=var, key=key, reordered=pidx.order is not None, order=order, starts=pidx.starts,
+             stops=pidx.stops, times=pidx.times)
+    os.replace(tmpfile, sfile)
+
+    return pidx
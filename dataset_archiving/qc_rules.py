@@ -0,0 +1,188 @@
+#! /usr/bin/env python
+
+"""
+Config-driven QC rule pipeline. QC rules for each sensor type are defined in configs/qc_rules.yml,
+compiled into a masking plan for a dataset, and applied in a single sweep: every rule is evaluated once,
+the results are combined into one mask per target variable, and each mask is applied once.
+Rules also run on lazy (dask-backed) datasets, in which case the masks are built and applied lazily.
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import yaml
+import dataset_archiving.common as cf
+import dataset_archiving.profiles as prof
+
+OPERATORS = {'<': np.less,
+             '<=': np.less_equal,
+             '>': np.greater,
+             '>=': np.greater_equal,
+             '==': np.equal}
+
+
+def load_qc_rules(configdir, sensor):
+    '''
+    Load the list of QC rules for a sensor type from the qc_rules.yml config file
+    configdir: directory containing qc_rules.yml
+    sensor: sensor type, e.g. 'pH', 'azfp', 'dmon'
+    '''
+    with open(os.path.join(configdir, 'qc_rules.yml')) as f:
+        qc_rules = yaml.safe_load(f)
+
+    try:
+        return qc_rules[sensor]
+    except KeyError:
+        raise(ValueError(f'No QC rules defined for sensor: {sensor}. Options are {list(qc_rules.keys())}'))
+
+
+def compile_qc_plan(dataset, rules, params=None):
+    '''
+    Compile QC rules into a masking plan for a dataset: resolve the variables each rule reads and the target
+    variables it's applied to. Rules that don't apply to the dataset (optional rules with missing variables,
+    or first_profiles rules with n=0/False) are left out of the plan
+    dataset: xarray dataset
+    rules: list of QC rule dictionaries (see load_qc_rules)
+    params: optional dictionary of runtime parameters referenced by the rules (e.g. remove_first_profiles)
+    Returns a list of compiled rule dictionaries
+    '''
+    params = params or dict()
+    plan = []
+    for rule in rules:
+        rule = dict(rule)
+        optional = rule.get('optional', False)
+        rtype = rule['type']
+
+        if rtype == 'qc_flags':
+            rule['targets'] = None  # targets are determined from the QC flag variables
+        else:
+            targets = [tv for tv in rule['targets'] if tv in dataset.variables]
+            missing = set(rule['targets']) - set(targets)
+            if len(missing) > 0 and not optional:
+                raise(KeyError(f'QC rule {rule["name"]}: variables not found in dataset: {sorted(missing)}'))
+            if len(targets) == 0:
+                continue
+            rule['targets'] = targets
+
+        if rtype == 'flag_vars':
+            rule['variables'] = [x for x in list(dataset.data_vars) if rule['search_str'] in x]
+        elif rtype == 'threshold':
+            if rule['variable'] not in dataset.variables:
+                if optional:
+                    continue
+                raise(KeyError(f'QC rule {rule["name"]}: variable not found in dataset: {rule["variable"]}'))
+            if rule['operator'] not in OPERATORS:
+                raise(ValueError(f'QC rule {rule["name"]}: invalid operator {rule["operator"]}. '
+                                 f'Valid options are {list(OPERATORS.keys())}'))
+        elif rtype == 'first_profiles':
+            n = rule['n']
+            if isinstance(n, str):
+                n = params.get(n, False)
+            if not np.logical_and(isinstance(n, int), n > 0):
+                continue
+            rule['n'] = n
+            if rule.get('comment'):
+                rule['comment'] = rule['comment'].format(n=n)
+        elif rtype != 'qc_flags':
+            raise(ValueError(f'QC rule {rule["name"]}: invalid rule type {rtype}'))
+
+        plan.append(rule)
+
+    return plan
+
+
+def run_qc_plan(dataset, plan):
+    '''
+    Run a compiled QC plan on a dataset in a single sweep. Each rule is evaluated once (each variable the
+    rules read is only loaded once), the rule results are combined into one mask per target variable and
+    each mask is applied once. Threshold rules are evaluated on the values left by the earlier rules in the
+    plan, the same as if the rules were applied one at a time. If the dataset is lazy (dask-backed), the masks
+    stay lazy and the number of flagged data points is computed for all of the rules at once (the seconds column
+    is then the time it took to build each rule, not to evaluate it)
+    dataset: xarray dataset
+    plan: list of compiled rules from compile_qc_plan
+    Returns a dataframe with the number of data points flagged by each rule and the time it took to evaluate,
+    and a dictionary of the number of data points removed from each variable
+    '''
+    values = dict()
+
+    def get_values(var):
+        if var not in values:
+            values[var] = dataset[var].data
+        return values[var]
+
+    masks = dict()
+    comments = []
+    rows = []
+    for rule in plan:
+        t0 = time.perf_counter()
+        rtype = rule['type']
+        if rtype == 'qc_flags':
+            rule_masks = cf.build_qc_masks(dataset, qc_tests=rule['tests'],
+                                           qc_variety=rule.get('qc_variety', 'suspect_failed'))
+            targets = list(rule_masks.keys())
+        else:
+            if rtype == 'flag_vars':
+                mask = np.zeros(dataset[rule['targets'][0]].shape, dtype=bool)
+                for var in rule['variables']:
+                    mask = mask | np.isin(get_values(var), rule['flag_values'])
+            elif rtype == 'threshold':
+                mask = OPERATORS[rule['operator']](get_values(rule['variable']), rule['value'])
+                if rule['variable'] in masks:
+                    # compare the values left by the earlier rules (removed values don't pass any threshold)
+                    mask = mask & ~masks[rule['variable']]
+            elif rtype == 'first_profiles':
+                pidx = prof.ProfileIndex(get_values('profile_time'))
+                mask = pidx.mask(pidx.first(rule['n']))
+            targets = rule['targets']
+            rule_masks = {tv: mask for tv in targets}
+
+        for tv, mask in rule_masks.items():
+            if tv in masks:
+                masks[tv] = masks[tv] | mask
+            else:
+                masks[tv] = mask.copy()
+
+        if rule.get('comment'):
+            comments.append((rule['comment'], targets, rule.get('append_comment', False)))
+
+        nflagged = [np.count_nonzero(m) for m in rule_masks.values()]
+        rows.append([rule['name'], rtype, ', '.join(targets), nflagged, time.perf_counter() - t0])
+
+    # count the flagged data points for all of the rules at once (a single pass over lazy datasets)
+    nflagged = cf.compute_counts({(i, j): x for i, row in enumerate(rows) for j, x in enumerate(row[3])})
+    for i, row in enumerate(rows):
+        row[3] = max([nflagged[(i, j)] for j in range(len(row[3]))], default=0)
+
+    # add comments in rule order, then apply each combined mask once
+    for comment, targets, append in comments:
+        for tv in targets:
+            if append and hasattr(dataset[tv], 'comment'):
+                dataset[tv].attrs['comment'] = ' '.join((dataset[tv].comment, comment))
+            else:
+                cf.add_comment_attr(dataset[tv], comment)
+
+    t0 = time.perf_counter()
+    counts = cf.apply_qc_masks(dataset, masks)
+    rows.append(['apply_masks', 'apply', ', '.join(masks.keys()), sum(counts.values()), time.perf_counter() - t0])
+
+    report = pd.DataFrame(rows, columns=['rule', 'type', 'targets', 'n_flagged', 'seconds'])
+
+    return report, counts
+
+
+def apply_qc_rules(dataset, configdir, sensor, params=None):
+    '''
+    Load, compile and run the QC rules for a sensor type
+    dataset: xarray dataset
+    configdir: directory containing qc_rules.yml
+    sensor: sensor type, e.g. 'pH', 'azfp', 'dmon'
+    params: optional dictionary of runtime parameters referenced by the rules (e.g. remove_first_profiles)
+    Returns a dataframe with the number of data points flagged by each rule and the time it took to evaluate,
+    and a dictionary of the number of data points removed from each variable
+    '''
+    rules = load_qc_rules(configdir, sensor)
+    plan = compile_qc_plan(dataset, rules, params=params)
+
+    return run_qc_plan(dataset, plan)
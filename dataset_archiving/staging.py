@@ -0,0 +1,275 @@
+#! /usr/bin/env python
+
+"""
+Stage (copy/rename) raw data files into the directories that are sent to the archive. Each file is staged with
+the cheapest method the filesystem allows: a copy-on-write clone (reflink), a hardlink, or a parallel copy with
+large buffered reads/writes. Files that are already staged (the same file, or a copy with the same size and
+modification time) are skipped. The SHA-256 checksum of each file is computed while it's copied, or only for the
+files that need one, and cached by the file modification time and size so re-runs don't read the data again.
+"""
+
+import ctypes
+import hashlib
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+DEFAULT_BUFFER = 16 * 1024 * 1024  # bytes
+DEFAULT_CHECKSUM_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dataset_archiving', 'staging')
+FICLONE = 0x40049409  # Linux ioctl to clone a file (btrfs, xfs, etc.)
+METHODS = ['auto', 'reflink', 'hardlink', 'copy']
+
+
+def cached_sha256(fname, cache, src=None):
+    '''
+    Checksum of a file from a checksum cache (see load_checksums), if the file hasn't changed since it was cached
+    fname: file
+    cache: dictionary of file: dict(key=[modification time (ns), size], sha256=checksum)
+    src: optional file that fname is (or will be) staged from, the cached checksum of fname is only used if src has
+        the same modification time and size
+    Returns the SHA-256 checksum (hex), or None if it isn't cached
+    '''
+    entry = cache.get(os.path.abspath(fname))
+    try:
+        if entry is None or entry['key'] != stat_key(src or fname):
+            return None
+    except OSError:
+        return None
+
+    return entry['sha256']
+
+
+def checksum_cache_file(directory, cachedir=None):
+    '''
+    Checksum cache file for the files staged in a directory
+    directory: staging directory
+    cachedir: optional cache directory, default is ~/.cache/dataset_archiving/staging
+    '''
+    dirhash = hashlib.sha1(os.path.abspath(directory).encode()).hexdigest()[:12]
+
+    return os.path.join(cachedir or DEFAULT_CHECKSUM_DIR, f'sha256-{dirhash}.json')
+
+
+def copy_file(src, dst, bufsize=DEFAULT_BUFFER):
+    '''
+    Copy a file with large buffered reads/writes, computing the SHA-256 checksum of the data as it's copied.
+    The file modification time is copied too
+    src: file to copy
+    dst: new file
+    bufsize: read/write buffer size in bytes
+    Returns the SHA-256 checksum (hex)
+    '''
+    sha = hashlib.sha256()
+    buf = bytearray(bufsize)
+    view = memoryview(buf)
+    with open(src, 'rb', buffering=0) as fin, open(dst, 'wb', buffering=0) as fout:
+        while True:
+            n = fin.readinto(buf)
+            if not n:
+                break
+            sha.update(view[:n])
+            fout.write(view[:n])
+    shutil.copystat(src, dst)
+
+    return sha.hexdigest()
+
+
+def file_sha256(fname, bufsize=DEFAULT_BUFFER):
+    '''
+    SHA-256 checksum (hex) of a file
+    '''
+    sha = hashlib.sha256()
+    buf = bytearray(bufsize)
+    view = memoryview(buf)
+    with open(fname, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            sha.update(view[:n])
+
+    return sha.hexdigest()
+
+
+def load_checksums(cachefile):
+    '''
+    Load a checksum cache written by save_checksums
+    Returns a dictionary of file: dict(key=[modification time (ns), size], sha256=checksum), empty if the cache
+    doesn't exist or can't be read
+    '''
+    try:
+        with open(cachefile) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def record_sha256(fname, sha256, cache):
+    '''
+    Add the checksum of a file to a checksum cache, keyed by the file modification time and size
+    '''
+    cache[os.path.abspath(fname)] = dict(key=stat_key(fname), sha256=sha256)
+
+
+def reflink(src, dst):
+    '''
+    Copy-on-write clone of a file: the new file shares the data blocks with the original until one of them is
+    modified, so it's instant and takes no extra space. Supported on APFS (macOS) and btrfs/xfs (Linux).
+    Raises an OSError if the filesystem doesn't support it
+    src: file to clone
+    dst: new file
+    '''
+    if sys.platform == 'darwin':
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            errno = ctypes.get_errno()
+            raise(OSError(errno, os.strerror(errno), dst))
+    elif fcntl is not None and sys.platform.startswith('linux'):
+        with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+            try:
+                fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+            except OSError:
+                fout.close()
+                os.remove(dst)
+                raise
+    else:
+        raise(OSError(f'Reflinks are not supported on {sys.platform}'))
+    shutil.copystat(src, dst)  # keep the modification time, so the clone matches src on re-runs
+
+
+def save_checksums(cache, cachefile):
+    '''
+    Write a checksum cache (see load_checksums). The file is replaced atomically
+    '''
+    os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+    tmpfile = f'{cachefile}.{os.getpid()}.tmp'
+    with open(tmpfile, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmpfile, cachefile)
+
+
+def stage_file(src, dst, method='auto', bufsize=DEFAULT_BUFFER, sha256=None, checksum=True):
+    '''
+    Stage one file (see stage_files). If dst is already src (the same file or a hardlink to it) or a copy with the
+    same size and modification time, it's kept ('existing'), otherwise an existing file at dst is replaced
+    src: file to stage
+    dst: new file
+    method: 'auto' (try reflink, then hardlink, then copy), 'reflink', 'hardlink' or 'copy'
+    bufsize: read/write buffer size in bytes for copies and checksums
+    sha256: optional known checksum of src, so linked files don't need to be read
+    checksum: compute the checksum of linked/existing files if it isn't known, if False the checksum is only
+        returned for copies (where it's computed anyway)
+    Returns a dictionary with the source, destination, method used, size (bytes) and SHA-256 checksum (None if
+    it wasn't computed)
+    '''
+    if method not in METHODS:
+        raise(ValueError(f'Invalid staging method: {method}. Options are {METHODS}'))
+
+    used = None
+    if os.path.lexists(dst):
+        if os.path.exists(dst) and (os.path.samefile(src, dst) or stat_key(src) == stat_key(dst)):
+            used = 'existing'
+        else:
+            # remove the old file first so a hardlink to src is never written through
+            os.remove(dst)
+
+    for m in ([] if used else ['reflink', 'hardlink'] if method == 'auto' else [method]):
+        try:
+            if m == 'reflink':
+                reflink(src, dst)
+            elif m == 'hardlink':
+                os.link(src, dst)
+            else:
+                break
+        except OSError:
+            if method != 'auto':
+                raise
+            continue
+        used = m
+        break
+
+    if used is None:
+        used = 'copy'
+        sha256 = copy_file(src, dst, bufsize)
+    elif sha256 is None and checksum:
+        sha256 = file_sha256(dst, bufsize)
+
+    return dict(source=src, destination=dst, method=used, bytes=os.path.getsize(dst), sha256=sha256)
+
+
+def stage_files(plan, method='auto', max_workers=None, bufsize=DEFAULT_BUFFER, checksums=None, checksum=True,
+                cachedir=None):
+    '''
+    Stage files into new locations/names on a thread pool. Files are cloned (reflink) or hardlinked where the
+    filesystem allows, and otherwise copied with large buffered reads/writes. Files that are already staged are
+    skipped. The SHA-256 checksum of each file is computed during the copy, or re-used from checksums or the
+    checksum cache of the destination directory (see checksum_cache_file) if the file hasn't changed
+    plan: list of (source file, new file)
+    method: 'auto' (try reflink, then hardlink, then copy), 'reflink', 'hardlink' or 'copy'
+    max_workers: optional number of threads
+    bufsize: read/write buffer size in bytes
+    checksums: optional dictionary of source file: known SHA-256 checksum
+    checksum: compute the checksums of the staged files, if False only the checksums of copies are returned (e.g.
+        for an intermediate stage where most of the files aren't archived)
+    cachedir: optional checksum cache directory, default is ~/.cache/dataset_archiving/staging
+    Returns a DataFrame manifest with the source, destination, method, size (bytes) and SHA-256 of each file
+    '''
+    checksums = checksums or dict()
+    dirs = sorted(set(os.path.dirname(dst) or '.' for src, dst in plan))
+    caches = {d: load_checksums(checksum_cache_file(d, cachedir)) for d in dirs}
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+
+    def known(src, dst):
+        return checksums.get(src) or cached_sha256(dst, caches[os.path.dirname(dst) or '.'], src=src)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(stage_file, src, dst, method, bufsize, known(src, dst), checksum)
+                   for src, dst in plan]
+        rows = [future.result() for future in futures]
+
+    for d in dirs:
+        cache = caches[d]
+        new = [row for row in rows if (os.path.dirname(row['destination']) or '.') == d and row['sha256'] and
+               cached_sha256(row['destination'], cache) != row['sha256']]
+        for row in new:
+            record_sha256(row['destination'], row['sha256'], cache)
+        if len(new) > 0:
+            save_checksums(cache, checksum_cache_file(d, cachedir))
+
+    return pd.DataFrame(rows, columns=['source', 'destination', 'method', 'bytes', 'sha256'])
+
+
+def stat_key(fname):
+    '''
+    Modification time (ns) and size of a file, to check if it changed
+    '''
+    st = os.stat(fname)
+
+    return [st.st_mtime_ns, st.st_size]
+
+
+def write_sha256_manifest(manifest, sfile, root=None):
+    '''
+    Write the checksums from a staging manifest in the sha256sum format ("checksum  filename"), which can be
+    checked with sha256sum -c or shasum -a 256 -c
+    manifest: DataFrame from stage_files
+    sfile: file to save
+    root: optional directory the file names are written relative to, default is the directory of sfile
+    Returns the file name
+    '''
+    root = root or os.path.dirname(os.path.abspath(sfile))
+    with open(sfile, 'w') as f:
+        for row in manifest.sort_values('destination').itertuples():
+            relpath = os.path.relpath(os.path.abspath(row.destination), root).replace(os.sep, '/')
+            f.write(f'{row.sha256}  {relpath}\n')
+
+    return sfile
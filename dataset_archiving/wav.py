@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+
+"""
+Read the header of WAV (RIFF/RF64) audio files without reading the audio data. Each file is memory-mapped and
+only the chunk headers are read, so the sample rate, number of channels, number of frames and the exact duration
+of a recording are available for very large files (e.g. a full DMON card) in seconds. Recordings can be cut at
+given times (e.g. the deployment start/end) by slicing the memory-mapped audio frames into a new file with a new
+header, without decoding or re-writing the rest of the recording.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import dataset_archiving.staging as stg
+
+MAX_RIFF_SIZE = 0xFFFFFFFF  # bytes, larger pieces are written as RF64 files
+PCM_FORMATS = (1, 0xFFFE)  # WAVE_FORMAT_PCM and WAVE_FORMAT_EXTENSIBLE
+WAV_HEADER_COLS = ['sample_rate', 'channels', 'bits_per_sample', 'block_align', 'frames', 'data_offset',
+                   'data_size', 'duration_s']
+
+
+def read_wav_header(fname):
+    '''
+    Read the format and data chunk headers of a WAV file. The file is memory-mapped and the chunks are walked until
+    the data chunk is found, without touching the audio data. If the data chunk size is missing or larger than the
+    file (e.g. a recording that wasn't closed properly), the data are assumed to run to the end of the file
+    fname: .wav file
+    Returns a dictionary with the sample_rate, channels, bits_per_sample, block_align (bytes per frame), frames,
+    data_offset and data_size (bytes), duration_s (seconds), audio_format and the offset and size of the fmt chunk.
+    Raises a ValueError if the header is malformed
+    '''
+    size = os.path.getsize(fname)
+    if size < 12:
+        raise(ValueError(f'{fname} is too small to be a WAV file'))
+
+    with open(fname, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        riff, riff_size, wave = struct.unpack_from('<4sI4s', mm, 0)
+        if riff not in (b'RIFF', b'RF64') or wave != b'WAVE':
+            raise(ValueError(f'{fname} is not a RIFF/WAVE file'))
+
+        fmt = None
+        fmt_offset = None
+        rf64_data_size = None
+        pos = 12
+        while pos + 8 <= size:
+            chunk_id, chunk_size = struct.unpack_from('<4sI', mm, pos)
+            body = pos + 8
+            if chunk_id == b'ds64' and body + 24 <= size:
+                rf64_data_size = struct.unpack_from('<Q', mm, body + 8)[0]
+            elif chunk_id == b'fmt ':
+                if body + 16 > size:
+                    raise(ValueError(f'{fname} has a truncated fmt chunk'))
+                fmt = struct.unpack_from('<HHIIHH', mm, body)
+                fmt_offset, fmt_size = body, chunk_size
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise(ValueError(f'{fname} has a data chunk before the fmt chunk'))
+                data_size = rf64_data_size if riff == b'RF64' and chunk_size == 0xFFFFFFFF else chunk_size
+                if data_size in (0, 0xFFFFFFFF) or body + data_size > size:
+                    data_size = size - body
+                break
+            pos = body + chunk_size + (chunk_size % 2)  # chunks are padded to an even size
+        else:
+            raise(ValueError(f'{fname} has no data chunk'))
+
+    audio_format, channels, sample_rate, byte_rate, block_align, bits_per_sample = fmt
+    if sample_rate == 0 or block_align == 0:
+        raise(ValueError(f'{fname} has an invalid fmt chunk: sample rate {sample_rate}, block align {block_align}'))
+    frames = data_size // block_align
+
+    return dict(sample_rate=sample_rate,
+                channels=channels,
+                bits_per_sample=bits_per_sample,
+                block_align=block_align,
+                frames=frames,
+                data_offset=body,
+                data_size=data_size,
+                duration_s=frames / sample_rate,
+                audio_format=audio_format,
+                fmt_offset=fmt_offset,
+                fmt_size=fmt_size)
+
+
+def scan_wav_headers(files, max_workers=None):
+    '''
+    Read the headers of WAV files (see read_wav_header) on a thread pool. Files with a missing or malformed header
+    are returned with NaN values, so the recording extents can fall back to another source (e.g. the DMON .xml files)
+    files: list of .wav files
+    max_workers: optional number of threads
+    Returns a DataFrame with the filename and header values of each file (in the same order as files)
+    '''
+    def read(fname):
+        try:
+            return read_wav_header(fname)
+        except (OSError, ValueError, struct.error):
+            return dict.fromkeys(WAV_HEADER_COLS, np.nan)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rows = list(executor.map(read, files))
+
+    df = pd.DataFrame(rows, columns=WAV_HEADER_COLS)
+    df.insert(0, 'filename', [os.path.basename(f) for f in files])
+
+    return df
+
+
+def split_filename(prefix, t):
+    '''
+    File name for a piece of a split recording, in the format prefix_YYYYMMDDhhmmss_uuuuuu.wav where the timestamp
+    is the start of the piece and uuuuuu is microseconds
+    prefix: start of the file name, e.g. the deployment and original file number
+    t: start time of the piece
+    '''
+    return f'{prefix}_{t.strftime("%Y%m%d%H%M%S")}_{t.microsecond:06d}.wav'
+
+
+def split_wav(fname, start_time, t0, t1, savedir, prefix=None, bufsize=16 * 1024 * 1024, checksums=None):
+    '''
+    Cut the part of a recording between two times (e.g. the deployment start and end) into a new .wav file named
+    with the time of its first frame (see split_filename). Only the frames that are kept are read, and they're
+    written straight from the memory-mapped file with a new header (RF64 if the piece is larger than 4 GiB). The
+    SHA-256 checksum of the new file is computed while it's written. Only PCM recordings can be cut, a ValueError
+    is raised for other audio formats
+    fname: .wav file
+    start_time: time of the first frame of the recording (pandas Timestamp)
+    t0: keep the frames at or after this time, or None to keep from the start of the recording
+    t1: keep the frames at or before this time, or None to keep to the end of the recording
+    savedir: directory to save the new file
+    prefix: optional start of the new file name, default is the name of the original file (without the extension)
+    bufsize: write buffer size in bytes
+    checksums: optional checksum cache (see dataset_archiving.staging.load_checksums). A piece that was already
+        written (with a cached checksum, the expected size and newer than fname) isn't written again
+        ('existing'), and the checksum of a new piece is added to the cache
+    Returns a dictionary with the source, destination, method ('split' or 'existing'), bytes and sha256 of the new
+    file (the same as dataset_archiving.staging.stage_files) and the start_time and end_time of the piece, or None
+    if the recording doesn't have any frames between t0 and t1
+    '''
+    header = read_wav_header(fname)
+    if header['audio_format'] not in PCM_FORMATS:
+        raise(ValueError(f'Only PCM recordings can be split, {fname} has audio format {header["audio_format"]:#x}'))
+    sample_rate = header['sample_rate']
+    block_align = header['block_align']
+    start_time = pd.Timestamp(start_time)
+
+    frame0 = 0 if t0 is None else max(math.ceil((pd.Timestamp(t0) - start_time).total_seconds() * sample_rate), 0)
+    if t1 is None:
+        frame1 = header['frames']
+    else:
+        frame1 = min(math.floor((pd.Timestamp(t1) - start_time).total_seconds() * sample_rate) + 1, header['frames'])
+    if frame1 <= frame0:
+        return None
+
+    data_size = (frame1 - frame0) * block_align
+    fmt_size = header['fmt_size']
+    riff_size = 4 + (8 + fmt_size + fmt_size % 2) + (8 + data_size + data_size % 2)
+    rf64 = riff_size > MAX_RIFF_SIZE
+    if rf64:
+        riff_size += 8 + 28  # ds64 chunk with the 64-bit RIFF and data sizes
+
+    piece_start = start_time + pd.Timedelta(seconds=frame0 / sample_rate)
+    piece_end = start_time + pd.Timedelta(seconds=frame1 / sample_rate)
+    sfile = os.path.join(savedir, split_filename(prefix or os.path.splitext(os.path.basename(fname))[0],
+                                                 piece_start))
+
+    if checksums is not None:
+        sha256 = stg.cached_sha256(sfile, checksums)
+        if (sha256 and os.path.getsize(sfile) == 8 + riff_size and
+                os.stat(sfile).st_mtime_ns >= os.stat(fname).st_mtime_ns):
+            return dict(source=fname, destination=sfile, method='existing', bytes=8 + riff_size, sha256=sha256,
+                        start_time=piece_start, end_time=piece_end)
+
+    sha = hashlib.sha256()
+    with open(fname, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, open(sfile, 'wb') as out:
+        fmt_offset = header['fmt_offset']
+        if rf64:
+            chunks = [b'RF64', struct.pack('<I', 0xFFFFFFFF), b'WAVE',
+                      b'ds64', struct.pack('<IQQQI', 28, riff_size, data_size, frame1 - frame0, 0)]
+        else:
+            chunks = [b'RIFF', struct.pack('<I', riff_size), b'WAVE']
+        chunks += [b'fmt ', struct.pack('<I', fmt_size), mm[fmt_offset:fmt_offset + fmt_size], b'\0' * (fmt_size % 2),
+                   b'data', struct.pack('<I', 0xFFFFFFFF if rf64 else data_size)]
+        for chunk in chunks:
+            sha.update(chunk)
+            out.write(chunk)
+
+        view = memoryview(mm)
+        try:
+            offset = header['data_offset'] + frame0 * block_align
+            for i in range(offset, offset + data_size, bufsize):
+                block = view[i:min(i + bufsize, offset + data_size)]
+                sha.update(block)
+                out.write(block)
+                block.release()
+        finally:
+            view.release()
+        if data_size % 2:
+            sha.update(b'\0')
+            out.write(b'\0')
+    if checksums is not None:
+        stg.record_sha256(sfile, sha.hexdigest(), checksums)
+
+    return dict(source=fname, destination=sfile, method='split', bytes=os.path.getsize(sfile), sha256=sha.hexdigest(),
+                start_time=piece_start, end_time=piece_end)
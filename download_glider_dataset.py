@@ -2,7 +2,7 @@
 
 """
 Author: Lori Garzio on 2/11/2025
-Last modified: 8/19/2025
+Last modified: 10/17/2026
 Download a user-specified glider dataset in netCDF format from RUCOOL's glider ERDDAP server and save to a local
 directory
 """
@@ -11,22 +11,27 @@ import numpy as np
 import os
 import yaml
 import time
-import dataset_archiving.common as cf
+import dataset_archiving.catalog as cat
+import dataset_archiving.erddap_cache as ec
+import dataset_archiving.instrumentation as ins
 
 
 def flatten(lst):
     return [item for sublist in lst for item in sublist]
 
 
-def main(deploy, version, aev, sdir):
+def main(deploy, version, aev, sdir, cachedir=None, window='7D', refresh=False):
     start_time = time.time()  # Record the start time
     dsid = f'{deploy}-{version}'
+    run = ins.RunReport('download_glider_dataset', label=dsid)
 
     sdir = os.path.join(sdir, deploy)
     os.makedirs(sdir, exist_ok=True)
     ru_server = 'https://slocum-data.marine.rutgers.edu/erddap'
 
-    ds_vars = cf.get_dataset_variables(ru_server, dsid)
+    # variables in the dataset from the local dataset catalog (refreshed from ERDDAP if it's out of date)
+    with run.span('dataset_variables'):
+        ds_vars = cat.get_dataset_variables(ru_server, dsid)
 
     root_dir = os.path.dirname(os.path.abspath(__file__))
     configdir = os.path.join(root_dir, 'configs')
@@ -48,13 +53,13 @@ def main(deploy, version, aev, sdir):
                     glider_vars.append([sv.replace('_shifted', '')])
     
     # add all of the instrument metadata vars
-    instrument_vars = [x for x in ds_vars if 'instrument_' in x]
+    instrument_vars = ds_vars.containing('instrument_')
     glider_vars.append(instrument_vars)
 
     # add QC flags
     qcflagvars = ['_qartod_summary_flag', '_hysteresis_test']
     for qc in qcflagvars:
-        addqcvars = [x for x in ds_vars if qc in x]
+        addqcvars = ds_vars.containing(qc)
         glider_vars.append(addqcvars)
 
     # add extra engineering variables if specified
@@ -67,15 +72,23 @@ def main(deploy, version, aev, sdir):
     glider_vars = np.unique(glider_vars).tolist()
 
     # request dataset and save the .nc file to a local directory
+    # the dataset is downloaded in time windows that are saved to a cache, so re-runs only download
+    # the time windows or variables that are missing from the cache (recent time windows and time windows with no
+    # data are downloaded again after 24 hours, set refresh=True to download all of the time windows again)
     kwargs = dict()
-    kwargs['variables'] = glider_vars
-    ds = cf.return_erddap_nc(ru_server, dsid, **kwargs)
+    kwargs['window'] = window
+    kwargs['cachedir'] = cachedir
+    kwargs['refresh'] = refresh
+    with run.span('download'):
+        ds = ec.return_cached_erddap_nc(ru_server, dsid, glider_vars, **kwargs)
     fname = f'{dsid}.nc'
-    ds.to_netcdf(os.path.join(sdir, fname))
+    with run.span('to_netcdf'):
+        ds.to_netcdf(os.path.join(sdir, fname))
 
     end_time = time.time()  # Record the end time
     elapsed_time = (end_time - start_time) / 60 # Calculate the elapsed time in minutes
     print(f"Time elapsed: {elapsed_time:.2f} minutes")  # Print the elapsed time
+    run.finish(os.path.join(sdir, 'run_reports'))
 
 
 if __name__ == '__main__':
@@ -83,4 +96,6 @@ if __name__ == '__main__':
     version = 'profile-sci-delayed'
     add_engineering_vars = True  # True False
     savedir = '/Users/garzio/Documents/gliderdata'
-    main(deployment, version, add_engineering_vars, savedir)
+    cache_dir = None  # None uses the default cache directory ~/.cache/dataset_archiving/erddap
+    refresh_cache = False  # True downloads all of the time windows again
+    main(deployment, version, add_engineering_vars, savedir, cache_dir, refresh=refresh_cache)
@@ -2,7 +2,7 @@
 
 """
 Author: Lori Garzio on 4/28/2021
-Last modified: 5/12/2025
+Last modified: 10/17/2026
 Process final pH glider dataset to upload to the NCEI OA data portal
 (https://www.ncei.noaa.gov/access/ocean-carbon-acidification-data-system-portal/)
 1. Apply QC
@@ -11,9 +11,8 @@ Process final pH glider dataset to upload to the NCEI OA data portal
 4. Optional: remove first 10 pH profiles (bad/suspect data when the sensor was equilibrating)
 5. Fix some historically incorrect metadata (if necessary)
 6. Add additional metadata specific to pH datasets
-7. Export a lonlat.csv file required for NCEI data submission
-8. Save the final netCDF file
-9. Print variable and deployment information to a csv file to help with NCEI submission
+7. Save the final netCDF file, a lonlat.csv file required for NCEI data submission and variable, deployment
+and instrument information csv files to help with NCEI submission (written together in one pass)
 """
 
 import os
@@ -23,6 +22,9 @@ import xarray as xr
 import datetime as dt
 import yaml
 import dataset_archiving.common as cf
+import dataset_archiving.export as ex
+import dataset_archiving.instrumentation as ins
+import dataset_archiving.qc_rules as qcr
 
 
 def delete_attrs(da):
@@ -33,41 +35,47 @@ def delete_attrs(da):
             continue
 
 
-def main(fname, rfp):
+def main(fname, rfp, chunks=None, encoding_profile=None):
     savedir = os.path.join(os.path.dirname(fname), 'ncei_pH')
     os.makedirs(savedir, exist_ok=True)
 
-    ds = xr.open_dataset(fname)
-    try:
-        deploy = ds.attrs['deployment']
-    except KeyError:
-        f = fname.split('/')[-1]
-        deploy = f'{f.split("-")[0]}-{f.split("-")[1]}'  # get the deployment from the filename
+    # record the time and memory used by each processing stage
+    run = ins.RunReport('phglider_to_ncei')
 
-    # grab profile_id encoding
-    pid_encoding = ds.profile_id.encoding
+    # optionally open the file lazily in chunks along the obs dimension (using dask) so large datasets are
+    # processed and written out chunk by chunk instead of being loaded into memory
+    with run.span('open'):
+        if chunks:
+            ds = xr.open_dataset(fname, chunks=dict(obs=chunks))
+        else:
+            ds = xr.open_dataset(fname)
+        try:
+            deploy = ds.attrs['deployment']
+        except KeyError:
+            f = fname.split('/')[-1]
+            deploy = f'{f.split("-")[0]}-{f.split("-")[1]}'  # get the deployment from the filename
 
-    ds = ds.drop_vars(names=['profile_id', 'rowSize', 'trajectory', 'trajectoryIndex'])
-    ds = ds.swap_dims({'obs': 'time'})
-    ds = ds.sortby(ds.time)
+        # grab profile_id encoding
+        pid_encoding = ds.profile_id.encoding
 
-    comment = 'Data flagged by QC tests (suspect and fail) were removed.'
+        ds = ds.drop_vars(names=['profile_id', 'rowSize', 'trajectory', 'trajectoryIndex'])
+        ds = ds.swap_dims({'obs': 'time'})
 
-    # apply QARTOD QC to all variables except pressure
-    kwargs = dict()
-    kwargs['add_comment'] = comment
-    cf.apply_qartod_qc(ds, **kwargs)
+    with run.span('sort'):
+        ds = cf.sort_dataset(ds, 'time')  # only sorts if the data aren't already in time order
 
-    # apply CTD hysteresis test QC
-    cf.apply_ctd_hysteresis_qc(ds, **kwargs)
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir = os.path.dirname(root_dir)
+    configdir = os.path.join(parent_dir, 'configs')
 
-    # apply pH QC
-    ds['pH'].attrs['comment'] = ' '.join((ds['pH'].comment, comment))
-    qcvars = [x for x in list(ds.data_vars) if 'pH_qartod_' in x]
-    for qv in qcvars:
-        qc_idx = np.where(np.logical_or(ds[qv].values == 3, ds[qv].values == 4))[0]
-        if len(qc_idx) > 0:
-            ds['pH'][qc_idx] = np.nan
+    # apply QC using the pH rules in the qc_rules.yml config file:
+    # QARTOD QC to all variables except pressure, CTD hysteresis test QC, pH QC,
+    # remove pH/TA/omega when depth_interpolated < 1 m (there's a lot of noise in pH at the surface),
+    # and optionally remove the first n pH/TA/omega profiles (bad/suspect data when the sensor was equilibrating)
+    with run.span('qc'):
+        params = dict(remove_first_profiles=rfp)
+        qc_report, qc_counts = qcr.apply_qc_rules(ds, configdir, 'pH', params=params)
+        print(qc_report.to_string(index=False))
 
     # drop extra variables
     drop_vars = []
@@ -78,25 +86,8 @@ def main(fname, rfp):
         drop_vars.append(append_vars)
 
     drop_vars = [x for xs in drop_vars for x in xs]
-    ds = ds.drop_vars(drop_vars)
-
-    # there's a lot of noise in pH at the surface, so set pH/TA/omega values to nan when depth_interpolated < 1 m
-    add_comment = 'Values at depths < 1m were removed due to noise typically observed at the surface.'
-    oavars = ['pH', 'aragonite_saturation_state', 'total_alkalinity']
-    idx = np.where(ds.depth_interpolated < 1)[0]
-    for oav in oavars:
-        ds[oav].values[idx] = np.nan
-        ds[oav].attrs['comment'] = ' '.join((ds[oav].comment, add_comment))
-
-    # remove first n pH/TA/omega profiles (bad/suspect data when the sensor was equilibrating)
-    if np.logical_and(isinstance(rfp, int), rfp > 0):
-        add_comment = f'First {rfp} profiles removed due to bad/suspect data when the sensor was equilibrating.'
-        profiletimes = np.unique(ds.profile_time.values)
-        ptimes = profiletimes[0:rfp]
-        pidx = np.where(np.isin(ds.profile_time.values, ptimes))[0]
-        for oav in oavars:
-            ds[oav].values[pidx] = np.nan
-            ds[oav].attrs['comment'] = ' '.join((ds[oav].comment, add_comment))
+    with run.span('drop_vars'):
+        ds = ds.drop_vars(drop_vars)
 
     # add profile_id
     attributes = dict(
@@ -107,10 +98,11 @@ def main(fname, rfp):
         long_name='Profile ID'
     )
     name = 'profile_id'
-    pid = ds.profile_time.values.astype('datetime64[s]').astype('int')
-    da = xr.DataArray(pid, coords=ds.profile_time.coords, dims=ds.profile_time.dims, name=name, attrs=attributes)
-    ds[name] = da
-    ds[name].encoding = pid_encoding
+    with run.span('profile_id'):
+        pid = ds.profile_time.data.astype('datetime64[s]').astype('int')
+        da = xr.DataArray(pid, coords=ds.profile_time.coords, dims=ds.profile_time.dims, name=name, attrs=attributes)
+        ds[name] = da
+        ds[name].encoding = pid_encoding
 
     # fix pressure units
     if ds.pressure.units == 'bar':
@@ -137,10 +129,6 @@ def main(fname, rfp):
         delete_attrs(ds[v])
 
     # update global attrs using the phglider_attrs.yml config file
-    root_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(root_dir)
-    configdir = os.path.join(parent_dir, 'configs')
-
     with open(os.path.join(configdir, 'phglider_attrs.yml')) as f:
         phglider_attrs = yaml.safe_load(f)
 
@@ -151,90 +139,55 @@ def main(fname, rfp):
 
     ds.attrs['references'] = ', '.join((ds.attrs['references'], phglider_attrs['references']))
 
-    # export unique lonlat.csv file NCEI data submission
-    lonlat = dict(lon=list(np.round(ds.longitude.values, 4)),
-                  lat=list(np.round(ds.latitude.values, 4)))
-    df = pd.DataFrame(lonlat)
-    df.drop_duplicates(inplace=True)
+    # the sortedness marker is only used in processing, don't include it in the archived file
+    ds.attrs.pop(cf.SORTED_BY_ATTR, None)
+
+    # optional compression and chunking of the netCDF files, using the encoding_profiles.yml config file
+    # without a profile, the encoding from the original file is kept
+    if encoding_profile:
+        ex.apply_encoding_profile(ds, ex.load_encoding_profile(configdir, encoding_profile))
+
+    def sidecars(values):
+        # unique lonlat.csv file for NCEI data submission, and the deployment extents
+        lonlat, bounds = ex.unique_lonlat(values['longitude'], values['latitude'], decimals=4)
+        df = pd.DataFrame(lonlat, columns=['lon', 'lat'])
+
+        # deployment information for NCEI metadata submission
+        rownames = ['start', 'end', 'North Latitude Extent', 'South Latitude Extent', 'West Longitude Extent',
+                    'East Longitude Extent', 'summary']
+        deploy_values = [pd.to_datetime(np.nanmin(ds.time.values)).strftime('%Y-%m-%d'),
+                         pd.to_datetime(np.nanmax(ds.time.values)).strftime('%Y-%m-%d'),
+                         np.round(bounds['north'], 3),
+                         np.round(bounds['south'], 3),
+                         np.round(bounds['west'], 3),
+                         np.round(bounds['east'], 3),
+                         ds.attrs['summary']]
+        dfdeploy = pd.DataFrame(dict(name=rownames, value=deploy_values))
+
+        tables = dict()
+        tables[os.path.join(savedir, f'lonlat-{deploy}.csv')] = (df, dict(header=None, index=None))
+        tables[os.path.join(savedir, f'variables-{deploy}.csv')] = (ex.variables_table(ds), dict())
+        tables[os.path.join(savedir, f'deployment_metadata-{deploy}.csv')] = (dfdeploy, dict(index=False))
+        tables[os.path.join(savedir, f'instrument_metadata-{deploy}.csv')] = (ex.instrument_table(ds), dict(index=False))
+        return tables
+
+    # save the final .nc file, a file with the first 100 data points to test formatting in the IOOS compliance
+    # checker (https://compliance.ioos.us/index.html), the lonlat.csv file and the variable, deployment and
+    # instrument information for the NCEI metadata submission to csv, all from one pass through the data
+    with run.span('export'):
+        savefile = os.path.join(savedir, f'{deploy}-delayed.nc')
+        sfile = os.path.join(savedir, f'{deploy}-delayed-test.nc')
+        ex.write_archive(ds, savefile, sfile, values=['longitude', 'latitude'], sidecars=sidecars)
+
+    run.label = deploy
+    run.finish(os.path.join(os.path.dirname(fname), 'run_reports'))
+
+    return run
 
-    df.to_csv(os.path.join(savedir, f'lonlat-{deploy}.csv'), header=None, index=None)
-
-    # save final .nc file
-    savefile = os.path.join(savedir, f'{deploy}-delayed.nc')
-    ds.to_netcdf(savefile, format="netCDF4", engine="netcdf4", unlimited_dims=["time"])
-
-    # file to test formatting in IOOS compliance checker https://compliance.ioos.us/index.html
-    sfile = os.path.join(savedir, f'{deploy}-delayed-test.nc')
-    newds = ds.isel(time=slice(0, 100))
-    newds.to_netcdf(sfile, format="netCDF4", engine="netcdf4", unlimited_dims=["time"])
-
-    # print variable information for NCEI metadata submission to csv
-    vardict = dict()
-    for v in list(ds.coords):
-        try:
-            units = ds[v].units
-        except AttributeError:
-            units = ''
-        vardict[v] = dict(units=units,
-                          long_name=ds[v].long_name)
-    for v in list(ds.data_vars):
-        try:
-            units = ds[v].units
-        except AttributeError:
-            units = ''
-        vardict[v] = dict(units=units,
-                          long_name=ds[v].long_name)
-
-    dfmeta = pd.DataFrame(vardict)
-    dfmeta = dfmeta.transpose()
-    dfmeta.to_csv(os.path.join(savedir, f'variables-{deploy}.csv'))
-
-    # print deployment information for NCEI metadata submission to csv
-    rownames = ['start', 'end', 'North Latitude Extent', 'South Latitude Extent', 'West Longitude Extent', 'East Longitude Extent', 'summary']
-    north = np.round(np.nanmax(df.lat), 3)
-    south = np.round(np.nanmin(df.lat), 3)
-    west = np.round(np.nanmin(df.lon), 3)
-    east = np.round(np.nanmax(df.lon), 3)
-    
-    values = [pd.to_datetime(np.nanmin(ds.time.values)).strftime('%Y-%m-%d'),
-              pd.to_datetime(np.nanmax(ds.time.values)).strftime('%Y-%m-%d'),
-              north,
-              south,
-              west,
-              east,
-              ds.attrs['summary']]
-    
-    vardict = dict(name = rownames,
-                   value = values)
-    dfmeta = pd.DataFrame(vardict)
-    dfmeta.to_csv(os.path.join(savedir, f'deployment_metadata-{deploy}.csv'), index=False)
-
-    # print instrument metadata to csv
-    instrument_vars = [x for x in list(ds.data_vars) if 'instrument_' in x]
-
-    vardict = dict(name = instrument_vars,
-                   maker = [],
-                   model = [],
-                   sn = [],
-                   cal_date = [],
-                   calibration_coeffs = []
-                   )
-
-    for iv in instrument_vars:
-        vardict['maker'].append(ds[iv].attrs["maker"])
-        vardict['model'].append(ds[iv].attrs["model"])
-        vardict['sn'].append(ds[iv].attrs["serial_number"])
-        vardict['cal_date'].append(ds[iv].attrs["calibration_date"])
-        try:
-            vardict['calibration_coeffs'].append(ds[iv].attrs["calibration_coefficients"])
-        except KeyError:
-            vardict['calibration_coeffs'].append('')    
-    
-    dfmeta = pd.DataFrame(vardict)
-    dfmeta.to_csv(os.path.join(savedir, f'instrument_metadata-{deploy}.csv'), index=False)
-    
 
 if __name__ == '__main__':
     ncfile = '/Users/garzio/Documents/rucool/Saba/gliderdata/2023/ru34-20230920T1506/ru34-20230920T1506-profile-sci-delayed.nc'
     remove_first_profiles = 10  # remove the first 10-12 pH profiles? # of profiles to remove or False
-    main(ncfile, remove_first_profiles)
+    chunk_size = None  # number of data points per chunk to process large files lazily, or None to load the file
+    encoding = None  # netCDF compression/chunking profile, e.g. 'small-archive', or None for the default encoding
+    main(ncfile, remove_first_profiles, chunk_size, encoding)
@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+
+"""
+Shared test fixtures: a small ncCF (contiguous ragged array) profile dataset served from a local http.server that
+answers tabledap .nc requests with time constraints like ERDDAP does.
+"""
+
+import http.server
+import os
+import tempfile
+import threading
+import urllib.parse
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+DATASET_ID = 'ru00-20240101T0000-profile-sci-delayed'
+T0 = pd.Timestamp('2024-01-01T00:00:00Z')
+
+
+def make_profile_dataset(nprofiles=4, nobs=6):
+    '''
+    Small ncCF profile dataset: one observation every 20 minutes, nobs observations per profile
+    '''
+    n = nprofiles * nobs
+    seconds = (T0.timestamp() + np.arange(n) * 1200).astype('float64')
+    profile_time = seconds.reshape(nprofiles, nobs).mean(axis=1)
+    ds = xr.Dataset(
+        data_vars=dict(
+            profile_id=('profile', profile_time.astype('int32'), dict(cf_role='profile_id')),
+            rowSize=('profile', np.full(nprofiles, nobs, dtype='int32'), dict(sample_dimension='obs')),
+            trajectoryIndex=('profile', np.zeros(nprofiles, dtype='int32'), dict(instance_dimension='trajectory')),
+            trajectory=('trajectory', ['ru00-20240101T0000'], dict(cf_role='trajectory_id')),
+            time=('obs', seconds, dict(units='seconds since 1970-01-01T00:00:00Z')),
+            depth=('obs', np.tile(np.linspace(0, 50, nobs), nprofiles).astype('float32')),
+            temperature=('obs', np.linspace(20, 10, n).astype('float32'))
+        ),
+        attrs=dict(featureType='TrajectoryProfile', cdm_data_type='TrajectoryProfile')
+    )
+
+    return ds
+
+
+class ERDDAPHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Answer tabledap .nc requests for the dataset with the rows that match the time constraints, or a 404 error
+    if there are no matching rows (like ERDDAP). The first `failures` requests return a 500 error
+    '''
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        if server.failures > 0:
+            server.failures -= 1
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        seconds = server.dataset.time.values
+        mask = np.ones(len(seconds), dtype=bool)
+        query = urllib.parse.unquote(urllib.parse.urlparse(self.path).query)
+        for constraint in query.split('&'):
+            for op, func in [('>=', np.greater_equal), ('<=', np.less_equal), ('<', np.less), ('>', np.greater)]:
+                if constraint.startswith(f'time{op}'):
+                    # erddapy sends times as seconds since 1970-01-01
+                    mask &= func(seconds, float(constraint[len(f'time{op}'):]))
+                    break
+
+        if not mask.any():
+            self.send_response(404)
+            self.end_headers()
+            self.wfile.write(b'Error {message="Not Found: Your query produced no matching results."}')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-netcdf')
+        self.end_headers()
+        self.wfile.write(subset_nc(server.dataset, mask))
+
+
+def subset_nc(ds, mask):
+    '''
+    Rows of a ragged array dataset where mask is True, as netCDF bytes (profiles with no rows are dropped)
+    '''
+    obs_profile = np.repeat(np.arange(ds.sizes['profile']), ds.rowSize.values)
+    counts = np.bincount(obs_profile[mask], minlength=ds.sizes['profile'])
+    sub = ds.isel(obs=np.flatnonzero(mask), profile=np.flatnonzero(counts))
+    sub['rowSize'].values = counts[counts > 0].astype('int32')
+
+    fd, fname = tempfile.mkstemp(suffix='.nc')
+    os.close(fd)
+    try:
+        sub.to_netcdf(fname)
+        with open(fname, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(fname)
+
+
+@pytest.fixture
+def erddap_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ERDDAPHandler)
+    server.dataset = make_profile_dataset()
+    server.requests = []
+    server.failures = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/erddap'
+    server.dataset_id = DATASET_ID
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,30 @@
+#! /usr/bin/env python
+
+"""
+Smoke tests for the benchmarks (benchmarks/), so a change to the scripts they run doesn't break them silently
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import encoding_benchmark as eb  # noqa: E402
+import run_benchmarks as rb  # noqa: E402
+
+
+def test_run_benchmarks(tmp_path):
+    run = rb.main([10000], str(tmp_path), str(tmp_path / 'results.json'))
+    benchmarks = [x['benchmark'] for x in run['results']]
+    for script, stages in rb.STAGES.items():
+        assert [f'{script}.{x}' for x in stages] == [x for x in benchmarks if x.startswith(f'{script}.') and
+                                                     not x.endswith('.main')]
+    assert 'common.interpolate_depth' in benchmarks
+    assert rb.load_results(str(tmp_path / 'results.json')).benchmark.tolist() == benchmarks
+
+
+def test_encoding_benchmark(tmp_path):
+    run = eb.main([10000], str(tmp_path), str(tmp_path / 'encoding_results.json'), profiles=['small-archive'])
+    result, = run['results']
+    assert result['profile'] == 'small-archive'
+    assert result['size_mb'] > 0
+    assert os.path.isfile(tmp_path / 'n10000' / 'encoding-small-archive.nc')
@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+
+"""
+Tests for the local ERDDAP dataset catalog (dataset_archiving.catalog)
+"""
+
+import io
+import pandas as pd
+import pytest
+import dataset_archiving.catalog as cat
+
+SERVER = 'http://127.0.0.1/erddap'
+
+
+def test_variable_index():
+    ds_vars = cat.VariableIndex(['conductivity', 'conductivity_qartod_summary_flag', 'instrument_ctd',
+                                 'platform_instrument_ctd', 'salinity_qartod_summary_flag_v2',
+                                 'temperature_hysteresis_test'])
+
+    assert 'instrument_ctd' in ds_vars
+    assert ds_vars.containing('instrument_') == ['instrument_ctd', 'platform_instrument_ctd']
+    assert ds_vars.containing('_qartod_summary_flag') == ['conductivity_qartod_summary_flag',
+                                                          'salinity_qartod_summary_flag_v2']
+    assert ds_vars.with_prefix('instrument_') == ['instrument_ctd']
+    assert ds_vars.with_suffix('_qartod_summary_flag') == ['conductivity_qartod_summary_flag']
+
+
+def test_list_server_datasets(monkeypatch):
+    csv = ('datasetID,tabledap\n'
+           ',\n'
+           'allDatasets,http://127.0.0.1/erddap/tabledap/allDatasets\n'
+           'ru39-20240429T1522-profile-sci-delayed,http://127.0.0.1/erddap/tabledap/ru39-20240429T1522\n'
+           'sst_grid,\n')
+    read_csv = pd.read_csv
+    monkeypatch.setattr(cat.pd, 'read_csv', lambda url, **kwargs: read_csv(io.StringIO(csv), **kwargs))
+
+    assert cat.list_server_datasets(SERVER) == ['ru39-20240429T1522-profile-sci-delayed']
+
+
+def test_refresh_catalog_errors(monkeypatch, tmp_path):
+    def fetch_dataset_metadata(server, ds_id):
+        if ds_id.startswith('bad'):
+            raise(OSError(f'{ds_id} not found'))
+        return dict(fetched=pd.Timestamp.now(tz='UTC').strftime('%Y-%m-%dT%H:%M:%SZ'), global_attributes=dict(),
+                    variables=dict(time=dict()))
+
+    monkeypatch.setattr(cat, 'fetch_dataset_metadata', fetch_dataset_metadata)
+    catalog, errors = cat.refresh_catalog(SERVER, dataset_ids=['bad-1', 'good-1', 'bad-2', 'good-2'],
+                                          catalog_dir=str(tmp_path))
+
+    assert sorted(catalog.keys()) == ['good-1', 'good-2']
+    assert sorted(errors.keys()) == ['bad-1', 'bad-2']
+    assert sorted(cat.load_catalog(SERVER, str(tmp_path)).keys()) == ['good-1', 'good-2']
+
+    assert cat.get_dataset_variables(SERVER, 'good-1', catalog_dir=str(tmp_path)).names == ['time']
+    with pytest.raises(ValueError):
+        cat.get_dataset_metadata(SERVER, 'bad-1', catalog_dir=str(tmp_path))
@@ -0,0 +1,155 @@
+#! /usr/bin/env python
+
+"""
+Tests for dataset_archiving.common
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import dataset_archiving.common as cf
+
+
+def make_time_dataset(seconds):
+    time = np.array(seconds, dtype='int64').astype('datetime64[s]').astype('datetime64[ns]')
+    return xr.Dataset(dict(temperature=('time', np.arange(len(time), dtype='float64'))), coords=dict(time=time),
+                      attrs=dict(title='test'))
+
+
+def test_sort_dataset():
+    ds = make_time_dataset([3, 1, 2])
+    sorted_ds = cf.sort_dataset(ds, 'time')
+
+    np.testing.assert_array_equal(sorted_ds.temperature.values, [1, 2, 0])
+    assert sorted_ds.attrs[cf.SORTED_BY_ATTR] == 'time'
+    assert sorted_ds.attrs['title'] == 'test'
+    assert cf.SORTED_BY_ATTR not in ds.attrs
+
+
+def test_sort_dataset_already_sorted():
+    # the data aren't copied, and the marker is only set on the returned dataset
+    ds = make_time_dataset([1, 2, 3])
+    sorted_ds = cf.sort_dataset(ds, 'time')
+
+    assert np.shares_memory(sorted_ds.temperature.values, ds.temperature.values)
+    assert sorted_ds.attrs[cf.SORTED_BY_ATTR] == 'time'
+    assert cf.SORTED_BY_ATTR not in ds.attrs
+
+
+def test_sort_dataset_trusts_marker():
+    ds = make_time_dataset([3, 1, 2]).assign_attrs({cf.SORTED_BY_ATTR: 'time'})
+
+    assert cf.sort_dataset(ds, 'time') is ds
+
+
+def gapped_array(rng, n, dtype, nan_fraction):
+    values = rng.normal(10, 5, n).astype(dtype)
+    values[rng.random(n) < nan_fraction] = np.nan
+    # add some longer gaps, and gaps at the start and end
+    for start in rng.integers(0, n, 3):
+        values[start:start + rng.integers(1, 8)] = np.nan
+    values[0:rng.integers(0, 4)] = np.nan
+    values[n - rng.integers(0, 4):] = np.nan
+
+    return values
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float64'])
+@pytest.mark.parametrize('limit', [None, 1, 2, 3, 6])
+@pytest.mark.parametrize('limit_direction', ['forward', 'backward', 'both'])
+def test_interpolate_gaps(dtype, limit, limit_direction):
+    rng = np.random.default_rng(42)
+    for nan_fraction in [0, 0.1, 0.3, 0.6, 0.95]:
+        for n in [1, 2, 10, 500]:
+            values = gapped_array(rng, n, dtype, nan_fraction)
+            expected = pd.Series(values).interpolate(method='linear', limit=limit,
+                                                     limit_direction=limit_direction).values
+            result = cf.interpolate_gaps(values.copy(), limit=limit, limit_direction=limit_direction)
+
+            assert result.dtype == values.dtype
+            np.testing.assert_array_equal(np.isnan(result), np.isnan(expected))
+            np.testing.assert_allclose(result, expected, rtol=np.finfo(dtype).eps * 4, equal_nan=True)
+
+
+@pytest.mark.parametrize('limit_direction', ['forward', 'backward', 'both'])
+def test_interpolate_gaps_segments(limit_direction):
+    # gaps aren't interpolated across segments, the same as interpolating each segment separately
+    rng = np.random.default_rng(7)
+    values = gapped_array(rng, 1000, 'float64', 0.3)
+    segments = np.repeat(np.arange(50), rng.multinomial(1000, np.ones(50) / 50))
+    expected = pd.Series(values).groupby(segments).transform(
+        lambda x: x.interpolate(method='linear', limit=2, limit_direction=limit_direction)).values
+    result = cf.interpolate_gaps(values.copy(), limit=2, limit_direction=limit_direction, segments=segments)
+
+    np.testing.assert_allclose(result, expected, rtol=1e-12, equal_nan=True)
+
+
+def test_interpolate_gaps_invalid_direction():
+    with pytest.raises(ValueError):
+        cf.interpolate_gaps(np.array([1.0, np.nan, 3.0]), limit_direction='sideways')
+
+
+def pandas_interpolate_depth(dataset):
+    '''
+    Previous implementation of common.interpolate_depth with pandas.DataFrame.interpolate, used as the reference
+    '''
+    depthcopy = dataset.depth.copy()
+    for qv in [x for x in dataset.data_vars if 'pressure_qartod' in x]:
+        qv_vals = dataset[qv].values
+        qv_idx = np.where(qv_vals == 4)[0]
+        depthcopy[qv_idx] = np.nan
+
+    df = depthcopy.to_dataframe()
+    df = df.loc[:, ~df.columns.duplicated()]
+
+    return df['depth'].interpolate(method='linear', limit_direction='both', limit=2).values
+
+
+def make_deployment(nprofiles=20, seed=0):
+    '''
+    Small synthetic glider deployment: yos between the surface and 30 m, with missing depths, failed pressure
+    QARTOD flags and longer gaps at the surface (e.g. while the glider is transmitting). The glider deployment files
+    are served from the RUCOOL ERDDAP server and aren't kept in this repository, and the tests run without network
+    access, so the parity with the previous implementation (pandas_interpolate_depth) is checked on synthetic
+    deployments with the same features instead of a real deployment file
+    '''
+    rng = np.random.default_rng(seed)
+    nobs = rng.integers(20, 60, nprofiles)
+    n = nobs.sum()
+    time = np.datetime64('2024-01-01T00:00:00', 'ns') + np.arange(n) * np.timedelta64(4, 's')
+    profile_time = np.repeat(time[np.r_[0, np.cumsum(nobs)[:-1]]], nobs)
+    depth = np.concatenate([np.abs(np.sin(np.linspace(0, np.pi, k))) * 30 for k in nobs]).astype('float32')
+    depth[rng.random(n) < 0.3] = np.nan
+    depth[0:2] = np.nan
+    for i in np.cumsum(nobs)[:-1:4]:
+        depth[i - 3:i + 5] = np.nan  # surface gaps longer than the interpolation limit
+    flags = np.where(rng.random(n) < 0.05, 4, 1).astype('int8')
+
+    ds = xr.Dataset(
+        data_vars=dict(
+            depth=('time', depth, dict(ancillary_variables='pressure_qartod_summary_flag', units='m')),
+            pressure_qartod_summary_flag=('time', flags),
+            profile_time=('time', profile_time)
+        ),
+        coords=dict(time=time)
+    )
+    ds.depth.encoding = dict(dtype='float32', _FillValue=np.float32(-999))
+
+    return ds
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_interpolate_depth(seed):
+    ds = make_deployment(seed=seed)
+    expected = pandas_interpolate_depth(ds)
+    cf.interpolate_depth(ds)
+
+    da = ds.depth_interpolated
+    assert da.dtype == ds.depth.dtype
+    np.testing.assert_array_equal(da.values, expected.astype(ds.depth.dtype))
+    assert da.attrs['ancillary_variables'] == 'pressure_qartod_summary_flag depth'
+    assert da.attrs['long_name'] == 'Interpolated Depth'
+    assert da.encoding['_FillValue'] == np.float32(-999)
+    assert np.isnan(ds.depth.values).any()  # the original depth isn't modified
+    assert np.isnan(da.values).any()  # gaps longer than the limit aren't filled
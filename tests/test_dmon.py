@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+
+"""
+Tests for sorting DMON recordings (dataset_archiving.dmon)
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import dataset_archiving.dmon as dmon
+
+T0 = pd.Timestamp('2024-05-01 00:00', tz='UTC')
+T1 = pd.Timestamp('2024-05-10 00:00', tz='UTC')
+
+
+def classify_rows(start, end, t0, t1):
+    '''
+    The row by row classification that sort_dmon_wav_files.py used before classify_recordings
+    '''
+    rows = []
+    for xml_start, xml_end in zip(start, end):
+        if (xml_start <= t1) and (xml_end >= t0):
+            split = ''
+            dstart = ''
+            dend = ''
+            tdiff_hours = 0
+            if xml_start < t0:
+                tdiff_hours = (t0 - xml_start).total_seconds() / 60 / 60
+                if tdiff_hours > 6:
+                    split = 'split_start'
+                    dstart = t0
+            if xml_end > t1:
+                tdiff_hours = (xml_end - t1).total_seconds() / 60 / 60
+                if tdiff_hours > 6:
+                    split = 'split_end'
+                    dend = t1
+            rows.append([split, dstart, dend, str(np.round(tdiff_hours, 2))])
+        else:
+            rows.append(['dont include', '', '', 0])
+
+    return pd.DataFrame(rows, columns=['split_file', 'deploy_start', 'deploy_end', 'diff_hours'])
+
+
+@pytest.mark.parametrize('start, end, split_file, diff_hours', [
+    ('2024-04-30 12:00', '2024-05-01 04:00', 'split_start', '12.0'),  # 12 h before the deployment start
+    ('2024-04-30 20:00', '2024-05-01 04:00', '', '4.0'),  # not enough data before the start to split
+    ('2024-05-09 12:00', '2024-05-10 06:20', 'split_end', '6.33'),
+    ('2024-05-02 00:00', '2024-05-02 08:00', '', '0'),
+    ('2024-04-30 12:00', '2024-05-10 12:00', 'split_end', '12.0'),  # both sides, split_end wins
+    ('2024-04-29 12:00', '2024-05-10 03:00', 'split_start', '3.0'),  # both sides, only the start is split
+    ('2024-04-29 12:00', '2024-04-30 12:00', 'dont include', '0'),
+    ('2024-05-10 00:00', '2024-05-10 08:00', 'split_end', '8.0'),  # only touches the deployment end
+    ('2024-04-30 16:00', '2024-05-01 00:00', 'split_start', '8.0'),  # only touches the deployment start
+])
+def test_classify_recordings(start, end, split_file, diff_hours):
+    start = pd.Series([pd.Timestamp(start, tz='UTC')])
+    end = pd.Series([pd.Timestamp(end, tz='UTC')])
+    df = dmon.classify_recordings(start, end, {'ru40': (T0, T1)})
+    assert df.split_file[0] == split_file
+    assert df.diff_hours[0] == diff_hours
+    assert df.deployment[0] == ('' if split_file == 'dont include' else 'ru40')
+    assert df.deploy_start[0] == (T0 if split_file == 'split_start' or (split_file == 'split_end' and
+                                                                        start[0] < T0 - pd.Timedelta(hours=6)) else '')
+    assert df.deploy_end[0] == (T1 if split_file == 'split_end' else '')
+
+
+def test_classify_recordings_rows():
+    # random recordings around the deployment start/end are classified the same as row by row
+    rng = np.random.default_rng(0)
+    start = pd.Series(T0 + pd.to_timedelta(rng.integers(-20 * 3600, 10 * 24 * 3600, 500), unit='s'))
+    end = start + pd.to_timedelta(rng.integers(1, 30 * 3600, 500), unit='s')
+    start[0], end[0] = T0, T1  # exactly the deployment
+
+    df = dmon.classify_recordings(start, end, {'ru40': (T0, T1)})
+    expected = classify_rows(start, end, T0, T1)
+    pd.testing.assert_frame_equal(df.drop(columns='deployment'), expected.astype(dict(diff_hours=str)))
+    # the same summary csv
+    assert df.drop(columns='deployment').to_csv(index=False) == expected.to_csv(index=False)
+
+
+def test_classify_recordings_deployments():
+    # two deployments on one card, each recording is assigned to the deployment it overlaps the most
+    deployments = {'ru40-a': (T0, T0 + pd.Timedelta(days=2)),
+                   'ru40-b': (T0 + pd.Timedelta(days=2, hours=12), T1)}
+    start = pd.Series(pd.to_datetime(['2024-05-01 12:00', '2024-05-02 23:00', '2024-05-03 04:00',
+                                      '2024-05-02 22:00', '2024-05-09 20:00', '2024-05-10 12:00'], utc=True))
+    end = start + pd.Timedelta(hours=8)
+    end[3] = pd.Timestamp('2024-05-03 18:00', tz='UTC')  # 2 h in the first deployment, 6 h in the second
+    df = dmon.classify_recordings(start, end, deployments)
+    assert list(df.deployment) == ['ru40-a', 'ru40-a', 'ru40-b', 'ru40-b', 'ru40-b', '']
+    assert list(df.split_file) == ['', 'split_end', 'split_start', 'split_start', '', 'dont include']
+    assert list(df.diff_hours) == ['0', '7.0', '8.0', '14.0', '4.0', '0']
+    assert df.deploy_end[1] == deployments['ru40-a'][1]
+    assert list(df.deploy_start[2:4]) == [deployments['ru40-b'][0]] * 2
+
+    with pytest.raises(ValueError):
+        dmon.classify_recordings(start, end, {})
+
+
+def test_match_prefixes():
+    files = ['ru40_002_20240501000000_000000.wav', 'ru40_001_20240430230000_500000.wav',
+             'ru40_0010_20240430230000_000000.wav', 'ru40_003_20240501120000_000000.wav', 'ru40_001.log']
+    assert dmon.match_prefixes(files, ['ru40_001_', 'ru40_003', 'ru40_009']) == [
+        'ru40_001_20240430230000_500000.wav', 'ru40_003_20240501120000_000000.wav']
+    assert dmon.match_prefixes(files, ['ru40_001']) == ['ru40_001.log', 'ru40_0010_20240430230000_000000.wav',
+                                                        'ru40_001_20240430230000_500000.wav']
+    assert dmon.match_prefixes(files, []) == []
+
+
+def test_parse_split_times():
+    ts = dmon.parse_split_times(['ru40-20240429T1528_001_20240430235959_999999.wav',
+                                 'ru40-20240429T1528_002_20240501000000_000000.wav'])
+    assert list(ts) == [pd.Timestamp('2024-04-30 23:59:59', tz='UTC'), pd.Timestamp('2024-05-01', tz='UTC')]
+
+
+@pytest.mark.parametrize('split_start, selected', [
+    (False, [False, False, True, True, False]),
+    (True, [False, True, True, True, False]),  # the file before the first file in the deployment
+])
+def test_select_split_files(split_start, selected):
+    files = [f'ru40_001_{t}_000000.wav' for t in ['20240430180000', '20240430230000', '20240501000000',
+                                                  '20240510000000', '20240510010000']]
+    np.testing.assert_array_equal(dmon.select_split_files(files, T0, T1, split_start=split_start), selected)
+
+    # no file in the deployment, or the first file is in the deployment
+    assert not dmon.select_split_files(files[0:2], T0, T1, split_start=True).any()
+    np.testing.assert_array_equal(dmon.select_split_files(files[2:], T0, T1, split_start=True), [True, True, False])
+
+
+def test_scan_xml_files_cache(tmp_path):
+    cachedir = str(tmp_path / 'cache')
+    fname = str(tmp_path / 'dmon001.xml')
+    with open(fname, 'w') as f:
+        f.write('<?xml version="1.0"?><D><E TIME="2024,1,1,0,0,1.6" SUFFIX="wav" CUE="3"/>'
+                '<E TIME="2024,1,1,5,0,0.4"><SUFFIX>log</SUFFIX><CUE/></E></D>')
+
+    df = dmon.scan_xml_files([fname], cachedir=cachedir, processes=False)
+    assert df.start_time[0] == pd.Timestamp('2024-01-01 00:00:02', tz='UTC')
+    assert df.end_time[0] == pd.Timestamp('2024-01-01 05:00:00', tz='UTC')
+    assert df.cue_time[0] == pd.Timestamp('2024-01-01 00:00:01.6', tz='UTC')
+
+    cachefile, = [os.path.join(cachedir, x) for x in os.listdir(cachedir)]
+    assert os.path.basename(cachefile).startswith(f'xml_scan-v{dmon.XML_SCAN_VERSION}-')
+    with open(cachefile) as f:
+        cache = json.load(f)
+    assert cache['version'] == dmon.XML_SCAN_VERSION
+
+    # cached results from another version of the scan aren't used
+    cache['version'] = dmon.XML_SCAN_VERSION - 1
+    cache['files'][fname]['end_time'] = '2000-01-01T00:00:00+00:00'
+    with open(cachefile, 'w') as f:
+        json.dump(cache, f)
+    df = dmon.scan_xml_files([fname], cachedir=cachedir, processes=False)
+    assert df.end_time[0] == pd.Timestamp('2024-01-01 05:00:00', tz='UTC')
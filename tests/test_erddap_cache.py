@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+
+"""
+Tests for the on-disk ERDDAP download cache (dataset_archiving.erddap_cache), against the local ERDDAP server in
+conftest.py.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import dataset_archiving.erddap_cache as ec
+
+CONSTRAINTS = {'time>=': '2024-01-01T00:00:00Z', 'time<=': '2024-01-01T07:40:00Z'}
+VARIABLES = ['time', 'depth', 'temperature']
+
+
+def download(server, cachedir, **kwargs):
+    return ec.return_cached_erddap_nc(server.url, server.dataset_id, VARIABLES, constraints=CONSTRAINTS, window='2h',
+                                      cachedir=str(cachedir), max_workers=1, **kwargs)
+
+
+def age_manifest(cachedir, hours):
+    '''
+    Set the download time of all of the cached time windows to hours ago
+    '''
+    entry = [os.path.join(cachedir, d) for d in os.listdir(cachedir)][0]
+    manifest = ec.load_manifest(entry)
+    downloaded = (pd.Timestamp.now(tz='UTC') - pd.Timedelta(hours=hours)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    for record in manifest['windows'].values():
+        record['downloaded'] = downloaded
+    with open(os.path.join(entry, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+
+def test_cached_windows_not_downloaded_again(erddap_server, tmp_path):
+    ds = download(erddap_server, tmp_path)
+    n = len(erddap_server.requests)
+    cached = download(erddap_server, tmp_path)
+
+    assert n == 4
+    assert len(erddap_server.requests) == n
+    np.testing.assert_array_equal(cached.time.values, ds.time.values)
+
+
+def test_recent_windows_expire(erddap_server, tmp_path):
+    # the test dataset is from 2024, so all of the time windows are recent if recent_days is large enough
+    download(erddap_server, tmp_path, recent_days=100000)
+    age_manifest(tmp_path, hours=2)
+    download(erddap_server, tmp_path, recent_days=100000, ttl_hours=24)
+    assert len(erddap_server.requests) == 4
+
+    age_manifest(tmp_path, hours=48)
+    download(erddap_server, tmp_path, recent_days=100000, ttl_hours=24)
+    assert len(erddap_server.requests) == 8
+
+    # older time windows with data don't expire
+    age_manifest(tmp_path, hours=48)
+    download(erddap_server, tmp_path, recent_days=1, ttl_hours=24)
+    assert len(erddap_server.requests) == 8
+
+
+def test_refresh(erddap_server, tmp_path):
+    download(erddap_server, tmp_path)
+    download(erddap_server, tmp_path, refresh=True)
+
+    assert len(erddap_server.requests) == 8
+
+
+def test_window_expired():
+    now = pd.Timestamp('2024-06-01T00:00:00Z')
+    fresh = dict(empty=False, downloaded='2024-05-31T12:00:00Z')
+    stale = dict(empty=False, downloaded='2024-05-30T00:00:00Z')
+
+    # recent time windows
+    assert not ec.window_expired(fresh, '2024-05-31T00:00:00Z', now=now)
+    assert ec.window_expired(stale, '2024-05-31T00:00:00Z', now=now)
+    assert ec.window_expired(dict(empty=False), '2024-05-31T00:00:00Z', now=now)
+
+    # old time windows with data never expire, empty ones do
+    assert not ec.window_expired(stale, '2024-01-01T00:00:00Z', now=now)
+    assert not ec.window_expired(dict(empty=False), '2024-01-01T00:00:00Z', now=now)
+    assert ec.window_expired(dict(stale, empty=True), '2024-01-01T00:00:00Z', now=now)
+    assert not ec.window_expired(dict(fresh, empty=True), '2024-01-01T00:00:00Z', now=now)
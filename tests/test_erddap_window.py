@@ -0,0 +1,107 @@
+#! /usr/bin/env python
+
+"""
+Tests for downloading ERDDAP datasets in time windows (dataset_archiving.common.return_erddap_window and
+concat_erddap_nc), against the local ERDDAP server in conftest.py.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import dataset_archiving.common as cf
+
+
+def test_return_erddap_window(erddap_server):
+    ds = cf.return_erddap_window(erddap_server.url, erddap_server.dataset_id, '2024-01-01T01:00:00Z',
+                                 '2024-01-01T03:00:00Z')
+    times = pd.to_datetime(ds.time.values).tz_localize('UTC')
+
+    assert len(times) == 6
+    assert times.min() == pd.Timestamp('2024-01-01T01:00:00Z')
+    assert times.max() < pd.Timestamp('2024-01-01T03:00:00Z')
+    assert times.is_monotonic_increasing
+    assert ds.attrs[cf.SORTED_BY_ATTR] == 'time'
+
+
+def test_return_erddap_window_last(erddap_server):
+    # the end of the last time window is included
+    ds = cf.return_erddap_window(erddap_server.url, erddap_server.dataset_id, '2024-01-01T01:00:00Z',
+                                 '2024-01-01T03:00:00Z', last=True)
+
+    assert len(ds.time) == 7
+
+
+def test_return_erddap_window_empty(erddap_server):
+    ds = cf.return_erddap_window(erddap_server.url, erddap_server.dataset_id, '2025-01-01T00:00:00Z',
+                                 '2025-01-02T00:00:00Z')
+
+    assert ds is None
+
+
+def test_return_erddap_window_retries(erddap_server, monkeypatch):
+    monkeypatch.setattr(cf.time, 'sleep', lambda seconds: None)
+    erddap_server.failures = 2
+    ds = cf.return_erddap_window(erddap_server.url, erddap_server.dataset_id, '2024-01-01T00:00:00Z',
+                                 '2024-01-01T02:00:00Z', retries=3)
+
+    assert len(ds.time) == 6
+    assert len(erddap_server.requests) == 3
+
+
+def test_return_erddap_window_retries_exhausted(erddap_server, monkeypatch):
+    monkeypatch.setattr(cf.time, 'sleep', lambda seconds: None)
+    erddap_server.failures = 5
+    with pytest.raises(Exception):
+        cf.return_erddap_window(erddap_server.url, erddap_server.dataset_id, '2024-01-01T00:00:00Z',
+                                '2024-01-01T02:00:00Z', retries=1)
+
+    assert len(erddap_server.requests) == 2
+
+
+def test_return_erddap_window_no_retry(erddap_server, monkeypatch):
+    # errors that aren't from the download (e.g. a bug in decoding the response) are raised without retrying
+    calls = []
+
+    def broken(*args, **kwargs):
+        calls.append(args)
+        raise(KeyError('trajectory'))
+    monkeypatch.setattr(cf, 'return_erddap_nc', broken)
+    with pytest.raises(KeyError):
+        cf.return_erddap_window(erddap_server.url, erddap_server.dataset_id, '2024-01-01T00:00:00Z',
+                                '2024-01-01T02:00:00Z', retries=3)
+
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('bound', ['time>', 'time<'])
+def test_return_erddap_nc_window_strict_bounds(erddap_server, bound):
+    # strict time bounds would be overwritten by the time window constraints
+    with pytest.raises(ValueError):
+        cf.return_erddap_nc(erddap_server.url, erddap_server.dataset_id, window='1h',
+                            constraints={'time>=': '2024-01-01T00:00:00Z', bound: '2024-01-01T03:00:00Z'})
+
+    assert len(erddap_server.requests) == 0
+
+
+@pytest.mark.parametrize('window', ['1h', '150min', '5h', '30D'])
+def test_concat_erddap_nc(erddap_server, window):
+    # profiles split between time windows are merged back together, so the result is the same as downloading
+    # the whole dataset in one request
+    url = erddap_server.url
+    t0, t1 = '2024-01-01T00:00:00Z', '2024-01-01T07:40:00Z'
+    full = cf.return_erddap_window(url, erddap_server.dataset_id, t0, t1, last=True)
+
+    windows = cf.time_windows(t0, t1, window)
+    datasets = [cf.return_erddap_window(url, erddap_server.dataset_id, w0, w1, last=i == len(windows) - 1)
+                for i, (w0, w1) in enumerate(windows)]
+    ds = cf.concat_erddap_nc(datasets)
+
+    assert dict(ds.sizes) == dict(full.sizes)
+    for v in full.variables:
+        np.testing.assert_array_equal(ds[v].values, full[v].values, err_msg=v)
+    np.testing.assert_array_equal(ds.rowSize.values, erddap_server.dataset.rowSize.values)
+
+
+def test_concat_erddap_nc_no_data():
+    with pytest.raises(ValueError):
+        cf.concat_erddap_nc([None, None])
@@ -0,0 +1,30 @@
+#! /usr/bin/env python
+
+"""
+Tests for the archive export helpers (dataset_archiving.export)
+"""
+
+import os
+import numpy as np
+import xarray as xr
+import dataset_archiving.export as ex
+
+configdir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'configs')
+
+
+def test_merge_profile_encoding():
+    ds = xr.Dataset(dict(temperature=('time', np.arange(10.0)), cast=('time', np.arange(10))),
+                    coords=dict(time=np.arange(10).astype('datetime64[s]')))
+    encoding = dict(temperature=dict(dtype=np.float32, _FillValue=np.float32(-9999.0)),
+                    time=dict(calendar='gregorian', zlib=False, _FillValue=None, dtype=np.double))
+    profile = ex.load_encoding_profile(configdir, 'small-archive')
+    merged = ex.merge_profile_encoding(encoding, ex.profile_encoding(ds, profile))
+
+    # explicit settings win, and explicitly uncompressed variables don't get the profile's compression settings
+    assert merged['time'] == dict(zlib=False, chunksizes=(10,), calendar='gregorian', _FillValue=None,
+                                  dtype=np.double)
+    assert merged['temperature']['zlib'] is True
+    assert merged['temperature']['complevel'] == 6
+    assert merged['temperature']['dtype'] is np.float32
+    assert merged['cast']['zlib'] is True
+    assert encoding['temperature'] == dict(dtype=np.float32, _FillValue=np.float32(-9999.0))  # not modified
@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+
+"""
+Tests for the stage-level run reports (dataset_archiving.instrumentation)
+"""
+
+import tracemalloc
+import numpy as np
+import pytest
+import dataset_archiving.instrumentation as ins
+
+
+def allocate(mb):
+    x = np.ones(int(mb * 1e6), dtype='uint8')  # touch the pages so they count toward the RSS
+    return int(x[::4096].sum())
+
+
+def spans(run):
+    return {x['stage']: x for x in run.spans}
+
+
+def check_peaks(run):
+    with run.span('large'):
+        allocate(200)
+    with run.span('small'):
+        allocate(1)
+    with run.span('parent'):
+        with run.span('child'):
+            allocate(100)
+        allocate(1)
+
+    records = spans(run)
+    # a stage that runs after a larger one doesn't report the larger peak
+    assert records['large']['peak_mb'] - records['small']['peak_mb'] > 150
+    assert records['parent/child']['peak_mb'] - records['small']['peak_mb'] > 75
+    # the peak of a nested stage is included in the peak of its parent
+    assert records['parent']['peak_mb'] >= records['parent/child']['peak_mb']
+
+
+@pytest.mark.skipif(not ins.reset_peak_rss(), reason='the peak RSS can only be reset on Linux')
+def test_span_peak_rss():
+    run = ins.RunReport('test')
+
+    assert run.memory_method == 'rss'
+    check_peaks(run)
+
+
+def test_span_peak_tracemalloc():
+    tracemalloc.start()
+    try:
+        run = ins.RunReport('test')
+        run.memory_method = 'tracemalloc'
+        check_peaks(run)
+    finally:
+        tracemalloc.stop()
+
+
+def test_span_no_memory_method():
+    run = ins.RunReport('test')
+    run.memory_method = None
+    with run.span('outer'):
+        with run.span('inner'):
+            allocate(1)
+
+    assert [x['peak_mb'] for x in run.spans] == [None, None]
+    assert run.to_dict()['memory_method'] is None
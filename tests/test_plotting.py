@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+
+"""
+Tests for the plotting tools (dataset_archiving.plotting)
+"""
+
+import os
+import cartopy.crs as ccrs
+import cool_maps.plot as cplt
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+import dataset_archiving.plotting as pf
+
+EXTENT = [-75.2, -72.1, 38.3, 40.6]
+
+
+def test_cached_basemap(tmp_path, monkeypatch):
+    cachedir = str(tmp_path)
+    created = []
+
+    def create(extent, **kwargs):
+        # the map background without the coastlines and bathymetry, which need network access
+        created.append(extent)
+        fig, ax = plt.subplots(figsize=(4, 4), subplot_kw=dict(projection=ccrs.Mercator()))
+        ax.set_extent(extent, crs=ccrs.PlateCarree())
+        return fig, ax
+    monkeypatch.setattr(cplt, 'create', create)
+
+    def basemap():
+        fig, ax = pf.cached_basemap(EXTENT, dpi=50, cachedir=cachedir)
+        plt.close(fig)
+        return ax
+
+    ax = basemap()
+    assert created == [[-75.5, -72.0, 38.0, 41.0]]
+    assert isinstance(ax.projection, ccrs.Mercator)
+    basemap()
+    assert len(created) == 1
+
+    # a cached map that can't be loaded (e.g. pickled with another cartopy version) is rebuilt
+    metafile, = [os.path.join(cachedir, x) for x in os.listdir(cachedir) if x.endswith('.pkl')]
+    with open(metafile, 'wb') as f:
+        f.write(b'not a pickle')
+    ax = basemap()
+    assert len(created) == 2
+    assert isinstance(ax.projection, ccrs.Mercator)
+
+    # the cache is keyed by the cartopy and cool_maps versions
+    monkeypatch.setattr(pf, 'package_version', lambda name: '0.1')
+    basemap()
+    assert len(created) == 3
+    assert len([x for x in os.listdir(cachedir) if x.endswith('.pkl')]) == 2
+
+
+def test_profile_lines():
+    x = np.arange(15, dtype=float)
+    x[4] = np.nan
+    y = np.tile(np.arange(5, dtype=float), 3)
+    bounds = [(0, 5), (5, 10), (10, 15)]
+    colors = np.repeat(plt.cm.rainbow(np.linspace(0, 1, 2)), 2, axis=0)  # an odd number of profiles
+    labels = np.repeat(['0-1', '2-3'], 2)
+
+    fig, ax = plt.subplots()
+    by_label = pf.profile_lines(ax, x, y, bounds, colors, labels)
+    lines, = ax.collections[1:]
+    assert len(lines.get_segments()) == 3
+    assert len(lines.get_segments()[0]) == 4  # NaN data points are left out
+    assert len(ax.collections[0].get_offsets()) == 14
+    assert list(by_label.keys()) == ['0-1', '2-3']
+
+    # every profile needs a color (and a label)
+    with pytest.raises(ValueError, match='colors'):
+        pf.profile_lines(ax, x, y, bounds, colors[0:2], labels)
+    with pytest.raises(ValueError, match='labels'):
+        pf.profile_lines(ax, x, y, bounds, colors, labels[0:2])
+    plt.close(fig)
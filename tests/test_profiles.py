@@ -0,0 +1,40 @@
+#! /usr/bin/env python
+
+"""
+Tests for the per-profile index (dataset_archiving.profiles)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import dataset_archiving.profiles as prof
+
+PROFILE_TIMES = pd.to_datetime(['2024-01-01T00:00', '2024-01-01T01:00', '2024-01-01T02:00',
+                                '2024-01-01T03:00']).values
+
+
+def make_index():
+    # 3 observations per profile
+    return prof.ProfileIndex(np.repeat(PROFILE_TIMES, 3))
+
+
+@pytest.mark.parametrize('t0, t1', [
+    ('2024-01-01T01:00', '2024-01-01T02:00'),
+    ('2024-01-01T01:00Z', '2024-01-01T02:00Z'),
+    (pd.Timestamp('2024-01-01T01:00', tz='UTC'), pd.Timestamp('2024-01-01T02:00', tz='UTC')),
+    # the same times in US/Eastern (UTC-5)
+    (pd.Timestamp('2023-12-31T20:00', tz='US/Eastern'), pd.Timestamp('2023-12-31T21:00', tz='US/Eastern')),
+    ('2023-12-31T20:00-05:00', '2023-12-31T21:00-05:00')
+])
+def test_between(t0, t1):
+    pidx = make_index()
+
+    np.testing.assert_array_equal(np.flatnonzero(pidx.mask(pidx.between(t0, t1))), np.arange(3, 9))
+
+
+def test_first_last():
+    pidx = make_index()
+
+    assert len(pidx) == 4
+    np.testing.assert_array_equal(np.flatnonzero(pidx.mask(pidx.first(2))), np.arange(0, 6))
+    np.testing.assert_array_equal(np.flatnonzero(pidx.mask(pidx.last(1))), np.arange(9, 12))
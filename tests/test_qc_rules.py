@@ -0,0 +1,165 @@
+#! /usr/bin/env python
+
+"""
+Tests for the config-driven QC rules (dataset_archiving.qc_rules), compared with the QC that was hard-coded in
+phglider_to_ncei.py and acoustics_glider_to_archive.py before the rules were moved to configs/qc_rules.yml
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import dataset_archiving.common as cf
+import dataset_archiving.qc_rules as qcr
+
+CONFIGDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'configs')
+PH_VARS = ['pH', 'aragonite_saturation_state', 'total_alkalinity']
+
+
+def make_dataset(ph=True, oxygen=True, n=60):
+    '''
+    Synthetic glider dataset with 6 profiles of 10 observations, QARTOD/hysteresis flags and values to remove
+    '''
+    rng = np.random.default_rng(0)
+    time = pd.date_range('2024-05-01', periods=n, freq='min').values
+    ds = xr.Dataset(coords=dict(time=time))
+    ds['profile_time'] = ('time', np.repeat(time[::10], 10))
+    ds['depth_interpolated'] = ('time', np.tile(np.linspace(0, 20, 10), n // 10))
+    ds['pressure'] = ('time', ds.depth_interpolated.values.copy(), dict(comment='Pressure'))
+    ds['conductivity'] = ('time', rng.uniform(-0.5, 4, n), dict(comment='Conductivity'))
+    for v in ['temperature', 'salinity', 'density']:
+        ds[v] = ('time', rng.uniform(1, 30, n))
+    variables = ['conductivity', 'temperature', 'pressure']
+    if oxygen:
+        ds['oxygen_concentration'] = ('time', rng.uniform(-50, 300, n), dict(comment='Oxygen'))
+        ds['oxygen_saturation'] = ('time', rng.uniform(0, 100, n))
+        variables.append('oxygen_concentration')
+    if ph:
+        for v in PH_VARS:
+            ds[v] = ('time', rng.uniform(7, 8, n), dict(comment=f'{v} calculated'))
+        ds['pH_qartod_gross_range_test'] = ('time', rng.choice([1, 3, 4, 9], n))
+        variables.append('pH')
+    for v in variables:
+        ds[f'{v}_qartod_summary_flag'] = ('time', rng.choice([1, 2, 3, 4, 9], n))
+    for v in ['conductivity', 'temperature']:
+        ds[f'{v}_hysteresis_test'] = ('time', rng.choice([1, 3, 4], n))
+
+    return ds
+
+
+def ph_qc(ds, rfp):
+    '''
+    QC that was hard-coded in phglider_to_ncei.py
+    '''
+    comment = 'Data flagged by QC tests (suspect and fail) were removed.'
+    cf.apply_qartod_qc(ds, add_comment=comment)
+    cf.apply_ctd_hysteresis_qc(ds, add_comment=comment)
+
+    ds['pH'].attrs['comment'] = ' '.join((ds['pH'].comment, comment))
+    qcvars = [x for x in list(ds.data_vars) if 'pH_qartod_' in x]
+    for qv in qcvars:
+        qc_idx = np.where(np.logical_or(ds[qv].values == 3, ds[qv].values == 4))[0]
+        if len(qc_idx) > 0:
+            ds['pH'][qc_idx] = np.nan
+
+    add_comment = 'Values at depths < 1m were removed due to noise typically observed at the surface.'
+    idx = np.where(ds.depth_interpolated < 1)[0]
+    for oav in PH_VARS:
+        ds[oav].values[idx] = np.nan
+        ds[oav].attrs['comment'] = ' '.join((ds[oav].comment, add_comment))
+
+    if np.logical_and(isinstance(rfp, int), rfp > 0):
+        add_comment = f'First {rfp} profiles removed due to bad/suspect data when the sensor was equilibrating.'
+        ptimes = np.unique(ds.profile_time.values)[0:rfp]
+        pidx = np.where(np.isin(ds.profile_time.values, ptimes))[0]
+        for oav in PH_VARS:
+            ds[oav].values[pidx] = np.nan
+            ds[oav].attrs['comment'] = ' '.join((ds[oav].comment, add_comment))
+
+
+def acoustics_qc(ds, rfp):
+    '''
+    QC that was hard-coded in acoustics_glider_to_archive.py
+    '''
+    comment = 'Data flagged by QC tests (suspect and fail) were removed.'
+    cf.apply_qartod_qc(ds, add_comment=comment)
+    cf.apply_ctd_hysteresis_qc(ds, add_comment=comment)
+
+    try:
+        ds['pH'].attrs['comment'] = ' '.join((ds['pH'].comment, comment))
+        qcvars = [x for x in list(ds.data_vars) if 'pH_qartod_' in x]
+        for qv in qcvars:
+            qc_idx = np.where(np.logical_or(ds[qv].values == 3, ds[qv].values == 4))[0]
+            if len(qc_idx) > 0:
+                ds['pH'][qc_idx] = np.nan
+
+        add_comment = 'Values at depths < 1m were removed due to noise typically observed at the surface'
+        idx = np.where(ds.depth_interpolated < 1)[0]
+        for oav in PH_VARS:
+            ds[oav].values[idx] = np.nan
+            ds[oav].attrs['comment'] = ' '.join((ds[oav].comment, add_comment))
+
+        if np.logical_and(isinstance(rfp, int), rfp > 0):
+            add_comment = f'First {rfp} profiles removed due to bad/suspect data when the sensor was equilibrating.'
+            ptimes = np.unique(ds.profile_time.values)[0:rfp]
+            pidx = np.where(np.isin(ds.profile_time.values, ptimes))[0]
+            for oav in PH_VARS:
+                ds[oav].values[pidx] = np.nan
+                ds[oav].attrs['comment'] = ' '.join((ds[oav].comment, add_comment))
+    except KeyError:
+        pass
+
+    idx = np.where(ds.conductivity <= 0)[0]
+    for cv in ['conductivity', 'temperature', 'salinity', 'density']:
+        ds[cv].values[idx] = np.nan
+
+    try:
+        idx = np.where(ds.oxygen_concentration <= 0)[0]
+        for ov in ['oxygen_concentration', 'oxygen_saturation']:
+            ds[ov].values[idx] = np.nan
+    except AttributeError:
+        pass
+
+
+@pytest.mark.parametrize('rfp', [False, 0, 2])
+def test_ph_rules(rfp):
+    expected = make_dataset()
+    ph_qc(expected, rfp)
+    ds = make_dataset()
+    report, counts = qcr.apply_qc_rules(ds, CONFIGDIR, 'pH', params=dict(remove_first_profiles=rfp))
+
+    xr.testing.assert_identical(ds, expected)
+    # the QC comment is added to pH by the QARTOD rule and appended again by the pH QARTOD rule, as it was before
+    comment = 'Data flagged by QC tests (suspect and fail) were removed.'
+    assert ds.pH.comment.count(comment) == 2
+    assert ('first_profiles' in report.rule.values) == bool(rfp)
+    assert counts['pH'] == np.count_nonzero(np.isnan(ds.pH.values))
+    assert np.isnan(ds.total_alkalinity.values[0:10 * rfp]).all()
+
+
+@pytest.mark.parametrize('sensor', ['azfp', 'dmon'])
+@pytest.mark.parametrize('ph, oxygen, rfp', [
+    (True, True, 2),
+    (True, True, False),
+    (False, True, 2),  # the optional pH rules are skipped
+    (True, False, 0),  # the optional oxygen rule is skipped
+])
+def test_acoustics_rules(sensor, ph, oxygen, rfp):
+    expected = make_dataset(ph=ph, oxygen=oxygen)
+    acoustics_qc(expected, rfp)
+    ds = make_dataset(ph=ph, oxygen=oxygen)
+    report, counts = qcr.apply_qc_rules(ds, CONFIGDIR, sensor, params=dict(remove_first_profiles=rfp))
+
+    xr.testing.assert_identical(ds, expected)
+    assert ('surface_noise' in report.rule.values) == ph
+    assert ('oxygen_le_zero' in report.rule.values) == oxygen
+    assert counts['conductivity'] == np.count_nonzero(np.isnan(ds.conductivity.values))
+
+
+def test_required_rule_missing_variable():
+    ds = make_dataset().drop_vars('total_alkalinity')
+    with pytest.raises(KeyError, match='surface_noise'):
+        qcr.apply_qc_rules(ds, CONFIGDIR, 'pH')
+    with pytest.raises(ValueError, match='No QC rules'):
+        qcr.load_qc_rules(CONFIGDIR, 'ctd')
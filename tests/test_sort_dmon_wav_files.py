@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+
+"""
+Tests for sorting a DMON card for the archive (acoustics_glider/sort_dmon_wav_files.py) on a small synthetic card
+"""
+
+import importlib.util
+import os
+import struct
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+import dataset_archiving.dmon as dmon
+import dataset_archiving.staging as stg
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'acoustics_glider',
+                      'sort_dmon_wav_files.py')
+DEPLOYMENT = 'ru40-20240429T1528'
+SAMPLE_RATE = 10
+
+
+def make_recording(filedirectory, n, cue_time, hours=8, audio_format=1, xml_minutes=0):
+    '''
+    Write a d3read .wav/.xml/.dtg file set for a recording that starts at cue_time and lasts hours. The last
+    record in the .xml file is xml_minutes after the end of the recording
+    '''
+    base = os.path.join(filedirectory, f'dmon_{n:03d}')
+    data = np.zeros(int(hours * 3600 * SAMPLE_RATE), dtype='<i2').tobytes()
+    fmt = struct.pack('<HHIIHH', audio_format, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16)
+    with open(f'{base}.wav', 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(data)) + b'WAVE')
+        f.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+        f.write(b'data' + struct.pack('<I', len(data)) + data)
+
+    def xmltime(t):
+        return f'{t.year},{t.month},{t.day},{t.hour},{t.minute},{t.second + t.microsecond / 1e6}'
+    end_time = cue_time + pd.Timedelta(hours=hours, minutes=xml_minutes)
+    with open(f'{base}.xml', 'w') as f:
+        f.write(f'<?xml version="1.0"?><DMON><EVENT TIME="{xmltime(cue_time)}"><SUFFIX>wav</SUFFIX><CUE>0</CUE>'
+                f'</EVENT><EVENT TIME="{xmltime(end_time)}"><SUFFIX>log</SUFFIX></EVENT></DMON>')
+    with open(f'{base}.dtg', 'wb') as f:
+        f.write(b'\0' * 100)
+
+
+def sort_card(filedirectory, monkeypatch, deployment_start, deployment_end, **kwargs):
+    class Response:
+        def json(self):
+            return dict(data=[dict(start_date_epoch=deployment_start.timestamp(),
+                                   end_date_epoch=deployment_end.timestamp())])
+    monkeypatch.setattr(requests, 'get', lambda *args, **kw: Response())
+    monkeypatch.setattr(dmon, 'DEFAULT_SCAN_DIR', os.path.join(filedirectory, 'cache'))
+    monkeypatch.setattr(stg, 'DEFAULT_CHECKSUM_DIR', os.path.join(filedirectory, 'cache'))
+
+    spec = importlib.util.spec_from_file_location('sort_dmon_wav_files', SCRIPT)
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+    script.main(filedirectory, DEPLOYMENT, workers=1, **kwargs)
+
+    summary = pd.read_csv(os.path.join(filedirectory, f'{DEPLOYMENT}_dmon_wav_files_summary.csv'),
+                          keep_default_na=False)
+    with open(os.path.join(filedirectory, f'{DEPLOYMENT}_files_to_archive_sha256.txt')) as f:
+        manifest = sorted(line.split()[-1] for line in f)
+
+    return summary, manifest
+
+
+@pytest.fixture
+def card(tmp_path):
+    # the recordings start 0.6 s after the second, so the rounded start times in the summary are 1 s off
+    t = pd.Timestamp('2024-04-30 12:00:00.6', tz='UTC')
+    make_recording(str(tmp_path), 1, t, audio_format=3)  # IEEE float, split_start
+    for n in range(2, 5):
+        make_recording(str(tmp_path), n, t + pd.Timedelta(hours=8 * (n - 1)))  # in the deployment, split_end
+
+    return str(tmp_path)
+
+
+def test_sort_dmon_wav_files(card, monkeypatch):
+    t0 = pd.Timestamp('2024-04-30 19:00', tz='UTC')
+    t1 = pd.Timestamp('2024-05-01 13:00', tz='UTC')
+    summary, manifest = sort_card(card, monkeypatch, t0, t1)
+
+    assert list(summary.split_file) == ['split_start', '', '', 'split_end']
+    assert 'cue_time' not in summary.columns
+    assert summary.start_time[3] == '2024-05-01 12:00:01+00:00'
+
+    # the recording is cut at the exact CUE time, not at the start time rounded to the nearest second
+    piece = f'{DEPLOYMENT}_004_20240501120000_600000.wav'
+    assert manifest == sorted([f'{DEPLOYMENT}_002_LF_20240430200001.wav', f'{DEPLOYMENT}_002_LF_20240430200001.xml',
+                               f'{DEPLOYMENT}_003_LF_20240501040001.wav', f'{DEPLOYMENT}_003_LF_20240501040001.xml',
+                               piece])
+    assert os.path.getsize(os.path.join(card, 'files_to_archive', piece)) == 44 + 35995 * 2
+
+    # the recording that isn't PCM can't be cut, it's left for Mark's program and the rest of the card is sorted
+    assert os.path.isdir(os.path.join(card, 'split_files'))
+    assert not any(x.startswith(f'{DEPLOYMENT}_001') for x in os.listdir(os.path.join(card, 'files_to_archive')))
+
+
+def test_sort_dmon_wav_files_end_time(tmp_path, monkeypatch):
+    # the last .xml record is 10 minutes after the end of each recording
+    t = pd.Timestamp('2024-05-01 00:00', tz='UTC')
+    for n in range(1, 4):
+        make_recording(str(tmp_path), n, t + pd.Timedelta(hours=8 * (n - 1)), xml_minutes=10)
+    with open(tmp_path / 'dmon_002.wav', 'r+b') as f:
+        f.truncate(24)  # header truncated in the fmt chunk
+    os.remove(tmp_path / 'dmon_003.wav')
+    summary, manifest = sort_card(str(tmp_path), monkeypatch, t, t + pd.Timedelta(days=2))
+
+    # the end time is from the .wav header if it can be read, otherwise from the .xml file
+    assert list(summary.end_time) == ['2024-05-01 08:00:00+00:00', '2024-05-01 16:10:00+00:00',
+                                      '2024-05-02 00:10:00+00:00']
+    assert list(summary.split_file) == ['', '', '']
+    assert f'{DEPLOYMENT}_002_LF_20240501080000.wav' in manifest
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+
+"""
+Tests for staging files for the archive (dataset_archiving.staging)
+"""
+
+import hashlib
+import os
+import dataset_archiving.staging as stg
+
+
+def make_file(fname, data=b'dmon recording'):
+    with open(fname, 'wb') as f:
+        f.write(data)
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_stage_file_same_file(tmp_path):
+    src = str(tmp_path / 'a.wav')
+    sha = make_file(src)
+
+    # staging a file onto itself (or onto a hardlink to it) keeps the file
+    row = stg.stage_file(src, src)
+    assert row['method'] == 'existing'
+    assert row['sha256'] == sha
+    os.link(src, tmp_path / 'b.wav')
+    assert stg.stage_file(src, str(tmp_path / 'b.wav'), checksum=False)['method'] == 'existing'
+    with open(src, 'rb') as f:
+        assert f.read() == b'dmon recording'
+
+
+def test_stage_files_rerun(tmp_path, monkeypatch):
+    cachedir = str(tmp_path / 'cache')
+    src = [str(tmp_path / f'{i}.wav') for i in range(3)]
+    shas = [make_file(f, f'recording {i}'.encode()) for i, f in enumerate(src)]
+    plan = [(f, str(tmp_path / 'archive' / os.path.basename(f))) for f in src]
+
+    # checksums aren't computed for linked files if they're not needed
+    renamed = stg.stage_files(plan, method='hardlink', checksum=False, cachedir=cachedir)
+    assert renamed.sha256.isna().all()
+
+    copied = stg.stage_files(plan, method='copy', cachedir=cachedir)
+    assert list(copied.method) == ['existing'] * 3
+    assert list(copied.sha256) == shas
+
+    # re-runs use the cached checksums instead of reading the files
+    def fail(*args, **kwargs):
+        raise AssertionError('file was read')
+    monkeypatch.setattr(stg, 'file_sha256', fail)
+    monkeypatch.setattr(stg, 'copy_file', fail)
+    rerun = stg.stage_files(plan, method='copy', cachedir=cachedir)
+    assert list(rerun.method) == ['existing'] * 3
+    assert list(rerun.sha256) == shas
+
+
+def test_stage_files_changed_source(tmp_path):
+    cachedir = str(tmp_path / 'cache')
+    src = str(tmp_path / 'a.wav')
+    dst = str(tmp_path / 'archive' / 'a.wav')
+    make_file(src)
+    assert stg.stage_files([(src, dst)], method='copy', cachedir=cachedir).method[0] == 'copy'
+
+    # a source that changed is staged again, and the cached checksum isn't used
+    os.remove(src)
+    sha = make_file(src, b'reprocessed dmon recording')
+    row = stg.stage_files([(src, dst)], method='copy', cachedir=cachedir).iloc[0]
+    assert row.method == 'copy'
+    assert row.sha256 == sha
+    with open(dst, 'rb') as f:
+        assert f.read() == b'reprocessed dmon recording'
@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+
+"""
+Tests for reading and cutting WAV recordings (dataset_archiving.wav)
+"""
+
+import hashlib
+import struct
+import numpy as np
+import pandas as pd
+import pytest
+import dataset_archiving.wav as wav
+
+
+def make_wav(fname, samples, sample_rate=100, audio_format=1):
+    data = samples.astype('<i2').tobytes()
+    fmt = struct.pack('<HHIIHH', audio_format, 1, sample_rate, sample_rate * 2, 2, 16)
+    with open(fname, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(data)) + b'WAVE')
+        f.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+        f.write(b'data' + struct.pack('<I', len(data)) + data)
+
+
+def read_samples(fname):
+    header = wav.read_wav_header(fname)
+    with open(fname, 'rb') as f:
+        f.seek(header['data_offset'])
+        return np.frombuffer(f.read(header['data_size']), dtype='<i2')
+
+
+@pytest.mark.parametrize('max_riff_size', [wav.MAX_RIFF_SIZE, 100])
+def test_split_wav(tmp_path, monkeypatch, max_riff_size):
+    monkeypatch.setattr(wav, 'MAX_RIFF_SIZE', max_riff_size)  # small pieces are written as RF64 files
+    fname = str(tmp_path / 'dmon001.wav')
+    samples = np.arange(1000, dtype='int16')
+    make_wav(fname, samples)
+    t = pd.Timestamp('2024-05-01 00:00:00', tz='UTC')
+
+    piece = wav.split_wav(fname, t, t + pd.Timedelta(seconds=2.5), None, str(tmp_path), prefix='ru40_001')
+    assert piece['destination'] == str(tmp_path / 'ru40_001_20240501000002_500000.wav')
+    assert piece['start_time'] == t + pd.Timedelta(seconds=2.5)
+    with open(piece['destination'], 'rb') as f:
+        data = f.read()
+    assert data[0:4] == (b'RF64' if max_riff_size == 100 else b'RIFF')
+    assert piece['bytes'] == len(data)
+    assert piece['sha256'] == hashlib.sha256(data).hexdigest()
+
+    header = wav.read_wav_header(piece['destination'])
+    assert header['frames'] == 750
+    assert header['data_size'] == 1500
+    np.testing.assert_array_equal(read_samples(piece['destination']), samples[250:])
+
+
+def test_split_wav_format(tmp_path):
+    fname = str(tmp_path / 'dmon001.wav')
+    make_wav(fname, np.arange(1000, dtype='int16'), audio_format=3)  # IEEE float
+    t = pd.Timestamp('2024-05-01 00:00:00', tz='UTC')
+
+    assert wav.read_wav_header(fname)['duration_s'] == 10
+    with pytest.raises(ValueError, match='audio format'):
+        wav.split_wav(fname, t, t + pd.Timedelta(seconds=2.5), None, str(tmp_path))
+
+
+def test_scan_wav_headers(tmp_path):
+    files = [str(tmp_path / f'dmon00{i}.wav') for i in range(5)]
+    make_wav(files[0], np.arange(1000, dtype='int16'))
+    with open(files[0], 'rb') as f:
+        header = f.read(44)
+    with open(files[1], 'wb') as f:
+        f.write(header[0:8])  # truncated before the WAVE id
+    with open(files[2], 'wb') as f:
+        f.write(header[0:24])  # truncated in the fmt chunk
+    with open(files[3], 'wb') as f:
+        f.write(b'OggS' + header[4:])  # not a RIFF file
+    # files[4] is missing
+
+    df = wav.scan_wav_headers(files, max_workers=2)
+    assert list(df.filename) == [f'dmon00{i}.wav' for i in range(5)]
+    assert df.duration_s[0] == 10
+    assert df.frames[0] == 1000
+    assert df.loc[1:, wav.WAV_HEADER_COLS].isna().all().all()